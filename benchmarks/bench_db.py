@@ -0,0 +1,158 @@
+# benchmarks/bench_db.py
+"""Compara conexões abertas por requisição (journal padrão) com o pool em WAL sob concorrência.
+
+Leitores repetem a consulta da primeira página do /videos enquanto escritores cadastram
+vídeos com variantes, como uploads simultâneos.
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.bench_db --rows 5000 --readers 8 --writers 2 --seconds 5
+"""
+import os
+import uuid
+import time
+import sqlite3
+import argparse
+import tempfile
+import threading
+from datetime import datetime, timedelta
+import database
+
+PAGE_SQL = 'SELECT * FROM videos ORDER BY created_at DESC, id DESC LIMIT 50'
+VARIANTS_SQL = 'SELECT video_id, filter, path_processed FROM video_variants WHERE video_id IN ({}) ORDER BY id'
+
+def fake_video(created_at):
+    video_id = str(uuid.uuid4())
+    video = {
+        "id": video_id, "original_name": f"video_{video_id[:8]}", "original_ext": ".mp4", "mime_type": "video/mp4",
+        "size_bytes": 10_000_000, "duration_sec": 12.5, "fps": 30.0, "width": 1280, "height": 720,
+        "filter": "sepia", "created_at": created_at.isoformat(), "path_original": f"2025/01/01/{video_id}/original/video.mp4",
+        "path_processed": f"2025/01/01/{video_id}/processed/sepia/video.mp4",
+        "path_thumbnail": f"2025/01/01/{video_id}/thumbs/frame_0001.jpg", "content_hash": uuid.uuid4().hex,
+        "path_hls": None,
+    }
+    variants = [{"video_id": video_id, "filter": name, "path_processed": f"2025/01/01/{video_id}/processed/{name}/video.mp4",
+                 "created_at": video['created_at'], "filter_params": "{}"}
+                for name in ('sepia', 'invert')]
+    return video, variants
+
+def prepare(db_file, rows):
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_file + suffix):
+            os.remove(db_file + suffix)
+    conn = database.connect(db_file)
+    database.migrate(conn)
+    start = datetime(2025, 1, 1)
+    with conn:
+        for i in range(rows):
+            video, variants = fake_video(start + timedelta(seconds=i))
+            database.insert_rows(conn, 'videos', [video])
+            database.insert_rows(conn, 'video_variants', variants)
+    conn.close()
+
+# --- Modos de acesso ---
+
+class PerRequest:
+    """Como as rotas faziam antes: sqlite3.connect a cada requisição, journal DELETE."""
+
+    def __init__(self, db_file):
+        self.db_file = db_file
+        conn = sqlite3.connect(db_file)
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.close()
+
+    def read(self):
+        conn = sqlite3.connect(self.db_file)
+        conn.row_factory = sqlite3.Row
+        _read_page(conn)
+        conn.close()
+
+    def write(self, video, variants):
+        conn = sqlite3.connect(self.db_file)
+        database.insert_rows(conn, 'videos', [video])
+        database.insert_rows(conn, 'video_variants', variants)
+        conn.commit()
+        conn.close()
+
+class Pooled:
+    """Pool de conexões em WAL do database.py."""
+
+    def __init__(self, db_file):
+        self.pool = database.ConnectionPool(db_file)
+
+    def read(self):
+        with self.pool.connection() as conn:
+            _read_page(conn)
+
+    def write(self, video, variants):
+        with self.pool.connection() as conn, conn:
+            database.insert_rows(conn, 'videos', [video])
+            database.insert_rows(conn, 'video_variants', variants)
+
+def _read_page(conn):
+    rows = conn.execute(PAGE_SQL).fetchall()
+    ids = [row['id'] for row in rows]
+    conn.execute(VARIANTS_SQL.format(','.join('?' * len(ids))), ids).fetchall()
+
+def run(mode, readers, writers, seconds):
+    """Roda leitores e escritores por `seconds` e retorna as latências e erros de cada lado."""
+    stop = threading.Event()
+    results = {"read": [], "write": [], "errors": 0}
+    lock = threading.Lock()
+
+    def loop(kind):
+        latencies, errors = [], 0
+        created_at = datetime(2030, 1, 1)
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                if kind == 'read':
+                    mode.read()
+                else:
+                    created_at += timedelta(microseconds=1)
+                    mode.write(*fake_video(created_at))
+                latencies.append(time.perf_counter() - start)
+            except sqlite3.OperationalError:
+                errors += 1
+        with lock:
+            results[kind] += latencies
+            results['errors'] += errors
+
+    threads = [threading.Thread(target=loop, args=('read',)) for _ in range(readers)]
+    threads += [threading.Thread(target=loop, args=('write',)) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return results
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'sdt3-bench'))
+    args = parser.parse_args()
+    os.makedirs(args.workdir, exist_ok=True)
+
+    print(f"{args.rows} vídeos, {args.readers} leitores, {args.writers} escritores, {args.seconds}s por modo")
+    print(f"{'modo':>12} {'leituras/s':>11} {'p50 ms':>8} {'p95 ms':>8} {'escritas/s':>11} {'p95 ms':>8} {'erros':>6}")
+    for name, mode_class in (('por-request', PerRequest), ('pool+WAL', Pooled)):
+        db_file = os.path.join(args.workdir, f"bench_{name.replace('+', '_')}.db")
+        prepare(db_file, args.rows)
+        results = run(mode_class(db_file), args.readers, args.writers, args.seconds)
+        reads, writes = results['read'], results['write']
+        print(f"{name:>12} {len(reads) / args.seconds:>11.1f} {percentile(reads, 0.5) * 1000:>8.2f} "
+              f"{percentile(reads, 0.95) * 1000:>8.2f} {len(writes) / args.seconds:>11.1f} "
+              f"{percentile(writes, 0.95) * 1000:>8.2f} {results['errors']:>6}")
+
+if __name__ == '__main__':
+    main()
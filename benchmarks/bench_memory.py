@@ -0,0 +1,66 @@
+# benchmarks/bench_memory.py
+"""Compara o laço de frames alocando arrays a cada frame com o laço de buffers reaproveitados.
+
+Cada medição roda em um processo novo, para que o pico de memória (RSS) de uma não
+contamine a outra. Mostra o pico de RSS, os arrays de frame alocados por frame (leitura,
+saídas e intermediários dos filtros), as page faults por frame e os frames/s.
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.bench_memory --frames 240 --resolution 1080p --threads 0 2
+"""
+import os
+import time
+import argparse
+import resource
+import tempfile
+import multiprocessing
+from filters import FILTERS
+from processing import apply_filter_to_video
+from pipeline import new_stage_stats
+from benchmarks.common import RESOLUTIONS, make_synthetic_video
+
+MODES = (('alocando', False), ('buffers', True))
+
+def measure(source, output, name, threads, reuse_buffers):
+    """Renderiza `source` com o filtro `name` e retorna as medições deste processo."""
+    stats = new_stage_stats()
+    faults = resource.getrusage(resource.RUSAGE_SELF).ru_minflt
+    start = time.perf_counter()
+    frames = apply_filter_to_video(source, output, FILTERS[name], threads=threads, stats=stats,
+                                   reuse_buffers=reuse_buffers)
+    seconds = time.perf_counter() - start
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return {"frames": frames, "fps": frames / seconds, "peak_rss_mb": usage.ru_maxrss / 1024,
+            "allocations_per_frame": stats['allocations'] / frames,
+            "faults_per_frame": (usage.ru_minflt - faults) / frames}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--frames', type=int, default=240)
+    parser.add_argument('--resolution', choices=RESOLUTIONS, default='1080p')
+    parser.add_argument('--filters', nargs='+', choices=FILTERS, default=list(FILTERS))
+    parser.add_argument('--threads', type=int, nargs='+', default=[0, 2], help="0 = laço serial")
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'sdt3-bench'))
+    args = parser.parse_args()
+
+    width, height = RESOLUTIONS[args.resolution]
+    source = make_synthetic_video(os.path.join(args.workdir, f"source_{args.resolution}_{args.frames}.mp4"),
+                                  width, height, args.frames)
+    output = os.path.join(args.workdir, "memory_out.mp4")
+
+    print(f"{args.frames} frames {args.resolution}")
+    print(f"{'filtro':>10} {'threads':>7} {'modo':>9} {'pico RSS MiB':>12} {'arrays/frame':>12} "
+          f"{'faults/frame':>12} {'fps':>7}")
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        for name in args.filters:
+            for threads in args.threads:
+                for mode, reuse_buffers in MODES:
+                    result = pool.apply(measure, (source, output, name, threads, reuse_buffers))
+                    print(f"{name:>10} {threads:>7} {mode:>9} {result['peak_rss_mb']:>12.1f} "
+                          f"{result['allocations_per_frame']:>12.2f} {result['faults_per_frame']:>12.1f} "
+                          f"{result['fps']:>7.1f}")
+    os.remove(output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+# benchmarks/bench_pipeline.py
+"""Compara o laço serial com o pipeline de threads e mostra o gargalo de cada filtro.
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.bench_pipeline --frames 480 --resolution 1080p --threads 2 --in-flight 16
+"""
+import os
+import argparse
+import tempfile
+from filters import FILTERS
+from processing import apply_filter_to_video
+from pipeline import STAGES, new_stage_stats, bottleneck
+from benchmarks.common import RESOLUTIONS, make_synthetic_video, timed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--frames', type=int, default=480)
+    parser.add_argument('--resolution', choices=RESOLUTIONS, default='1080p')
+    parser.add_argument('--filters', nargs='+', choices=FILTERS, default=list(FILTERS))
+    parser.add_argument('--threads', type=int, default=2)
+    parser.add_argument('--in-flight', type=int, default=16)
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'sdt3-bench'))
+    args = parser.parse_args()
+
+    width, height = RESOLUTIONS[args.resolution]
+    source = make_synthetic_video(os.path.join(args.workdir, f"source_{args.resolution}_{args.frames}.mp4"),
+                                  width, height, args.frames)
+    output = os.path.join(args.workdir, "pipeline_out.mp4")
+
+    header = f"{'filtro':>10} {'modo':>9} {'fps':>7}" + "".join(f" {stage + ' busy/idle':>20}" for stage in STAGES)
+    print(f"{args.frames} frames {args.resolution}, {args.threads} threads de filtro, {args.in_flight} frames em voo")
+    print(header + "  gargalo")
+    for name in args.filters:
+        for mode, threads in (('serial', 0), ('pipeline', args.threads)):
+            stats = new_stage_stats()
+            frames, seconds = timed(apply_filter_to_video, source, output, FILTERS[name],
+                                    threads=threads, max_in_flight=args.in_flight, stats=stats)
+            cells = "".join(f" {stats[stage]['busy_sec']:>9.2f}/{stats[stage]['idle_sec']:<9.2f}" for stage in STAGES)
+            print(f"{name:>10} {mode:>9} {frames / seconds:>7.1f}{cells}  {bottleneck(stats)}")
+    os.remove(output)
+
+if __name__ == '__main__':
+    main()
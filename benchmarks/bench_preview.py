@@ -0,0 +1,79 @@
+# benchmarks/bench_preview.py
+"""Compara o tempo da prévia de baixa resolução com o da renderização completa do mesmo vídeo.
+
+Para cada filtro, renderiza o vídeo inteiro (apply_filter_to_video) com os mesmos segmentos,
+threads e frames em memória do payload do worker (veja server._job_payload). Depois, para
+cada passo de frames pedido, roda process_video com a prévia, como o worker: "prévia" é o
+momento em que ela fica pronta e "completa+prévia" o tempo total. A coluna "fração" é o
+tempo de cada linha dividido pelo da renderização completa sozinha. Termina com erro se a
+prévia levar mais que MAX_PREVIEW_FRACTION do tempo total do job.
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.bench_preview --frames 480 --resolution 1080p --steps 1 2 4
+"""
+import os
+import argparse
+import shutil
+import tempfile
+import time
+from filters import FILTERS
+from processing import PREVIEW_HEIGHT, apply_filter_to_video, process_video, probe_video
+from server import SEGMENT_WORKERS, PIPELINE_THREADS, PIPELINE_MAX_FRAMES_IN_FLIGHT
+from benchmarks.common import RESOLUTIONS, make_synthetic_video, timed
+
+# Fração máxima do tempo total do job até a prévia aparecer.
+MAX_PREVIEW_FRACTION = 0.5
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--frames', type=int, default=480)
+    parser.add_argument('--resolution', choices=RESOLUTIONS, default='1080p')
+    parser.add_argument('--filters', nargs='+', choices=FILTERS, default=['sepia', 'canny'])
+    parser.add_argument('--height', type=int, default=PREVIEW_HEIGHT, help="altura da prévia")
+    parser.add_argument('--steps', type=int, nargs='+', default=[1, 2, 4], help="um frame a cada N na prévia")
+    parser.add_argument('--segments', type=int, default=SEGMENT_WORKERS, help="segmentos da renderização completa")
+    parser.add_argument('--threads', type=int, default=PIPELINE_THREADS, help="threads de filtro da renderização completa")
+    parser.add_argument('--in-flight', type=int, default=PIPELINE_MAX_FRAMES_IN_FLIGHT)
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'sdt3-bench'))
+    args = parser.parse_args()
+
+    width, height = RESOLUTIONS[args.resolution]
+    source = make_synthetic_video(os.path.join(args.workdir, f"source_{args.resolution}_{args.frames}.mp4"),
+                                  width, height, args.frames)
+    output = os.path.join(args.workdir, "preview_full.mp4")
+    preview = os.path.join(args.workdir, "preview_out.mp4")
+    thumbs_dir = os.path.join(args.workdir, "preview_thumbs")
+    render = {"segments": args.segments, "threads": args.threads, "max_in_flight": args.in_flight}
+    slow = []
+
+    print(f"{args.frames} frames {args.resolution}, prévia em {args.height}p, "
+          f"{args.segments} segmentos, {args.threads} threads")
+    print(f"{'filtro':>10} {'saída':>16} {'segundos':>10} {'fps':>8} {'frames':>8} {'fração':>8}")
+    for name in args.filters:
+        frames, full_seconds = timed(apply_filter_to_video, source, output, FILTERS[name], **render)
+        print(f"{name:>10} {'completa':>16} {full_seconds:>10.2f} {frames / full_seconds:>8.1f} {frames:>8} {1:>8.2f}")
+        for step in args.steps:
+            payload = dict(render, original_path=source, thumbs_dir=thumbs_dir,
+                           variants=[{"filter": name, "processed_path": output}],
+                           preview={"path": preview, "height": args.height, "frame_step": step, "min_frames": 0})
+            ready = []
+            start = time.perf_counter()
+            _, seconds = timed(process_video, payload,
+                               preview_callback=lambda media: ready.append(time.perf_counter() - start))
+            label = f"{probe_video(preview)['height']}p/{step}" if ready else f"-/{step}"
+            if ready:
+                print(f"{name:>10} {'prévia ' + label:>16} {ready[0]:>10.2f} {frames / ready[0]:>8.1f} {frames:>8} "
+                      f"{ready[0] / full_seconds:>8.2f}")
+            print(f"{name:>10} {'completa+prévia':>16} {seconds:>10.2f} {frames / seconds:>8.1f} {frames:>8} "
+                  f"{seconds / full_seconds:>8.2f}")
+            if not ready or ready[0] / seconds > MAX_PREVIEW_FRACTION:
+                slow.append(f"{name} passo {step}")
+    os.remove(output)
+    if os.path.exists(preview):
+        os.remove(preview)
+    shutil.rmtree(thumbs_dir, ignore_errors=True)
+    if slow:
+        raise SystemExit(f"Prévia ausente ou acima de {MAX_PREVIEW_FRACTION:.0%} do tempo total: {', '.join(slow)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+# benchmarks/bench_segments.py
+"""Mede como o tempo de apply_filter_to_video escala com o número de segmentos paralelos.
+
+Os segmentos exigem o ffmpeg (veja processing.render_variants); sem ele todas as linhas
+medem a renderização serial.
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.bench_segments --frames 1440 --resolution 720p --workers 1 2 4 8
+"""
+import os
+import argparse
+import tempfile
+from filters import FILTERS
+from processing import apply_filter_to_video, probe_video
+from packaging import ffmpeg_available
+from benchmarks.common import RESOLUTIONS, make_synthetic_video, timed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--frames', type=int, default=1440)
+    parser.add_argument('--resolution', choices=RESOLUTIONS, default='720p')
+    parser.add_argument('--filter', choices=FILTERS, default='sepia')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'sdt3-bench'))
+    args = parser.parse_args()
+
+    width, height = RESOLUTIONS[args.resolution]
+    source = make_synthetic_video(os.path.join(args.workdir, f"source_{args.resolution}_{args.frames}.mp4"),
+                                  width, height, args.frames)
+
+    print(f"{args.frames} frames {args.resolution}, filtro {args.filter}, {os.cpu_count()} núcleos")
+    if not ffmpeg_available():
+        print("ffmpeg não encontrado: os segmentos são ignorados e todas as linhas são seriais.")
+    print(f"{'workers':>8} {'segundos':>10} {'fps':>8} {'speedup':>8} {'frames':>8}")
+    baseline = None
+    for workers in sorted(set(args.workers)):
+        output = os.path.join(args.workdir, f"out_{workers}.mp4")
+        frames, seconds = timed(apply_filter_to_video, source, output, FILTERS[args.filter], segments=workers)
+        baseline = baseline or seconds
+        written = probe_video(output)['frame_count']
+        print(f"{workers:>8} {seconds:>10.2f} {frames / seconds:>8.1f} {baseline / seconds:>7.2f}x {written:>8}")
+        os.remove(output)
+
+if __name__ == '__main__':
+    main()
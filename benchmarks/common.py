@@ -0,0 +1,52 @@
+# benchmarks/common.py
+import os
+import time
+import cv2
+import numpy as np
+
+RESOLUTIONS = {
+    '360p': (640, 360),
+    '720p': (1280, 720),
+    '1080p': (1920, 1080),
+}
+
+def make_synthetic_video(path, width=1280, height=720, frames=240, fps=24, seed=0):
+    """Gera um vídeo sintético reprodutível (gradiente em movimento, formas e ruído).
+
+    O conteúdo muda a cada frame para que o encoder trabalhe como em um vídeo real.
+    Se o arquivo já existir, ele é reaproveitado.
+    """
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    rng = np.random.default_rng(seed)
+    out = None
+    for codec in ('avc1', 'mp4v'):
+        out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*codec), fps, (width, height))
+        if out.isOpened():
+            break
+    if out is None or not out.isOpened():
+        raise RuntimeError(f"Não foi possível gerar {path}")
+
+    xs = np.linspace(0, 255, width, dtype=np.float32)
+    ys = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    for i in range(frames):
+        frame = np.empty((height, width, 3), dtype=np.uint8)
+        frame[..., 0] = (xs + i * 3) % 256
+        frame[..., 1] = (ys + i * 2) % 256
+        frame[..., 2] = ((xs + ys) / 2 + i) % 256
+        cx = int((i * 7) % width)
+        cy = int(height / 2 + np.sin(i / 10) * height / 4)
+        cv2.circle(frame, (cx, cy), max(height // 8, 4), (255, 255, 255), -1)
+        cv2.rectangle(frame, (width - cx, height // 4), (width - cx + width // 10, height // 2), (0, 0, 0), -1)
+        noise = rng.integers(0, 16, size=(height // 4, width // 4, 1), dtype=np.uint8)
+        frame[: height // 4, : width // 4] = cv2.add(frame[: height // 4, : width // 4], noise.repeat(3, axis=2))
+        out.write(frame)
+    out.release()
+    return path
+
+def timed(func, *args, **kwargs):
+    """Executa func e retorna (resultado, segundos)."""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
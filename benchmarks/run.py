@@ -0,0 +1,359 @@
+# benchmarks/run.py
+"""Suíte de benchmarks reprodutível: filtros, processamento, upload e listagem, com saída JSON.
+
+Tudo roda localmente a partir de vídeos sintéticos e bancos gerados em --workdir (reaproveitados
+entre execuções). Suítes:
+    filters  frames/s de cada função de FILTERS, frame a frame, por resolução
+    render   frames/s de apply_filter_to_video por resolução e duração
+    upload   latência e vazão do /upload até o fim do job, pelo test client e workers locais, por concorrência
+    listing  latência do /videos e do /gui com bancos de 10 mil a 1 milhão de vídeos, com a
+             resposta em cache (p50/p95) e montada do zero (miss_p50/miss_p95)
+
+Cada métrica fica em results[<caso>][<métrica>]; métricas terminadas em `_ms` são melhores
+quanto menores, as demais quanto maiores. Com --compare, o resultado é comparado a um
+baseline salvo e o script sai com código 1 se alguma métrica piorar mais que --threshold.
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.run --output benchmarks/baseline.json
+    python -m benchmarks.run --suites filters render --compare benchmarks/baseline.json
+    python -m benchmarks.run --input nova.json --compare benchmarks/baseline.json
+"""
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import argparse
+import platform
+import tempfile
+import threading
+from datetime import datetime, timedelta
+import cv2
+import database
+from jobs import get_job
+from worker import start_workers
+from filters import FILTERS
+from processing import apply_filter_to_video
+from benchmarks.common import RESOLUTIONS, make_synthetic_video, timed
+from benchmarks.bench_db import fake_video, percentile
+
+SUITES = ('filters', 'render', 'upload', 'listing')
+# Tempo mínimo medido por filtro; chamadas se repetem até atingi-lo.
+FILTER_MIN_SEC = 0.5
+FILTER_SAMPLE_FRAMES = 30
+# Vídeos gravados por transação ao popular os bancos da suíte listing.
+SEED_BATCH = 10000
+LISTING_REQUESTS = 50
+JOB_POLL_SEC = 0.02
+
+# --- Suítes ---
+
+def bench_filters(args):
+    results = {}
+    for resolution in args.resolutions:
+        width, height = RESOLUTIONS[resolution]
+        source = make_synthetic_video(os.path.join(args.workdir, f"source_{resolution}_{FILTER_SAMPLE_FRAMES}.mp4"),
+                                      width, height, FILTER_SAMPLE_FRAMES)
+        frames = _read_frames(source)
+        for name, func in FILTERS.items():
+            calls, start = 0, time.perf_counter()
+            while time.perf_counter() - start < FILTER_MIN_SEC:
+                for frame in frames:
+                    func(frame)
+                calls += len(frames)
+            results[f"filter/{name}/{resolution}"] = {"fps": calls / (time.perf_counter() - start)}
+    return results
+
+def bench_render(args):
+    results = {}
+    output = os.path.join(args.workdir, "run_render_out.mp4")
+    for resolution in args.resolutions:
+        width, height = RESOLUTIONS[resolution]
+        for length in args.lengths:
+            source = make_synthetic_video(os.path.join(args.workdir, f"source_{resolution}_{length}.mp4"),
+                                          width, height, length)
+            for name in args.render_filters:
+                frames, seconds = timed(apply_filter_to_video, source, output, FILTERS[name])
+                results[f"render/{name}/{resolution}/{length}"] = {"fps": frames / seconds, "seconds_ms": seconds * 1000}
+    if os.path.exists(output):
+        os.remove(output)
+    return results
+
+def bench_upload(args):
+    import server
+    width, height = RESOLUTIONS[args.upload_resolution]
+    source = make_synthetic_video(os.path.join(args.workdir, f"source_{args.upload_resolution}_{args.upload_frames}.mp4"),
+                                  width, height, args.upload_frames)
+    with open(source, 'rb') as f:
+        payload = f.read()
+    media_root = os.path.join(args.workdir, "run_media")
+    db_file = os.path.join(args.workdir, "run_upload.db")
+    shutil.rmtree(media_root, ignore_errors=True)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_file + suffix):
+            os.remove(db_file + suffix)
+    _use_fresh_server(server, db_file, media_root)
+
+    results = {}
+    counter = iter(range(sys.maxsize))
+
+    def upload(client):
+        """Envia um vídeo e espera o job; retorna (segundos até a resposta, segundos até o fim)."""
+        # Bytes extras no fim mudam o hash: cada upload é processado, sem acerto de cache.
+        data = payload + next(counter).to_bytes(8, 'little')
+        start = time.perf_counter()
+        response = client.post('/upload', data={'filter': args.upload_filter, 'video': (io.BytesIO(data), 'bench.mp4')})
+        requested = time.perf_counter()
+        if response.status_code == 202:
+            error = _wait_job(db_file, response.json['job_id'])
+        else:
+            error = response.json.get('error') if response.status_code != 200 else None
+        if error:
+            raise RuntimeError(f"Upload com erro no benchmark: {error}")
+        return requested - start, time.perf_counter() - start
+
+    workers = start_workers(server.PROCESSING_WORKERS, db_file, media_root, poll_sec=JOB_POLL_SEC)
+    try:
+        # Aquecimento fora da medição: espera os workers subirem.
+        upload(server.app.test_client())
+        for concurrency in args.concurrency:
+            results.update(_bench_upload_round(args, server, upload, concurrency))
+    finally:
+        for process in workers:
+            process.terminate()
+        for process in workers:
+            process.join()
+    shutil.rmtree(media_root, ignore_errors=True)
+    return results
+
+def _bench_upload_round(args, server, upload, concurrency):
+    """Uma rodada de `concurrency` clientes enviando uploads_per_worker vídeos cada."""
+    uploads = concurrency * args.uploads_per_worker
+    request_times, total_times, errors = [], [], []
+    lock = threading.Lock()
+
+    def worker():
+        client = server.app.test_client()
+        for _ in range(args.uploads_per_worker):
+            try:
+                request_sec, total_sec = upload(client)
+            except RuntimeError as e:
+                errors.append(e)
+                return
+            with lock:
+                request_times.append(request_sec)
+                total_times.append(total_sec)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    if errors:
+        raise errors[0]
+    return {f"upload/{args.upload_resolution}/c{concurrency}": {
+        "uploads_per_sec": uploads / wall,
+        "frames_per_sec": uploads * args.upload_frames / wall,
+        "request_p50_ms": percentile(request_times, 0.5) * 1000,
+        "request_p95_ms": percentile(request_times, 0.95) * 1000,
+        "total_p50_ms": percentile(total_times, 0.5) * 1000,
+        "total_p95_ms": percentile(total_times, 0.95) * 1000,
+    }}
+
+def bench_listing(args):
+    import server
+    results = {}
+    for rows in args.rows:
+        db_file = seed_database(os.path.join(args.workdir, f"run_listing_{rows}.db"), rows)
+        _use_fresh_server(server, db_file, os.path.join(args.workdir, "run_media"))
+        client = server.app.test_client()
+        # Cursor do meio da lista: mede uma página "profunda", que com OFFSET seria a mais cara.
+        conn = database.connect(db_file)
+        middle = conn.execute('SELECT created_at, id FROM videos ORDER BY created_at DESC, id DESC LIMIT 1 OFFSET ?',
+                              (rows // 2,)).fetchone()
+        conn.close()
+        urls = {
+            "videos": "/videos",
+            "videos_deep": f"/videos?cursor={server.encode_cursor(middle)}",
+            "videos_filter": "/videos?filter=invert",
+            "videos_fields": "/videos?fields=id,original_name,created_at",
+            "gui": "/gui",
+        }
+        for name, url in urls.items():
+            client.get(url)
+            # Acertos medem o cache de respostas; as falhas (cache limpo antes de cada
+            # requisição) medem a consulta ao banco e a serialização, como numa geração nova.
+            hits = _time_requests(client, url)
+            misses = _time_requests(client, url, before=server.response_cache.clear)
+            results[f"listing/{name}/{rows}"] = {"p50_ms": percentile(hits, 0.5) * 1000,
+                                                 "p95_ms": percentile(hits, 0.95) * 1000,
+                                                 "miss_p50_ms": percentile(misses, 0.5) * 1000,
+                                                 "miss_p95_ms": percentile(misses, 0.95) * 1000}
+    return results
+
+def _time_requests(client, url, before=None):
+    """Latências de LISTING_REQUESTS requisições a `url`; `before` roda fora da medição."""
+    latencies = []
+    for _ in range(LISTING_REQUESTS):
+        if before is not None:
+            before()
+        start = time.perf_counter()
+        response = client.get(url)
+        latencies.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            raise RuntimeError(f"{url} respondeu {response.status_code}")
+    return latencies
+
+# --- Auxiliares ---
+
+def _read_frames(path):
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+def _use_fresh_server(server, db_file, media_root):
+    """Aponta o servidor para um banco e uma pasta de mídia do benchmark."""
+    os.makedirs(os.path.join(media_root, "incoming"), exist_ok=True)
+    server.DB_FILE = database.DB_FILE = db_file
+    server.app.config['MEDIA_ROOT'] = media_root
+    server.app.config['UPLOAD_FOLDER'] = os.path.join(media_root, "incoming")
+    database.init_db(db_file)
+
+def _wait_job(db_file, job_id):
+    """Espera o job terminar; retorna a mensagem de erro ou None."""
+    conn = database.connect(db_file)
+    try:
+        while True:
+            job = get_job(conn, job_id)
+            if job['state'] in ('done', 'failed'):
+                return job['error']
+            time.sleep(JOB_POLL_SEC)
+    finally:
+        conn.close()
+
+def seed_database(db_file, rows):
+    """Cria (ou reaproveita, se já tiver `rows` vídeos) um banco com vídeos sintéticos."""
+    if os.path.exists(db_file):
+        conn = database.connect(db_file)
+        try:
+            if conn.execute('SELECT COUNT(*) FROM videos').fetchone()[0] == rows:
+                return db_file
+        except sqlite3.Error:
+            pass
+        finally:
+            conn.close()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_file + suffix):
+            os.remove(db_file + suffix)
+
+    conn = database.connect(db_file)
+    database.migrate(conn)
+    start = datetime(2020, 1, 1)
+    for offset in range(0, rows, SEED_BATCH):
+        videos, variants = [], []
+        for i in range(offset, min(offset + SEED_BATCH, rows)):
+            video, video_variants = fake_video(start + timedelta(seconds=i))
+            videos.append(video)
+            variants += video_variants
+        with conn:
+            database.insert_rows(conn, 'videos', videos)
+            database.insert_rows(conn, 'video_variants', variants)
+    conn.execute('ANALYZE')
+    conn.close()
+    return db_file
+
+# --- Resultados ---
+
+def environment():
+    return {"timestamp": datetime.now().isoformat(timespec='seconds'), "python": platform.python_version(),
+            "opencv": cv2.__version__, "platform": platform.platform(), "cpu_count": os.cpu_count()}
+
+def lower_is_better(metric):
+    return metric.endswith('_ms')
+
+def compare(current, baseline, threshold):
+    """Lista as métricas presentes nos dois resultados que pioraram mais que `threshold` (fração)."""
+    rows = []
+    for case, metrics in sorted(current['results'].items()):
+        for metric, value in sorted(metrics.items()):
+            previous = baseline['results'].get(case, {}).get(metric)
+            if not previous:
+                continue
+            change = (value - previous) / previous
+            worse = change if lower_is_better(metric) else -change
+            rows.append({"case": case, "metric": metric, "baseline": previous, "current": value,
+                         "change": change, "regression": worse > threshold})
+    return rows
+
+def print_results(results):
+    for case, metrics in sorted(results.items()):
+        cells = "  ".join(f"{metric}={value:.2f}" for metric, value in sorted(metrics.items()))
+        print(f"{case:<40} {cells}")
+
+def print_comparison(rows, threshold):
+    print(f"\n{'caso':<40} {'métrica':<16} {'baseline':>10} {'atual':>10} {'variação':>9}")
+    for row in rows:
+        flag = "  REGRESSÃO" if row['regression'] else ""
+        print(f"{row['case']:<40} {row['metric']:<16} {row['baseline']:>10.2f} {row['current']:>10.2f} "
+              f"{row['change'] * 100:>+8.1f}%{flag}")
+    regressions = sum(row['regression'] for row in rows)
+    print(f"\n{regressions} regressão(ões) acima de {threshold * 100:.0f}% em {len(rows)} métricas comparadas.")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--suites', nargs='+', choices=SUITES, default=list(SUITES))
+    parser.add_argument('--resolutions', nargs='+', choices=RESOLUTIONS, default=list(RESOLUTIONS))
+    parser.add_argument('--lengths', type=int, nargs='+', default=[120, 480], help="frames por vídeo na suíte render")
+    parser.add_argument('--render-filters', nargs='+', choices=FILTERS, default=['sepia'])
+    parser.add_argument('--upload-resolution', choices=RESOLUTIONS, default='360p')
+    parser.add_argument('--upload-frames', type=int, default=120)
+    parser.add_argument('--upload-filter', choices=FILTERS, default='sepia')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--uploads-per-worker', type=int, default=2)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'sdt3-bench'))
+    parser.add_argument('--output', help="arquivo JSON onde gravar o resultado")
+    parser.add_argument('--input', help="compara um resultado já gravado em vez de rodar a suíte")
+    parser.add_argument('--compare', metavar='BASELINE', help="resultado JSON de referência")
+    parser.add_argument('--threshold', type=float, default=0.10, help="piora tolerada (fração, padrão 0.10)")
+    args = parser.parse_args()
+    os.makedirs(args.workdir, exist_ok=True)
+
+    if args.input:
+        with open(args.input) as f:
+            current = json.load(f)
+    else:
+        suites = {'filters': bench_filters, 'render': bench_render, 'upload': bench_upload, 'listing': bench_listing}
+        current = {"environment": environment(), "args": vars(args), "results": {}}
+        for name in args.suites:
+            print(f"--- {name} ---", flush=True)
+            results = suites[name](args)
+            print_results(results)
+            current['results'].update(results)
+        if args.output:
+            os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+            with open(args.output, 'w') as f:
+                json.dump(current, f, indent=2)
+            print(f"\nResultado gravado em {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('environment', {}).get('cpu_count') != current.get('environment', {}).get('cpu_count'):
+            print("Aviso: baseline medido em uma máquina com outro número de núcleos.")
+        if print_comparison(compare(current, baseline, args.threshold), args.threshold):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
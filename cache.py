@@ -0,0 +1,70 @@
+# cache.py
+import os
+import shutil
+import hashlib
+import threading
+
+# Tamanho dos blocos lidos do upload ao gravá-lo em disco.
+CHUNK_SIZE = 1024 * 1024
+
+
+def save_and_hash(stream, path, chunk_size=CHUNK_SIZE):
+    """Grava `stream` em `path` calculando o SHA-256 no caminho; retorna (hash, bytes)."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'wb') as f:
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+            f.write(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def hash_file(path, chunk_size=CHUNK_SIZE):
+    """SHA-256 de um arquivo já gravado em disco."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def link_file(source, target):
+    """Cria `target` como hardlink de `source` (ou cópia, se o sistema de arquivos não suportar).
+
+    Com hardlinks, apagar o diretório de um vídeo não afeta os outros que compartilham o
+    conteúdo. Por isso arquivos em media/ nunca devem ser reescritos no lugar: grave em
+    outro caminho e substitua com os.replace.
+    """
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+class CacheStats:
+    """Contadores de acertos/erros do cache de uploads, seguros entre threads."""
+
+    FIELDS = ('original_hits', 'original_misses', 'render_hits', 'render_misses')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(self.FIELDS, 0)
+
+    def add(self, field, amount=1):
+        with self._lock:
+            self._counts[field] += amount
+
+    def snapshot(self):
+        with self._lock:
+            counts = dict(self._counts)
+        renders = counts['render_hits'] + counts['render_misses']
+        counts['render_hit_ratio'] = round(counts['render_hits'] / renders, 3) if renders else None
+        return counts
@@ -3,21 +3,277 @@ import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 import requests
 import threading
+import time
 import os
 import webbrowser
 import io
+import json
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image, ImageTk
-from requests_toolbelt.multipart.encoder import MultipartEncoder, MultipartEncoderMonitor
 
 SERVER_URL = "http://127.0.0.1:5000" 
+# Vídeos pedidos por página do histórico e campos usados pela interface.
+HISTORY_PAGE_SIZE = 50
+HISTORY_FIELDS = ("id,original_name,original_ext,filter,size_bytes,created_at,path_original,path_processed,"
+                  "path_thumbnail,thumbnails,variants,path_preview")
+# Tamanho máximo da thumbnail exibida, quantas ficam prontas em memória e quantas threads as baixam.
+THUMBNAIL_SIZE = (450, 450)
+THUMBNAIL_MEMORY_ITEMS = 64
+THUMBNAIL_WORKERS = 2
+# Espera máxima por dados do /events (o servidor manda um keep-alive a cada 15s) e
+# espera máxima entre tentativas de reconexão.
+EVENTS_READ_TIMEOUT = 60
+EVENTS_MAX_BACKOFF = 30
+# Fila de upload: arquivos enviados ao mesmo tempo, blocos em paralelo por arquivo,
+# intervalo entre atualizações da tabela da fila e entre consultas aos jobs.
+UPLOAD_WORKERS = 3
+UPLOAD_PARALLEL_CHUNKS = 4
+UPLOAD_REFRESH_MS = 100
+JOB_POLL_SEC = 1
+# Conexões mantidas abertas pela Session compartilhada: uma por thread que faz requisições.
+HTTP_POOL_SIZE = UPLOAD_WORKERS * UPLOAD_PARALLEL_CHUNKS + THUMBNAIL_WORKERS + 4
+
+def create_http_session(pool_size=HTTP_POOL_SIZE):
+    """Session compartilhada por todas as threads do cliente, reaproveitando conexões (keep-alive)."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+class ChunkedUploader:
+    """Envia um arquivo pelo protocolo de upload retomável do servidor (/uploads).
+
+    Os blocos que faltam são enviados em paralelo; blocos com erro são tentados de novo com
+    espera crescente e, se a conexão cair, o envio continua de onde parou consultando o
+    servidor. O id da sessão fica salvo em RESUME_FILE, então reabrir o cliente e enviar o
+    mesmo arquivo também retoma o upload anterior.
+    """
+
+    RESUME_FILE = os.path.join(os.path.expanduser("~"), ".sdt3_uploads.json")
+    # Compartilhada entre instâncias: vários arquivos podem ser enviados ao mesmo tempo.
+    _resume_lock = threading.Lock()
+
+    def __init__(self, server_url, parallel_chunks=UPLOAD_PARALLEL_CHUNKS, max_retries=5, progress_callback=None,
+                 session=None):
+        self.server_url = server_url
+        self.parallel_chunks = parallel_chunks
+        self.max_retries = max_retries
+        self.progress_callback = progress_callback
+        self.session = session or requests.Session()
+        self._lock = threading.Lock()
+
+    def upload(self, filepath, filters, params=None):
+        """Envia `filepath` e finaliza a sessão; retorna a resposta do /complete."""
+        size = os.path.getsize(filepath)
+        key = self._resume_key(filepath, size, filters, params)
+        upload_id = self._load_resume().get(key)
+        status = self._get_status(upload_id) if upload_id else None
+        if status is None:
+            upload_id, status = self._create_session(filepath, size, filters, params)
+            self._save_resume(key, upload_id)
+
+        chunk_size = status.get('chunk_size') or 8 * 1024 * 1024
+        for attempt in range(self.max_retries + 1):
+            if status['complete']:
+                break
+            self._report(status['received_bytes'], size)
+            try:
+                self._send_missing(filepath, upload_id, status['missing'], chunk_size, status['received_bytes'], size)
+            except requests.exceptions.RequestException:
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(min(2 ** attempt, 30))
+            status = self._get_status(upload_id)
+            if status is None:
+                raise RuntimeError("A sessão de upload expirou no servidor; envie o arquivo novamente.")
+            status['chunk_size'] = chunk_size
+
+        if not status['complete']:
+            raise RuntimeError("Não foi possível concluir o upload; tente novamente para retomar.")
+        self._report(size, size)
+        response = self.session.post(f"{self.server_url}/uploads/{upload_id}/complete", timeout=300)
+        response.raise_for_status()
+        self._save_resume(key, None)
+        return response
+
+    def _create_session(self, filepath, size, filters, params):
+        response = self.session.post(f"{self.server_url}/uploads", json={
+            "filename": os.path.basename(filepath), "size": size, "mime_type": "video/mp4",
+            "filter": filters, "params": params}, timeout=30)
+        response.raise_for_status()
+        session = response.json()
+        status = self._get_status(session['upload_id'])
+        status['chunk_size'] = session['chunk_size']
+        return session['upload_id'], status
+
+    def _get_status(self, upload_id):
+        response = self.session.get(f"{self.server_url}/uploads/{upload_id}", timeout=30)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()
+
+    def _send_missing(self, filepath, upload_id, missing, chunk_size, already_received, size):
+        chunks = []
+        for start, end in missing:
+            chunks.extend((offset, min(offset + chunk_size, end)) for offset in range(start, end, chunk_size))
+        self._bytes_done = already_received
+        with ThreadPoolExecutor(max_workers=self.parallel_chunks) as pool:
+            futures = [pool.submit(self._send_chunk, filepath, upload_id, start, end, size) for start, end in chunks]
+            for future in futures:
+                future.result()
+
+    def _send_chunk(self, filepath, upload_id, start, end, size):
+        with open(filepath, 'rb') as f:
+            f.seek(start)
+            data = f.read(end - start)
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.put(f"{self.server_url}/uploads/{upload_id}", params={"offset": start},
+                                        data=data, timeout=120)
+                response.raise_for_status()
+                break
+            except requests.exceptions.RequestException:
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(min(2 ** attempt, 30))
+        with self._lock:
+            self._bytes_done += end - start
+            self._report(self._bytes_done, size)
+
+    def _report(self, bytes_done, total):
+        if self.progress_callback is not None:
+            self.progress_callback(bytes_done, total)
+
+    @staticmethod
+    def _resume_key(filepath, size, filters, params):
+        return json.dumps([os.path.abspath(filepath), size, os.path.getmtime(filepath), filters, params])
+
+    def _load_resume(self):
+        try:
+            with open(self.RESUME_FILE) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_resume(self, key, upload_id):
+        with self._resume_lock:
+            sessions = self._load_resume()
+            if upload_id is None:
+                sessions.pop(key, None)
+            else:
+                sessions[key] = upload_id
+            try:
+                with open(self.RESUME_FILE, 'w') as f:
+                    json.dump(sessions, f)
+            except OSError as e:
+                print(f"Não foi possível salvar o estado do upload: {e}")
+
+class ThumbnailCache:
+    """Cache em disco das thumbnails já reduzidas para exibição, uma por vídeo.
+
+    Cada entrada guarda a imagem reduzida e o ETag da versão baixada de /media; ao
+    revalidar, o servidor responde 304 se ela não mudou e nada é baixado de novo. Métodos
+    seguros para chamar das threads de download.
+    """
+
+    CACHE_DIR = os.path.join(os.path.expanduser("~"), ".sdt3_thumbs")
+
+    def __init__(self, server_url, size=THUMBNAIL_SIZE, cache_dir=None, session=None):
+        self.server_url = server_url
+        self.session = session or requests.Session()
+        self.size = size
+        self.cache_dir = cache_dir or self.CACHE_DIR
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _paths(self, video_id):
+        base = os.path.join(self.cache_dir, video_id)
+        return base + ".png", base + ".json"
+
+    def _read_meta(self, video_id):
+        try:
+            with open(self._paths(video_id)[1]) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def read(self, video_id, media_path):
+        """Imagem em disco de `video_id`, se for da mesma `media_path`; senão None."""
+        meta = self._read_meta(video_id)
+        if meta is None or meta.get('path') != media_path:
+            return None
+        try:
+            with Image.open(self._paths(video_id)[0]) as image:
+                image.load()
+                return image
+        except OSError:
+            return None
+
+    def fetch(self, video_id, media_path):
+        """Baixa e guarda a thumbnail; retorna a imagem nova ou None se a do disco ainda vale."""
+        meta = self._read_meta(video_id)
+        headers = {}
+        if meta and meta.get('path') == media_path and meta.get('etag') and os.path.exists(self._paths(video_id)[0]):
+            headers['If-None-Match'] = meta['etag']
+        response = self.session.get(f"{self.server_url}/media/{media_path}", headers=headers, timeout=10)
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+
+        image = Image.open(io.BytesIO(response.content))
+        image.thumbnail(self.size)
+        image_path, meta_path = self._paths(video_id)
+        # Grava em arquivos temporários e troca, para outra thread nunca ler uma imagem pela metade.
+        image.save(image_path + ".tmp", format="PNG")
+        os.replace(image_path + ".tmp", image_path)
+        with open(meta_path + ".tmp", 'w') as f:
+            json.dump({"path": media_path, "etag": response.headers.get('ETag')}, f)
+        os.replace(meta_path + ".tmp", meta_path)
+        return image
+
+    def discard(self, video_id):
+        for path in self._paths(video_id):
+            if os.path.exists(path):
+                os.remove(path)
+
 
 class VideoUploaderClient(tk.Tk):
     def __init__(self):
         super().__init__()
         self.title("Cliente de Processamento de Vídeo")
-        self.geometry("1200x700")
+        self.geometry("1200x850")
 
         self.video_data = {}
+        self.next_cursor = None
+        # Última alteração do servidor já aplicada ao histórico (veja /videos/changes) e se
+        # há uma sincronização em andamento ou outra pedida durante ela (veja sync_history).
+        self.last_seq = None
+        self.sync_running = False
+        self.sync_again = False
+
+        # Uma Session para todas as requisições, com conexões reaproveitadas entre as threads.
+        self.http = create_http_session()
+
+        # Thumbnails: PhotoImages prontas em memória (LRU, só usadas na thread do Tk), cópias
+        # reduzidas em disco e um pool fixo de threads para baixá-las.
+        self.thumbnail_cache = ThumbnailCache(SERVER_URL, session=self.http)
+        self.thumbnail_images = OrderedDict()
+        self.thumbnail_pool = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS, thread_name_prefix="thumbnail")
+        self.selected_thumbnail = None
+        self.revalidated_thumbnails = set()
+
+        # Fila de upload: as threads do pool só registram o andamento em pending_updates
+        # (protegido por upload_lock) e a thread do Tk aplica tudo a cada UPLOAD_REFRESH_MS.
+        self.upload_pool = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="upload")
+        self.upload_lock = threading.Lock()
+        self.upload_items = {}
+        self.pending_updates = {}
+        self.tracked_jobs = {}
+        self.job_poller_running = False
+        self.refresh_scheduled = False
+        self.selected_files = ()
 
         style = ttk.Style(self)
         style.theme_use('clam')
@@ -27,21 +283,40 @@ class VideoUploaderClient(tk.Tk):
         self.rowconfigure(1, weight=1)
 
         # --- Frame de Upload ---
-        upload_frame = ttk.LabelFrame(self, text="Enviar Novo Vídeo", padding="10")
+        upload_frame = ttk.LabelFrame(self, text="Enviar Vídeos", padding="10")
         upload_frame.grid(row=0, column=0, columnspan=2, padx=10, pady=10, sticky="ew")
         upload_frame.columnconfigure(0, weight=1)
         
         self.filepath_label = ttk.Label(upload_frame, text="Nenhum arquivo selecionado...", anchor="w")
         self.filepath_label.grid(row=0, column=0, padx=5, pady=5, sticky="ew")
-        self.select_button = ttk.Button(upload_frame, text="Selecionar Vídeo", command=self.select_file)
+        self.select_button = ttk.Button(upload_frame, text="Selecionar Vídeos", command=self.select_file)
         self.select_button.grid(row=0, column=1, padx=5, pady=5)
-        filters = ["grayscale", "canny", "sepia", "pixelate", "invert"]
+        # O campo é editável para aceitar cadeias aplicadas em uma única passada, ex.: "sepia,pixelate"
+        # e várias variantes separadas por ';', ex.: "grayscale;sepia;invert"
+        filters = ["grayscale", "canny", "sepia", "pixelate", "invert", "sepia,pixelate", "grayscale,invert",
+                   "grayscale;sepia;invert"]
         self.filter_var = tk.StringVar(value=filters[0])
-        self.filter_menu = ttk.Combobox(upload_frame, textvariable=self.filter_var, values=filters, state="readonly")
+        self.filter_menu = ttk.Combobox(upload_frame, textvariable=self.filter_var, values=filters)
         self.filter_menu.grid(row=0, column=2, padx=5, pady=5)
-        self.upload_button = ttk.Button(upload_frame, text="Enviar e Processar", command=self.start_upload_thread)
+        self.upload_button = ttk.Button(upload_frame, text="Enviar e Processar", command=self.enqueue_uploads)
         self.upload_button.grid(row=0, column=3, padx=5, pady=5)
-        self.filepath = ""
+
+        queue_columns = ("file", "filter", "state", "progress")
+        self.upload_tree = ttk.Treeview(upload_frame, columns=queue_columns, show="headings", height=5)
+        self.upload_tree.heading("file", text="Arquivo")
+        self.upload_tree.heading("filter", text="Filtro")
+        self.upload_tree.heading("state", text="Estado")
+        self.upload_tree.heading("progress", text="Progresso")
+        self.upload_tree.column("file", width=350)
+        self.upload_tree.column("filter", width=150)
+        self.upload_tree.column("state", width=300)
+        self.upload_tree.column("progress", width=80, anchor="e")
+        self.upload_tree.grid(row=1, column=0, columnspan=3, padx=5, pady=5, sticky="ew")
+        queue_scrollbar = ttk.Scrollbar(upload_frame, orient="vertical", command=self.upload_tree.yview)
+        queue_scrollbar.grid(row=1, column=3, padx=(0, 5), pady=5, sticky="nsw")
+        self.upload_tree.configure(yscrollcommand=queue_scrollbar.set)
+        self.clear_button = ttk.Button(upload_frame, text="Limpar concluídos", command=self.clear_finished_uploads)
+        self.clear_button.grid(row=2, column=3, padx=5, pady=5)
 
         # --- Frame de Histórico ---
         history_frame = ttk.LabelFrame(self, text="Histórico de Vídeos", padding="10")
@@ -73,8 +348,11 @@ class VideoUploaderClient(tk.Tk):
         self.view_processed_button.pack(side=tk.LEFT, padx=5)
         self.delete_button = ttk.Button(history_actions_frame, text="Excluir Selecionado", command=self.delete_selected_video)
         self.delete_button.pack(side=tk.LEFT, padx=5)
-        self.refresh_button = ttk.Button(history_actions_frame, text="Atualizar", command=self.load_history)
+        self.refresh_button = ttk.Button(history_actions_frame, text="Atualizar", command=self.sync_history)
         self.refresh_button.pack(side=tk.LEFT, padx=5)
+        self.load_more_button = ttk.Button(history_actions_frame, text="Carregar mais", state=tk.DISABLED,
+                                           command=lambda: self.load_history(append=True))
+        self.load_more_button.pack(side=tk.LEFT, padx=5)
 
         # --- Frame da Thumbnail ---
         thumbnail_frame = ttk.LabelFrame(self, text="Thumbnail", padding="10")
@@ -92,6 +370,7 @@ class VideoUploaderClient(tk.Tk):
         self.status_label.grid(row=1, column=0, sticky="ew", padx=5, pady=5)
 
         self.load_history()
+        threading.Thread(target=self.listen_events, daemon=True).start()
 
     def view_video_in_browser(self, video_type):
         selected_items = self.history_tree.selection()
@@ -108,6 +387,9 @@ class VideoUploaderClient(tk.Tk):
             
         path_key = 'path_original' if video_type == 'original' else 'path_processed'
         relative_path = video_info.get(path_key)
+        if video_type != 'original' and video_info.get('path_preview'):
+            # Renderização completa ainda em andamento: abre a prévia.
+            relative_path = video_info['path_preview']
         
         if relative_path:
             video_url = f"{SERVER_URL}/media/{relative_path}"
@@ -116,87 +398,212 @@ class VideoUploaderClient(tk.Tk):
             messagebox.showerror("Erro", f"Caminho para o vídeo '{video_type}' não encontrado.")
 
     def on_video_select(self, event):
-        """Chamada quando um vídeo é selecionado. Baixa e exibe a thumbnail."""
+        """Chamada quando um vídeo é selecionado. Exibe a thumbnail, do cache se possível."""
         selected_items = self.history_tree.selection()
         if not selected_items:
             return
 
         video_id = self.history_tree.item(selected_items[0])['values'][0]
         video_info = self.video_data.get(video_id)
+        media_path = self.thumbnail_media_path(video_info) if video_info else None
+        self.selected_thumbnail = video_id
+        if not media_path:
+            self.thumbnail_label.config(image='', text="Thumbnail não disponível")
+            self.thumbnail_label.image = None
+            return
 
-        # CORREÇÃO: Procurar por 'path_thumbnail' que agora vem da API /videos
-        if video_info and video_info.get('path_thumbnail'):
-            thumb_url = f"{SERVER_URL}/media/{video_info['path_thumbnail']}"
-            try:
-                threading.Thread(target=self.fetch_and_display_thumbnail, args=(thumb_url,)).start()
-            except Exception as e:
-                print(f"Erro ao iniciar thread da thumbnail: {e}")
+        photo = self.thumbnail_images.get(video_id)
+        if photo is not None:
+            self.thumbnail_images.move_to_end(video_id)
+            self.thumbnail_label.config(image=photo, text="")
+            self.thumbnail_label.image = photo
+            if video_id in self.revalidated_thumbnails:
+                return
         else:
-            self.thumbnail_label.config(image=None, text="Thumbnail não disponível")
+            self.thumbnail_label.config(image='', text="Carregando thumbnail...")
             self.thumbnail_label.image = None
+        self.thumbnail_pool.submit(self.load_thumbnail, video_id, media_path, photo is not None)
 
-    def fetch_and_display_thumbnail(self, thumb_url):
-        """Baixa a imagem e a atualiza na interface."""
-        try:
-            response = requests.get(thumb_url, timeout=10)
-            response.raise_for_status()
+    @staticmethod
+    def thumbnail_media_path(video):
+        """Menor miniatura do servidor que ainda cobre THUMBNAIL_SIZE (ou o frame inteiro)."""
+        sizes = sorted((int(width), path) for width, path in (video.get('thumbnails') or {}).items())
+        for width, path in sizes:
+            if width >= max(THUMBNAIL_SIZE):
+                return path
+        return video.get('path_thumbnail')
 
-            image_data = Image.open(io.BytesIO(response.content))
-            image_data.thumbnail((450, 450))
-            photo = ImageTk.PhotoImage(image_data)
+    def load_thumbnail(self, video_id, media_path, in_memory):
+        """Roda no pool de thumbnails: usa o disco, revalida com o servidor e devolve ao Tk."""
+        # Ao descer pelo histórico com as setas, pedidos de linhas já deixadas para trás são descartados.
+        if video_id != self.selected_thumbnail:
+            return
+        try:
+            if not in_memory:
+                image = self.thumbnail_cache.read(video_id, media_path)
+                if image is not None:
+                    self.after(0, self.show_thumbnail, video_id, image)
+                    if video_id in self.revalidated_thumbnails:
+                        return
+            if video_id != self.selected_thumbnail:
+                return
+            image = self.thumbnail_cache.fetch(video_id, media_path)
+            self.revalidated_thumbnails.add(video_id)
+            if image is not None:
+                self.after(0, self.show_thumbnail, video_id, image)
+        except Exception as e:
+            print(f"Erro ao carregar thumbnail de {video_id}: {e}")
+            self.after(0, self.show_thumbnail_error, video_id)
 
+    def show_thumbnail(self, video_id, image):
+        """Cria a PhotoImage na thread do Tk, guarda no LRU e exibe se o vídeo ainda estiver selecionado."""
+        photo = ImageTk.PhotoImage(image)
+        self.thumbnail_images[video_id] = photo
+        self.thumbnail_images.move_to_end(video_id)
+        while len(self.thumbnail_images) > THUMBNAIL_MEMORY_ITEMS:
+            self.thumbnail_images.popitem(last=False)
+        if video_id == self.selected_thumbnail:
             self.thumbnail_label.config(image=photo, text="")
             self.thumbnail_label.image = photo
 
-        except Exception as e:
-            print(f"Erro ao carregar thumbnail da URL {thumb_url}: {e}")
-            self.thumbnail_label.config(image=None, text=f"Erro ao carregar thumbnail.")
+    def show_thumbnail_error(self, video_id):
+        if video_id == self.selected_thumbnail and video_id not in self.thumbnail_images:
+            self.thumbnail_label.config(image='', text="Erro ao carregar thumbnail.")
             self.thumbnail_label.image = None
 
+    def forget_thumbnail(self, video_id):
+        self.thumbnail_images.pop(video_id, None)
+        self.revalidated_thumbnails.discard(video_id)
+        self.thumbnail_cache.discard(video_id)
+
     def select_file(self):
-        filepath = filedialog.askopenfilename(title="Selecione um vídeo", filetypes=(("Vídeos", "*.mp4 *.avi *.mov"), ("Todos os arquivos", "*.*")))
-        if filepath:
-            self.filepath = filepath
-            self.filepath_label.config(text=os.path.basename(filepath))
-
-    def start_upload_thread(self):
-        if not self.filepath:
-            messagebox.showwarning("Aviso", "Por favor, selecione um arquivo de vídeo primeiro.")
+        filepaths = filedialog.askopenfilenames(title="Selecione os vídeos", filetypes=(("Vídeos", "*.mp4 *.avi *.mov"), ("Todos os arquivos", "*.*")))
+        if filepaths:
+            self.selected_files = filepaths
+            label = os.path.basename(filepaths[0]) if len(filepaths) == 1 else f"{len(filepaths)} arquivos selecionados"
+            self.filepath_label.config(text=label)
+
+    def enqueue_uploads(self):
+        """Coloca os arquivos selecionados na fila com o filtro atual; a fila segue enviando sozinha."""
+        if not self.selected_files:
+            messagebox.showwarning("Aviso", "Por favor, selecione um ou mais arquivos de vídeo primeiro.")
             return
-        self.upload_button.config(state=tk.DISABLED)
-        self.select_button.config(state=tk.DISABLED)
-        threading.Thread(target=self.upload_video).start()
-        
-    def upload_video(self):
-        self.status_label.config(text="Iniciando upload...")
-        self.progress_bar['value'] = 0
-        url = f"{SERVER_URL}/upload"
         filter_choice = self.filter_var.get()
+        # Vários filtros separados por ';' geram várias variantes com uma única decodificação.
+        filters = [spec.strip() for spec in filter_choice.split(';') if spec.strip()]
+        for filepath in self.selected_files:
+            row_id = self.upload_tree.insert("", tk.END, values=(os.path.basename(filepath), filter_choice,
+                                                                  "Na fila", ""))
+            self.upload_items[row_id] = {"state": "Na fila", "percent": None, "finished": False}
+            self.upload_pool.submit(self.upload_video, row_id, filepath, filters)
+        self.selected_files = ()
+        self.filepath_label.config(text="Nenhum arquivo selecionado...")
+        self.schedule_upload_refresh()
+
+    def upload_video(self, row_id, filepath, filters):
+        """Roda no pool de upload: envia um arquivo e passa o job resultante ao poller de jobs."""
+        self.post_upload_update(row_id, state="Enviando...", percent=0)
         try:
-            filename = os.path.basename(self.filepath)
-            encoder = MultipartEncoder(fields={'filter': filter_choice, 'video': (filename, open(self.filepath, 'rb'), 'video/mp4')})
-            monitor = MultipartEncoderMonitor(encoder, self.upload_progress_callback)
-            headers = {'Content-Type': monitor.content_type}
-            response = requests.post(url, data=monitor, headers=headers, timeout=300)
-            response.raise_for_status()
+            uploader = ChunkedUploader(SERVER_URL, session=self.http,
+                                       progress_callback=lambda done, total: self.post_upload_update(
+                                           row_id, percent=done / total * 100))
+            response = uploader.upload(filepath, filters)
             result = response.json()
-            self.status_label.config(text=f"Sucesso: {result.get('message')}")
-            self.after(500, self.load_history)
+            if response.status_code == 202 and result.get('job_id'):
+                self.post_upload_update(row_id, state="Aguardando na fila de processamento...", percent=None)
+                self.track_job(result['job_id'], row_id)
+            else:
+                self.post_upload_update(row_id, state=f"Sucesso: {result.get('message')}", percent=100, finished=True)
         except Exception as e:
-            self.status_label.config(text=f"Erro: {e}")
-            messagebox.showerror("Erro", f"Ocorreu um erro: {e}")
-        finally:
-            self.after(0, self.enable_buttons)
+            self.post_upload_update(row_id, state=f"Erro: {e}", percent=None, finished=True)
+
+    def track_job(self, job_id, row_id):
+        with self.upload_lock:
+            self.tracked_jobs[job_id] = row_id
+            if self.job_poller_running:
+                return
+            self.job_poller_running = True
+        threading.Thread(target=self.poll_jobs, daemon=True).start()
+
+    def poll_jobs(self):
+        """Uma única consulta ao /jobs por rodada acompanha todos os jobs da fila."""
+        while True:
+            with self.upload_lock:
+                if not self.tracked_jobs:
+                    self.job_poller_running = False
+                    return
+            try:
+                response = self.http.get(f"{SERVER_URL}/jobs", timeout=10)
+                response.raise_for_status()
+                jobs = {job['id']: job for job in response.json()}
+            except requests.exceptions.RequestException as e:
+                print(f"Erro ao consultar os jobs: {e}")
+                jobs = {}
+            with self.upload_lock:
+                tracked = list(self.tracked_jobs.items())
+            for job_id, row_id in tracked:
+                job = jobs.get(job_id)
+                if job is None:
+                    continue
+                if job['state'] in ('done', 'failed', 'cancelled'):
+                    with self.upload_lock:
+                        self.tracked_jobs.pop(job_id, None)
+                if job['state'] == 'done':
+                    self.post_upload_update(row_id, state="Vídeo processado com sucesso!", percent=100, finished=True)
+                elif job['state'] == 'failed':
+                    self.post_upload_update(row_id, state=f"Falha no processamento: {job.get('error')}",
+                                            percent=None, finished=True)
+                elif job['state'] == 'cancelled':
+                    self.post_upload_update(row_id, state=f"Processamento cancelado: {job.get('error')}",
+                                            percent=None, finished=True)
+                elif job['state'] == 'running' and job.get('percent') is not None:
+                    eta = f" (restam ~{job['eta_sec']:.0f}s)" if job.get('eta_sec') is not None else ""
+                    self.post_upload_update(row_id, state=f"Processando...{eta}", percent=job['percent'])
+            time.sleep(JOB_POLL_SEC)
+
+    def post_upload_update(self, row_id, **fields):
+        """Chamada de qualquer thread: guarda a atualização para o próximo refresh da fila."""
+        with self.upload_lock:
+            self.pending_updates.setdefault(row_id, {}).update(fields)
+
+    def schedule_upload_refresh(self):
+        if not self.refresh_scheduled:
+            self.refresh_scheduled = True
+            self.after(UPLOAD_REFRESH_MS, self.refresh_uploads)
+
+    def refresh_uploads(self):
+        """Aplica na thread do Tk as atualizações acumuladas; vários blocos viram uma só mudança por linha."""
+        self.refresh_scheduled = False
+        with self.upload_lock:
+            updates, self.pending_updates = self.pending_updates, {}
+        finished_now = False
+        for row_id, fields in updates.items():
+            item = self.upload_items.get(row_id)
+            if item is None:
+                continue
+            finished_now = finished_now or (fields.get('finished') and not item['finished'])
+            item.update(fields)
+            progress = f"{item['percent']:.1f}%" if item['percent'] is not None else ""
+            self.upload_tree.set(row_id, "state", item['state'])
+            self.upload_tree.set(row_id, "progress", progress)
+        if finished_now:
+            self.sync_history()
+
+        total = len(self.upload_items)
+        finished = sum(1 for item in self.upload_items.values() if item['finished'])
+        if finished < total:
+            self.progress_bar['value'] = finished / total * 100
+            self.status_label.config(text=f"Fila de upload: {finished} de {total} arquivos concluídos.")
+            self.schedule_upload_refresh()
+        elif updates:
             self.progress_bar['value'] = 0
+            self.status_label.config(text=f"Fila de upload concluída ({total} arquivos).")
 
-    def upload_progress_callback(self, monitor):
-        progress = (monitor.bytes_read / monitor.len) * 100
-        self.progress_bar['value'] = progress
-        self.status_label.config(text=f"Enviando... {progress:.1f}%")
-        
-    def enable_buttons(self):
-        self.upload_button.config(state=tk.NORMAL)
-        self.select_button.config(state=tk.NORMAL)
+    def clear_finished_uploads(self):
+        for row_id, item in list(self.upload_items.items()):
+            if item['finished']:
+                self.upload_tree.delete(row_id)
+                del self.upload_items[row_id]
 
     def format_bytes(self, size):
         if size is None: return "N/A"
@@ -206,26 +613,156 @@ class VideoUploaderClient(tk.Tk):
             size /= power; n += 1
         return f"{size:.1f}{power_labels[n]}B"
 
-    def load_history(self):
+    def format_filters(self, video):
+        variants = video.get('variants') or []
+        if len(variants) > 1:
+            return " | ".join(variant['filter'] for variant in variants)
+        return video['filter']
+
+    def load_history(self, append=False):
+        """Carrega a primeira página do histórico ou, com append=True, a página seguinte."""
         self.status_label.config(text="Atualizando histórico...")
-        for i in self.history_tree.get_children():
-            self.history_tree.delete(i)
-        self.video_data.clear()
+        if not append:
+            for i in self.history_tree.get_children():
+                self.history_tree.delete(i)
+            self.video_data.clear()
+            self.next_cursor = None
+        params = {"limit": HISTORY_PAGE_SIZE, "fields": HISTORY_FIELDS}
+        if append and self.next_cursor:
+            params["cursor"] = self.next_cursor
         try:
-            response = requests.get(f"{SERVER_URL}/videos")
+            response = self.http.get(f"{SERVER_URL}/videos", params=params, timeout=30)
             response.raise_for_status()
-            videos = response.json()
-            for video in videos:
-                size_formatted = self.format_bytes(video.get('size_bytes'))
-                self.history_tree.insert("", tk.END, values=(
-                    video['id'], video['original_name'] + video['original_ext'], 
-                    video['filter'], size_formatted, video['created_at'].split('T')[0]
-                ))
+            page = response.json()
+            if not append:
+                self.last_seq = page['last_seq']
+            for video in page['items']:
+                self.history_tree.insert("", tk.END, iid=video['id'], values=self.history_values(video))
                 self.video_data[video['id']] = video
-            self.status_label.config(text="Histórico atualizado.")
+            self.next_cursor = page['next_cursor']
+            self.load_more_button.config(state=tk.NORMAL if self.next_cursor else tk.DISABLED)
+            self.status_label.config(text=f"Histórico atualizado ({len(self.video_data)} vídeos).")
         except requests.exceptions.RequestException as e:
             self.status_label.config(text="Erro ao carregar histórico: " + str(e))
 
+    def history_values(self, video):
+        return (video['id'], video['original_name'] + video['original_ext'], self.format_filters(video),
+                self.format_bytes(video.get('size_bytes')), video['created_at'].split('T')[0])
+
+    def sync_history(self):
+        """Aplica ao histórico só o que mudou desde a última sincronização.
+
+        A consulta ao /videos/changes roda no pool de thumbnails, fora da thread do Tk, e o
+        resultado volta por after(), como as miniaturas. Pedidos feitos durante uma
+        sincronização viram uma só, logo depois dela.
+        """
+        if self.last_seq is None:
+            self.load_history()
+            return
+        if self.sync_running:
+            self.sync_again = True
+            return
+        self.sync_running = True
+        self.thumbnail_pool.submit(self.fetch_changes, self.last_seq)
+
+    def fetch_changes(self, since):
+        """Roda no pool: lê todas as páginas do /videos/changes a partir de `since` e devolve ao Tk."""
+        changes = []
+        try:
+            has_more = True
+            while has_more:
+                response = self.http.get(f"{SERVER_URL}/videos/changes",
+                                        params={"since": since, "fields": HISTORY_FIELDS}, timeout=10)
+                response.raise_for_status()
+                delta = response.json()
+                if delta['reset']:
+                    self.after(0, self.finish_sync, None)
+                    return
+                changes.extend(delta['changes'])
+                since = delta['last_seq']
+                has_more = delta['has_more']
+            self.after(0, self.finish_sync, changes, since)
+        except requests.exceptions.RequestException as e:
+            self.after(0, self.finish_sync, None, None, e)
+
+    def finish_sync(self, changes, last_seq=None, error=None):
+        """Na thread do Tk: aplica o resultado de fetch_changes; `changes` None (sem erro) recarrega tudo."""
+        self.sync_running = False
+        if error is not None:
+            self.status_label.config(text="Erro ao atualizar histórico: " + str(error))
+        elif changes is None:
+            self.load_history()
+        else:
+            for change in changes:
+                self.apply_change(change)
+            # O /events pode ter aplicado alterações mais novas enquanto a consulta rodava.
+            if self.last_seq is not None:
+                self.last_seq = max(self.last_seq, last_seq)
+            self.status_label.config(text=f"Histórico atualizado ({len(self.video_data)} vídeos).")
+        if self.sync_again:
+            self.sync_again = False
+            self.sync_history()
+
+    def apply_change(self, change):
+        """Aplica uma alteração do /videos/changes ou do /events à linha correspondente."""
+        # Alterações já cobertas por um recarregamento ou sincronização são ignoradas.
+        if self.last_seq is None or change['seq'] <= self.last_seq:
+            return
+        self.last_seq = change['seq']
+        video_id = change['video_id']
+        if change['kind'] == 'delete':
+            if self.history_tree.exists(video_id):
+                self.history_tree.delete(video_id)
+            self.video_data.pop(video_id, None)
+            self.forget_thumbnail(video_id)
+            return
+
+        video = change['video']
+        if self.history_tree.exists(video_id):
+            self.history_tree.item(video_id, values=self.history_values(video))
+            # A miniatura pode ter mudado: a cópia em disco é revalidada na próxima seleção.
+            self.thumbnail_images.pop(video_id, None)
+            self.revalidated_thumbnails.discard(video_id)
+        else:
+            self.history_tree.insert("", 0, iid=video_id, values=self.history_values(video))
+        self.video_data[video_id] = video
+
+    def listen_events(self):
+        """Thread em segundo plano: recebe as alterações do /events e as aplica na thread do Tk.
+
+        Reconecta com espera crescente se a conexão cair, retomando da última alteração aplicada.
+        """
+        backoff = 1
+        while True:
+            since = self.last_seq
+            params = {"fields": HISTORY_FIELDS}
+            if since is not None:
+                params["since"] = since
+            try:
+                with self.http.get(f"{SERVER_URL}/events", params=params, stream=True,
+                                  timeout=(5, EVENTS_READ_TIMEOUT)) as response:
+                    response.raise_for_status()
+                    backoff = 1
+                    if since is None:
+                        # O histórico não carregou na abertura (servidor fora do ar).
+                        self.after(0, self.load_history)
+                    event, data = None, []
+                    for line in response.iter_lines(decode_unicode=True):
+                        if line.startswith("event:"):
+                            event = line[len("event:"):].strip()
+                        elif line.startswith("data:"):
+                            data.append(line[len("data:"):].strip())
+                        elif not line:
+                            if event == 'change' and data:
+                                self.after(0, self.apply_change, json.loads("\n".join(data)))
+                            elif event == 'reset':
+                                self.after(0, self.load_history)
+                            event, data = None, []
+            except (requests.exceptions.RequestException, ValueError) as e:
+                print(f"Conexão com /events perdida: {e}")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, EVENTS_MAX_BACKOFF)
+
     def delete_selected_video(self):
         selected_items = self.history_tree.selection()
         if not selected_items:
@@ -236,11 +773,11 @@ class VideoUploaderClient(tk.Tk):
         if not messagebox.askyesno("Confirmar Exclusão", f"Tem certeza que deseja excluir o vídeo {video_id}?"):
             return
         try:
-            response = requests.delete(f"{SERVER_URL}/video/{video_id}")
+            response = self.http.delete(f"{SERVER_URL}/video/{video_id}", timeout=30)
             response.raise_for_status()
             messagebox.showinfo("Sucesso", "Vídeo excluído com sucesso.")
-            self.load_history()
-            self.thumbnail_label.config(image=None, text="Selecione um vídeo para ver a thumbnail")
+            self.sync_history()
+            self.thumbnail_label.config(image='', text="Selecione um vídeo para ver a thumbnail")
             self.thumbnail_label.image = None
         except requests.exceptions.RequestException as e:
             messagebox.showerror("Erro de Conexão", f"Não foi possível excluir o vídeo: {e}")
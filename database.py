@@ -1,21 +1,159 @@
 # database.py (VERSÃO CORRIGIDA)
 import sqlite3
-import os
+import threading
+from collections import deque
+from contextlib import contextmanager
 
 DB_FILE = "videos.db"
 
-def create_connection():
-    """Cria uma conexão com o banco de dados SQLite."""
-    conn = None
-    try:
-        conn = sqlite3.connect(DB_FILE)
-        return conn
-    except sqlite3.Error as e:
-        print(e)
+# --- Configuração das conexões ---
+# Páginas em cache por conexão (valor negativo = KiB, como o PRAGMA cache_size espera).
+CACHE_SIZE_KIB = 16 * 1024
+# Quanto tempo uma escrita espera por outra antes de desistir com "database is locked".
+BUSY_TIMEOUT_SEC = 5
+# Comandos SQL compilados guardados por conexão; as consultas usam SQL fixo com '?' para reaproveitá-los.
+CACHED_STATEMENTS = 256
+# Conexões mantidas abertas por arquivo de banco e tempo máximo de espera por uma livre.
+POOL_SIZE = 8
+POOL_TIMEOUT_SEC = 30
+
+def connect(db_file=None):
+    """Abre uma conexão já ajustada para acesso concorrente.
+
+    Com WAL, leitores não bloqueiam o escritor e vice-versa; synchronous=NORMAL é seguro
+    em WAL (uma queda de energia pode perder só a última transação, sem corromper o banco).
+    """
+    conn = sqlite3.connect(db_file or DB_FILE, timeout=BUSY_TIMEOUT_SEC,
+                           cached_statements=CACHED_STATEMENTS, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+    conn.execute("PRAGMA foreign_keys=ON")
     return conn
 
+class ConnectionPool:
+    """Conjunto de até `size` conexões reutilizadas entre requisições e threads.
+
+    Uma conexão só é usada por uma thread de cada vez: pegue com acquire()/release() ou
+    com o gerenciador de contexto connection(). Com o pool esgotado, as conexões devolvidas
+    vão direto para quem espera há mais tempo, para que escritores não fiquem sem vez
+    atrás de leitores rápidos. Transações abertas são desfeitas na devolução, para que um
+    erro no meio de uma rota não vaze para a próxima.
+    """
+
+    def __init__(self, db_file, size=POOL_SIZE):
+        self.db_file = db_file
+        self.size = size
+        self._idle = []
+        self._waiters = deque()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=POOL_TIMEOUT_SEC):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+            else:
+                waiter = {"event": threading.Event(), "conn": None}
+                self._waiters.append(waiter)
+        if can_create:
+            try:
+                return connect(self.db_file)
+            except sqlite3.Error:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        if not waiter['event'].wait(timeout):
+            with self._lock:
+                # A conexão pode ter sido entregue entre o fim da espera e o lock.
+                if waiter['conn'] is None:
+                    self._waiters.remove(waiter)
+                    raise RuntimeError(f"Nenhuma conexão livre com {self.db_file} após {timeout}s")
+        return waiter['conn']
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if self._waiters:
+                waiter = self._waiters.popleft()
+                waiter['conn'] = conn
+                waiter['event'].set()
+            else:
+                self._idle.append(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        """Fecha as conexões livres; as que estão em uso continuam válidas até serem devolvidas."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+        for conn in idle:
+            conn.close()
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(db_file=None):
+    """Pool compartilhado do arquivo `db_file` (padrão: DB_FILE)."""
+    db_file = db_file or DB_FILE
+    with _pools_lock:
+        if db_file not in _pools:
+            _pools[db_file] = ConnectionPool(db_file)
+        return _pools[db_file]
+
+def insert_rows(conn, table, rows):
+    """Insere várias linhas (dicionários com as mesmas chaves) com um único executemany.
+
+    As colunas são ordenadas para que o mesmo conjunto de campos gere sempre o mesmo SQL
+    e reaproveite o comando já compilado no cache da conexão.
+    """
+    rows = list(rows)
+    if not rows:
+        return
+    columns = sorted(rows[0])
+    sql = f"INSERT INTO {table}({', '.join(columns)}) VALUES({','.join('?' * len(columns))})"
+    conn.executemany(sql, [tuple(row[column] for column in columns) for row in rows])
+
+def to_url_path(path):
+    """Caminho relativo a media/ com '/' como separador, no formato usado em /media/<path>."""
+    return path.replace('\\', '/') if path else path
+
+def insert_video(conn, video_data, variants=()):
+    """Insere o vídeo e suas variantes processadas; o commit fica com quem chama.
+
+    Os caminhos são normalizados aqui, uma única vez, para que as listagens não precisem
+    convertê-los a cada requisição.
+    """
+    video_data = {key: to_url_path(value) if key in PATH_COLUMNS['videos'] else value
+                  for key, value in video_data.items()}
+    variant_rows = [{"video_id": video_data['id'], "filter": variant['filter'],
+                     "path_processed": to_url_path(variant['path_processed']), "created_at": video_data['created_at'],
+                     "filter_params": variant.get('filter_params', '{}')}
+                    for variant in variants]
+    insert_rows(conn, 'videos', [video_data])
+    insert_rows(conn, 'video_variants', variant_rows)
+    prune_changes(conn)
+
+# --- Esquema e migrações ---
 def create_table(conn):
-    """Cria a tabela de vídeos se ela não existir."""
+    """Migração 1: tabelas de vídeos e de variantes, índices e caminhos com '/'.
+
+    Só usa comandos idempotentes porque também atualiza bancos criados antes das migrações
+    versionadas (user_version 0), que podem já ter parte do esquema.
+    """
     sql_create_videos_table = """
     CREATE TABLE IF NOT EXISTS videos (
         id TEXT PRIMARY KEY,
@@ -31,30 +169,211 @@ def create_table(conn):
         created_at TEXT NOT NULL,
         path_original TEXT NOT NULL,
         path_processed TEXT,
-        path_thumbnail TEXT  -- ADICIONADO: A coluna que faltava!
+        path_thumbnail TEXT,  -- ADICIONADO: A coluna que faltava!
+        content_hash TEXT,
+        path_hls TEXT
+    );
+    """
+    # Uma linha por variante processada (filtro ou cadeia de filtros) de cada vídeo.
+    # videos.filter/path_processed continuam apontando para a variante principal.
+    sql_create_variants_table = """
+    CREATE TABLE IF NOT EXISTS video_variants (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        video_id TEXT NOT NULL REFERENCES videos(id) ON DELETE CASCADE,
+        filter TEXT NOT NULL,
+        path_processed TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        filter_params TEXT NOT NULL DEFAULT '{}',
+        UNIQUE (video_id, filter)
+    );
+    """
+    sql_create_indexes = [
+        "CREATE INDEX IF NOT EXISTS idx_video_variants_video_id ON video_variants(video_id);",
+        # Usado pelo cache de uploads para achar vídeos com o mesmo conteúdo.
+        "CREATE INDEX IF NOT EXISTS idx_videos_content_hash ON videos(content_hash);",
+        # Paginação do /videos por (created_at, id) e filtros da listagem.
+        "CREATE INDEX IF NOT EXISTS idx_videos_created_at ON videos(created_at, id);",
+        "CREATE INDEX IF NOT EXISTS idx_videos_filter_created_at ON videos(filter, created_at, id);",
+        "CREATE INDEX IF NOT EXISTS idx_videos_original_name ON videos(original_name);",
+        "CREATE INDEX IF NOT EXISTS idx_video_variants_filter ON video_variants(filter);",
+    ]
+    c = conn.cursor()
+    c.execute(sql_create_videos_table)
+    c.execute(sql_create_variants_table)
+    # Bancos criados antes dessas colunas existirem
+    add_column_if_missing(conn, 'videos', 'content_hash', 'TEXT')
+    add_column_if_missing(conn, 'videos', 'path_hls', 'TEXT')
+    add_column_if_missing(conn, 'video_variants', 'filter_params', "TEXT NOT NULL DEFAULT '{}'")
+    for sql in sql_create_indexes:
+        c.execute(sql)
+    normalize_stored_paths(conn)
+
+def add_column_if_missing(conn, table, column, definition):
+    """Adiciona `column` a `table` se ela ainda não existir."""
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+# Colunas com caminhos relativos a media/; são gravadas sempre com '/' como separador.
+PATH_COLUMNS = {
+    'videos': ('path_original', 'path_processed', 'path_thumbnail', 'path_hls', 'path_sprite_vtt', 'path_preview'),
+    'video_variants': ('path_processed',),
+}
+
+def normalize_stored_paths(conn):
+    """Converte para '/' os caminhos gravados com '\\' por versões antigas no Windows."""
+    for table, columns in PATH_COLUMNS.items():
+        # Colunas de migrações posteriores ainda não existem quando a migração 1 roda.
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for column in (column for column in columns if column in existing):
+            conn.execute(f"UPDATE {table} SET {column} = REPLACE({column}, '\\', '/') "
+                         f"WHERE instr({column}, '\\') > 0")
+
+def add_thumbnail_columns(conn):
+    """Migração 2: miniaturas em vários tamanhos (JSON {largura: caminho}) e a sprite sheet."""
+    add_column_if_missing(conn, 'videos', 'thumbnails', "TEXT NOT NULL DEFAULT '{}'")
+    add_column_if_missing(conn, 'videos', 'path_sprite_vtt', 'TEXT')
+
+def add_change_log(conn):
+    """Migração 3: registro de alterações em `videos`, base do /videos/changes e do /events.
+
+    Os gatilhos gravam a alteração na mesma transação da escrita, então `seq` cresce na
+    ordem dos commits e nenhuma alteração fica de fora, venha de onde vier.
+    """
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS video_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        video_id TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        changed_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now'))
+    );
+    """)
+    for kind, event, row in (('insert', 'INSERT', 'NEW'), ('update', 'UPDATE', 'NEW'), ('delete', 'DELETE', 'OLD')):
+        conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_videos_{kind} AFTER {event} ON videos
+        BEGIN
+            INSERT INTO video_changes(video_id, kind) VALUES ({row}.id, '{kind}');
+        END;
+        """)
+
+def add_job_queue(conn):
+    """Migração 4: fila de processamento durável, atendida por worker.py (veja jobs.py).
+
+    `worker_id` e `lease_expires_at` identificam quem está com o job e até quando; um job
+    `running` com lease vencido é de um worker que morreu e volta para a fila.
+    """
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        video_id TEXT,
+        state TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL,
+        available_at REAL NOT NULL,
+        created_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL,
+        worker_id TEXT,
+        lease_expires_at REAL,
+        frames_done INTEGER NOT NULL DEFAULT 0,
+        frames_total INTEGER NOT NULL DEFAULT 0,
+        error TEXT,
+        result TEXT
+    );
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs(state, created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs(finished_at)")
+
+def add_artifacts(conn):
+    """Migração 5: arquivos derivados em disco (variantes, miniaturas, HLS) com o último
+    acesso, para a remoção por cota de storage.py. `path` é um arquivo ou uma pasta de media/."""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS artifacts (
+        path TEXT PRIMARY KEY,
+        video_id TEXT NOT NULL REFERENCES videos(id) ON DELETE CASCADE,
+        kind TEXT NOT NULL,
+        size_bytes INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        last_access_at REAL NOT NULL
     );
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_artifacts_last_access ON artifacts(last_access_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_artifacts_video_id ON artifacts(video_id)")
+
+def add_clip_columns(conn):
+    """Migração 6: vídeos que são um trecho do original. `clip` é o trecho pedido em JSON
+    ({"start", "end", "unit"}; NULL = vídeo inteiro) e `source_video_id` o vídeo de onde o
+    trecho foi recortado sem novo upload."""
+    add_column_if_missing(conn, 'videos', 'clip', 'TEXT')
+    add_column_if_missing(conn, 'videos', 'source_video_id', 'TEXT')
+
+def add_preview_column(conn):
+    """Migração 7: `path_preview` aponta para a prévia de baixa resolução enquanto a
+    renderização completa não termina (NULL depois dela, ou sem prévia)."""
+    add_column_if_missing(conn, 'videos', 'path_preview', 'TEXT')
+
+# Alterações mantidas no registro; clientes mais atrasados que isso recarregam a lista inteira.
+CHANGE_LOG_RETENTION = 10000
+
+def prune_changes(conn, keep=CHANGE_LOG_RETENTION):
+    conn.execute("DELETE FROM video_changes WHERE seq <= (SELECT MAX(seq) FROM video_changes) - ?", (keep,))
+
+def last_change_seq(conn):
+    return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM video_changes").fetchone()[0]
+
+# Cada migração recebe a conexão e roda dentro de uma transação (veja migrate); a posição
+# na lista é a versão do esquema gravada em PRAGMA user_version. Só acrescente ao final.
+MIGRATIONS = [
+    create_table,
+    add_thumbnail_columns,
+    add_change_log,
+    add_job_queue,
+    add_artifacts,
+    add_clip_columns,
+    add_preview_column,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def migrate(conn):
+    """Aplica as migrações pendentes no lugar e retorna (versão anterior, versão atual).
+
+    No modo padrão o sqlite3 do Python não abre transação para DDL, então cada migração
+    roda em um BEGIN IMMEDIATE explícito junto com a nova user_version: uma migração que
+    falha no meio é desfeita inteira. O lock de escrita também impede que dois processos
+    apliquem a mesma migração ao mesmo tempo.
     """
+    previous = conn.execute("PRAGMA user_version").fetchone()[0]
+    if previous > SCHEMA_VERSION:
+        raise RuntimeError(f"Banco na versão {previous}, mais nova que a suportada ({SCHEMA_VERSION})")
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Relida dentro da transação: outro processo pode ter migrado enquanto esperávamos o lock.
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version >= SCHEMA_VERSION:
+                conn.execute("COMMIT")
+                break
+            MIGRATIONS[version](conn)
+            conn.execute(f"PRAGMA user_version = {version + 1}")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    return previous, SCHEMA_VERSION
+
+def init_db(db_file=None):
+    """Cria o banco, se preciso, e aplica as migrações pendentes."""
+    conn = connect(db_file)
     try:
-        c = conn.cursor()
-        c.execute(sql_create_videos_table)
-    except sqlite3.Error as e:
-        print(e)
-
-def init_db():
-    """Inicializa o banco de dados e a tabela."""
-    conn = create_connection()
-    if conn is not None:
-        create_table(conn)
+        previous, current = migrate(conn)
+    finally:
         conn.close()
-        print("Banco de dados verificado/atualizado com sucesso.")
+    if previous == current:
+        print(f"Banco de dados verificado (versão {current}).")
     else:
-        print("Erro! Não foi possível criar a conexão com o banco de dados.")
+        print(f"Banco de dados atualizado da versão {previous} para a {current}.")
 
 if __name__ == '__main__':
-    # Primeiro, deletamos o DB antigo para garantir que a nova estrutura seja criada.
-    if os.path.exists(DB_FILE):
-        os.remove(DB_FILE)
-        print(f"Arquivo de banco de dados antigo '{DB_FILE}' removido.")
-        
-    print("Inicializando novo banco de dados...")
-    init_db()
\ No newline at end of file
+    # Atualiza o banco existente no lugar; os vídeos já cadastrados são preservados.
+    init_db()
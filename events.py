@@ -0,0 +1,36 @@
+# events.py
+import json
+import threading
+
+
+class ChangeNotifier:
+    """Acorda quem espera por novidades (ex.: conexões do /events) após cada escrita.
+
+    Guarda só um contador de versão: quem acorda consulta o que mudou no banco, então uma
+    notificação perdida ou repetida nunca perde nem duplica alterações.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self.version = 0
+
+    def notify(self):
+        with self._condition:
+            self.version += 1
+            self._condition.notify_all()
+
+    def wait(self, version, timeout=None):
+        """Espera a versão passar de `version` (ou o timeout) e retorna a versão atual."""
+        with self._condition:
+            self._condition.wait_for(lambda: self.version != version, timeout=timeout)
+            return self.version
+
+
+def format_sse(event, data, event_id=None):
+    """Formata uma mensagem Server-Sent Events com `data` em JSON."""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
@@ -0,0 +1,289 @@
+# filters.py
+import json
+from functools import partial
+import cv2
+import numpy as np
+
+# --- Tipos de filtro ---
+# pointwise: cada pixel de saída depende só do pixel de entrada (vira matriz de cor/LUT)
+# channel-reducing: também pontual, mas reduz BGR para um único canal
+# spatial: depende da vizinhança do pixel (não pode ser fundido)
+POINTWISE = 'pointwise'
+CHANNEL_REDUCING = 'channel-reducing'
+SPATIAL = 'spatial'
+
+CHAIN_SEPARATOR = ','
+
+def filter_kind(kind, color_matrix=None, gray_output=None):
+    """Declara o tipo do filtro e, para filtros pontuais, a matriz afim 3x4 (BGR -> BGR)
+    equivalente, usada pelo planejador de cadeias para fundir estágios. `gray_output`
+    indica que o resultado tem um só canal (padrão: só os channel-reducing)."""
+    def decorate(func):
+        func.kind = kind
+        func.color_matrix = None if color_matrix is None else np.asarray(color_matrix, dtype=np.float32)
+        func.gray_output = kind == CHANNEL_REDUCING if gray_output is None else gray_output
+        return func
+    return decorate
+
+class FrameBuffers:
+    """Arrays reaproveitados de um frame para o outro, um por chave.
+
+    O primeiro pedido de cada chave aloca o array com o tamanho do frame; os seguintes
+    devolvem o mesmo array, então o laço de frames não aloca nada depois do primeiro.
+    Cada thread do processamento usa o seu: o conteúdo só vale até o próximo pedido da
+    mesma chave. `allocations` conta os arrays criados; com `reuse` desligado, todo pedido
+    aloca um array novo (o comportamento sem buffers, para comparação).
+    """
+
+    def __init__(self, reuse=True):
+        self.reuse = reuse
+        self.allocations = 0
+        self._arrays = {}
+
+    def get(self, key, shape, dtype=np.uint8):
+        array = self._arrays.get(key)
+        if array is None or array.shape != shape or array.dtype != dtype:
+            array = np.empty(shape, dtype)
+            if self.reuse:
+                self._arrays[key] = array
+            self.allocations += 1
+        return array
+
+def _scratch(buffers, key, shape):
+    return buffers.get(key, shape) if buffers is not None else None
+
+# Pesos de cv2.COLOR_BGR2GRAY replicados nos três canais de saída.
+GRAYSCALE_MATRIX = [[0.114, 0.587, 0.299, 0]] * 3
+SEPIA_KERNEL = np.array([[0.272, 0.534, 0.131],
+                         [0.349, 0.686, 0.168],
+                         [0.393, 0.769, 0.189]], dtype=np.float32)
+INVERT_MATRIX = [[-1, 0, 0, 255], [0, -1, 0, 255], [0, 0, -1, 255]]
+
+# --- Filtros ---
+# Todo filtro aceita `dst`, o array de saída (do tamanho do frame, com um canal se
+# gray_output), e `buffers`, um FrameBuffers para os intermediários. Sem eles, cada chamada
+# aloca seus próprios arrays.
+
+@filter_kind(CHANNEL_REDUCING, GRAYSCALE_MATRIX)
+def filter_grayscale(frame, dst=None, buffers=None):
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=dst)
+
+@filter_kind(SPATIAL, gray_output=True)
+def filter_canny_edge(frame, dst=None, buffers=None):
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=_scratch(buffers, 'canny_gray', frame.shape[:2]))
+    return cv2.Canny(gray, 100, 200, edges=dst)
+
+@filter_kind(POINTWISE, np.hstack([SEPIA_KERNEL, np.zeros((3, 1), dtype=np.float32)]))
+def filter_sepia(frame, dst=None, buffers=None):
+    # Com entrada uint8 o cv2.transform já satura o resultado em 255.
+    return cv2.transform(frame, SEPIA_KERNEL, dst=dst)
+
+@filter_kind(SPATIAL)
+def filter_pixelate(frame, pixel_size=12, dst=None, buffers=None):
+    h, w = frame.shape[:2]
+    # Blocos maiores que o frame viram um único bloco.
+    small_size = (max(w // pixel_size, 1), max(h // pixel_size, 1))
+    temp = cv2.resize(frame, small_size, dst=_scratch(buffers, 'pixelate_small', small_size[::-1] + frame.shape[2:]),
+                      interpolation=cv2.INTER_LINEAR)
+    return cv2.resize(temp, (w, h), dst=dst, interpolation=cv2.INTER_NEAREST)
+
+@filter_kind(POINTWISE, INVERT_MATRIX)
+def filter_invert(frame, dst=None, buffers=None):
+    return cv2.bitwise_not(frame, dst=dst)
+
+FILTERS = {
+    'grayscale': filter_grayscale,
+    'canny': filter_canny_edge,
+    'sepia': filter_sepia,
+    'pixelate': filter_pixelate,
+    'invert': filter_invert
+}
+
+# Parâmetros ajustáveis pelo cliente: {filtro: {parâmetro: (tipo, mínimo, máximo)}}. `dst`
+# e `buffers` são internos e nunca entram aqui.
+FILTER_PARAMS = {
+    'pixelate': {'pixel_size': (int, 1, 256)},
+}
+
+# --- Cadeias de filtros ---
+
+def parse_filter_spec(spec):
+    """Converte 'sepia,pixelate,invert' em uma lista de nomes, validando cada um.
+
+    Levanta ValueError se a cadeia estiver vazia ou tiver um filtro desconhecido.
+    """
+    names = [name.strip() for name in (spec or '').split(CHAIN_SEPARATOR)]
+    if not names or any(not name for name in names):
+        raise ValueError("Cadeia de filtros vazia")
+    unknown = [name for name in names if name not in FILTERS]
+    if unknown:
+        raise ValueError(f"Filtro inválido: {', '.join(unknown)}")
+    return names
+
+def normalize_filter_spec(spec):
+    return CHAIN_SEPARATOR.join(parse_filter_spec(spec))
+
+def parse_filter_params(raw):
+    """Valida parâmetros no formato {"pixelate": {"pixel_size": 8}}.
+
+    Aceita um dicionário ou o JSON correspondente; só são permitidos os parâmetros de
+    FILTER_PARAMS, com o tipo e dentro dos limites declarados. Levanta ValueError.
+    """
+    if not raw:
+        return {}
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except json.JSONDecodeError:
+            raise ValueError("Parâmetros de filtro não são um JSON válido")
+    if not isinstance(raw, dict):
+        raise ValueError("Parâmetros de filtro devem ser um objeto")
+
+    params = {}
+    for name, kwargs in raw.items():
+        if name not in FILTERS:
+            raise ValueError(f"Filtro inválido: {name}")
+        if not isinstance(kwargs, dict):
+            raise ValueError(f"Parâmetros de '{name}' devem ser um objeto")
+        accepted = FILTER_PARAMS.get(name, {})
+        for key, value in kwargs.items():
+            if key not in accepted:
+                raise ValueError(f"Parâmetro desconhecido para '{name}': {key}")
+            kind, minimum, maximum = accepted[key]
+            # bool é subclasse de int; float inteiro (8.0) não passa em um parâmetro int.
+            if isinstance(value, bool) or not isinstance(value, (int, float) if kind is float else kind):
+                raise ValueError(f"'{name}.{key}' deve ser {'um inteiro' if kind is int else 'um número'}")
+            if not minimum <= value <= maximum:
+                raise ValueError(f"'{name}.{key}' deve estar entre {minimum} e {maximum}")
+        if kwargs:
+            params[name] = dict(kwargs)
+    return params
+
+def params_key(spec, params):
+    """JSON canônico dos parâmetros que afetam `spec`; usado como chave do cache de resultados."""
+    names = parse_filter_spec(spec)
+    relevant = {name: params[name] for name in sorted(set(names)) if name in (params or {})}
+    return json.dumps(relevant, sort_keys=True, separators=(',', ':'))
+
+def _is_range_preserving(matrix):
+    """True se a transformação nunca sai de [0, 255] para entradas em [0, 255]."""
+    coefficients, offset = matrix[:, :3], matrix[:, 3]
+    upper = 255 * np.clip(coefficients, 0, None).sum(axis=1) + offset
+    lower = 255 * np.clip(coefficients, None, 0).sum(axis=1) + offset
+    return bool(np.all(upper <= 255 + 1e-3) and np.all(lower >= -1e-3))
+
+def _is_channel_flip(matrix):
+    """True se a transformação é, canal a canal, identidade ou inversão (x -> 255 - x).
+
+    Essas transformações comutam com a saturação, então podem ser fundidas mesmo depois
+    de um estágio que extrapola [0, 255]."""
+    coefficients, offset = matrix[:, :3], matrix[:, 3]
+    diagonal = np.diag(coefficients)
+    if not np.allclose(coefficients, np.diag(diagonal)):
+        return False
+    return all((a == 1 and b == 0) or (a == -1 and b == 255) for a, b in zip(diagonal, offset))
+
+def _compose(first, second):
+    """Matriz afim equivalente a aplicar `first` e depois `second`."""
+    first_h = np.vstack([first, [0, 0, 0, 1]])
+    return (second @ first_h).astype(np.float32)
+
+class ColorTransform:
+    """Estágio pontual fundido: uma única passada com cv2.transform (saturação em uint8)
+    ou, se a matriz não mistura canais, uma LUT de 256 entradas por canal."""
+
+    def __init__(self, matrix):
+        self.matrix = np.asarray(matrix, dtype=np.float32)
+        self.lut = None
+        coefficients, offset = self.matrix[:, :3], self.matrix[:, 3]
+        if np.allclose(coefficients, np.diag(np.diag(coefficients))):
+            levels = np.arange(256, dtype=np.float32)[:, None]
+            table = np.clip(np.rint(levels * np.diag(coefficients) + offset), 0, 255).astype(np.uint8)
+            self.lut = table.reshape(256, 1, 3)
+
+    def is_identity(self):
+        return np.allclose(self.matrix, np.hstack([np.eye(3), np.zeros((3, 1))]))
+
+    def __call__(self, frame, dst=None, buffers=None):
+        if self.lut is not None:
+            return cv2.LUT(frame, self.lut, dst=dst)
+        return cv2.transform(frame, self.matrix, dst=dst)
+
+def _bind(name, params):
+    kwargs = (params or {}).get(name)
+    return partial(FILTERS[name], **kwargs) if kwargs else FILTERS[name]
+
+def plan_filter_chain(names, params=None):
+    """Agrupa estágios pontuais consecutivos em um único ColorTransform.
+
+    Dois estágios A -> B são fundidos quando a saturação entre eles não muda o resultado:
+    A nunca sai de [0, 255] ou B é identidade/inversão canal a canal. Filtros isolados são
+    mantidos como estão para que o resultado seja idêntico ao do filtro sozinho.
+    """
+    groups = []
+    for name in names:
+        func = FILTERS[name]
+        previous = groups[-1] if groups else None
+        if (func.color_matrix is not None and previous is not None and previous['matrix'] is not None
+                and (_is_range_preserving(previous['matrix']) or _is_channel_flip(func.color_matrix))):
+            previous['matrix'] = _compose(previous['matrix'], func.color_matrix)
+            previous['names'].append(name)
+        else:
+            groups.append({'names': [name], 'matrix': func.color_matrix})
+
+    stages = []
+    for group in groups:
+        if len(group['names']) == 1:
+            stages.append(_bind(group['names'][0], params))
+            continue
+        transform = ColorTransform(group['matrix'])
+        if not transform.is_identity():
+            stages.append(transform)
+    return stages
+
+def is_gray_output(filter_func):
+    """True se o filtro (ou cadeia) devolve um frame de um só canal."""
+    return getattr(getattr(filter_func, 'func', filter_func), 'gray_output', False)
+
+class FilterChain:
+    """Aplica vários filtros em sequência sobre o mesmo frame, numa única decodificação."""
+
+    def __init__(self, names, params=None):
+        self.names = list(names)
+        self.stages = plan_filter_chain(self.names, params)
+        self.gray_output = bool(self.stages) and is_gray_output(self.stages[-1])
+
+    def __call__(self, frame, dst=None, buffers=None):
+        # Os intermediários ficam em `buffers`, com chaves próprias desta cadeia.
+        size = frame.shape[:2]
+        for i, stage in enumerate(self.stages):
+            if frame.ndim == 2:
+                frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR, dst=_scratch(buffers, (id(self), i, 'bgr'), size + (3,)))
+            if i == len(self.stages) - 1:
+                stage_dst = dst
+            else:
+                stage_dst = _scratch(buffers, (id(self), i), size if is_gray_output(stage) else size + (3,))
+            frame = stage(frame, dst=stage_dst, buffers=buffers)
+        return frame
+
+    def __repr__(self):
+        return f"FilterChain({CHAIN_SEPARATOR.join(self.names)!r})"
+
+def filter_to_bgr(filter_func, frame, dst=None, buffers=None):
+    """Aplica o filtro e devolve o resultado em BGR, como o VideoWriter espera.
+
+    Com `dst` (BGR do tamanho do frame) e `buffers`, nada é alocado: um resultado de um
+    canal vai para um buffer de `buffers` e é convertido direto em `dst`.
+    """
+    if is_gray_output(filter_func):
+        gray = filter_func(frame, dst=_scratch(buffers, 'gray_output', frame.shape[:2]), buffers=buffers)
+        return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR, dst=dst)
+    return filter_func(frame, dst=dst, buffers=buffers)
+
+def build_filter(spec, params=None):
+    """Retorna a função de filtro para um nome ('sepia') ou uma cadeia ('sepia,pixelate'),
+    com os parâmetros de `params` (veja parse_filter_params) já aplicados."""
+    names = parse_filter_spec(spec)
+    if len(names) == 1:
+        return _bind(names[0], params)
+    return FilterChain(names, params)
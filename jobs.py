@@ -0,0 +1,201 @@
+# jobs.py
+import json
+import time
+import uuid
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+# Job de um vídeo apagado (veja cancel_jobs): terminal, sem novas tentativas.
+JOB_CANCELLED = 'cancelled'
+
+# Um worker que não renovar o lease por LEASE_SEC segundos é considerado morto e o job
+# volta para a fila; o heartbeat renova (e publica o progresso) a cada HEARTBEAT_SEC.
+LEASE_SEC = 30
+HEARTBEAT_SEC = 2
+# Tentativas por job (contando a primeira) e espera antes de cada nova tentativa, multiplicada
+# pelo número de tentativas já feitas.
+MAX_ATTEMPTS = 3
+RETRY_DELAY_SEC = 5
+# Jobs terminados mantidos na tabela para o /jobs.
+JOB_HISTORY_LIMIT = 500
+
+# Colunas devolvidas pelo /jobs; o payload fica de fora por ser grande e interno.
+JOB_COLUMNS = ('id', 'video_id', 'state', 'attempts', 'max_attempts', 'worker_id', 'created_at', 'started_at',
+               'finished_at', 'frames_done', 'frames_total', 'error', 'result')
+
+
+class QueueFullError(Exception):
+    """Levantada quando a fila de processamento atingiu o limite configurado."""
+
+
+class LeaseLostError(Exception):
+    """O lease do job expirou e ele pode ter sido assumido por outro worker."""
+
+
+# --- Fila (lado do servidor) ---
+
+def enqueue_job(conn, payload, max_pending, max_attempts=MAX_ATTEMPTS):
+    """Grava um job na fila e devolve seu id; levanta QueueFullError com `max_pending` jobs esperando.
+
+    O commit fica com quem chama, para que o job entre na mesma transação que o criou.
+    """
+    queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE state = ?", (JOB_QUEUED,)).fetchone()[0]
+    if queued >= max_pending:
+        raise QueueFullError()
+    job_id = str(uuid.uuid4())
+    now = time.time()
+    conn.execute(""" INSERT INTO jobs(id, video_id, state, payload, max_attempts, available_at, created_at)
+                     VALUES (?, ?, ?, ?, ?, ?, ?) """,
+                 (job_id, payload.get('video_id'), JOB_QUEUED, json.dumps(payload), max_attempts, now, now))
+    prune_jobs(conn)
+    return job_id
+
+def prune_jobs(conn, keep=JOB_HISTORY_LIMIT):
+    conn.execute(""" DELETE FROM jobs WHERE finished_at IS NOT NULL AND id NOT IN (
+                         SELECT id FROM jobs WHERE finished_at IS NOT NULL ORDER BY finished_at DESC LIMIT ?) """,
+                 (keep,))
+
+def cancel_jobs(conn, video_id, error="Vídeo apagado"):
+    """Cancela os jobs na fila e em execução de `video_id` e retorna quantos foram cancelados.
+
+    O commit fica com quem chama, para que o cancelamento entre na mesma transação que apaga
+    o vídeo. O worker que estiver com um deles perde o lease: o heartbeat, write_if_leased
+    e complete_job passam a falhar com LeaseLostError e nada mais é publicado.
+    """
+    cursor = conn.execute(""" UPDATE jobs SET state = ?, finished_at = ?, error = ?, lease_expires_at = NULL
+                              WHERE video_id = ? AND state IN (?, ?) """,
+                          (JOB_CANCELLED, time.time(), error, video_id, JOB_QUEUED, JOB_RUNNING))
+    return cursor.rowcount
+
+def get_job(conn, job_id):
+    """Retorna um snapshot do job com percentual concluído e ETA, ou None."""
+    row = conn.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return describe_job(row) if row is not None else None
+
+def list_jobs(conn):
+    rows = conn.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs ORDER BY created_at").fetchall()
+    return [describe_job(row) for row in rows]
+
+def count_jobs(conn):
+    """Retorna {estado: quantidade} dos jobs na fila e em execução."""
+    rows = conn.execute("SELECT state, COUNT(*) FROM jobs WHERE state IN (?, ?) GROUP BY state",
+                        (JOB_QUEUED, JOB_RUNNING)).fetchall()
+    return {JOB_QUEUED: 0, JOB_RUNNING: 0, **{state: count for state, count in rows}}
+
+def describe_job(row):
+    job = dict(row)
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    done, total = job['frames_done'], job['frames_total']
+    job['percent'] = None
+    job['eta_sec'] = None
+
+    if job['state'] == JOB_DONE:
+        job['percent'] = 100.0
+        job['eta_sec'] = 0
+    elif job['state'] == JOB_RUNNING and total > 0:
+        job['percent'] = round(min(done / total, 1.0) * 100, 1)
+        elapsed = time.time() - job['started_at']
+        if done > 0 and elapsed > 0:
+            job['eta_sec'] = round(max(total - done, 0) * elapsed / done, 1)
+    return job
+
+# --- Lease (lado do worker) ---
+# Cada função é um único UPDATE: o SQLite serializa as escritas, então dois workers nunca
+# assumem o mesmo job, e as condições em worker_id/state descartam escritas de quem perdeu o lease.
+
+def claim_job(conn, worker_id, lease_sec=LEASE_SEC):
+    """Assume o job mais antigo disponível na fila e devolve a linha (com o payload), ou None."""
+    now = time.time()
+    with conn:
+        return conn.execute(""" UPDATE jobs SET state = ?, worker_id = ?, attempts = attempts + 1,
+                                    lease_expires_at = ?, started_at = ?, frames_done = 0, frames_total = 0
+                                WHERE id = (SELECT id FROM jobs WHERE state = ? AND available_at <= ?
+                                            ORDER BY created_at LIMIT 1)
+                                RETURNING * """,
+                            (JOB_RUNNING, worker_id, now + lease_sec, now, JOB_QUEUED, now)).fetchone()
+
+def heartbeat_job(conn, job_id, worker_id, frames_done, frames_total, lease_sec=LEASE_SEC):
+    """Renova o lease e publica o progresso; retorna False se o lease já não é deste worker."""
+    with conn:
+        cursor = conn.execute(""" UPDATE jobs SET lease_expires_at = ?, frames_done = ?, frames_total = ?
+                                  WHERE id = ? AND worker_id = ? AND state = ? """,
+                              (time.time() + lease_sec, frames_done, frames_total, job_id, worker_id, JOB_RUNNING))
+    return cursor.rowcount == 1
+
+def complete_job(conn, job_id, worker_id, result, write=None):
+    """Marca o job como concluído e chama `write(conn)` na mesma transação.
+
+    Assim o vídeo (ou, se já publicado com a prévia, sua versão final) só aparece no banco
+    junto com o fim do job. Levanta LeaseLostError (sem
+    gravar nada) se o lease já não for deste worker.
+    """
+    with conn:
+        cursor = conn.execute(""" UPDATE jobs SET state = ?, finished_at = ?, result = ?, error = NULL,
+                                      lease_expires_at = NULL, frames_done = frames_total
+                                  WHERE id = ? AND worker_id = ? AND state = ? """,
+                              (JOB_DONE, time.time(), json.dumps(result), job_id, worker_id, JOB_RUNNING))
+        if cursor.rowcount != 1:
+            raise LeaseLostError(job_id)
+        if write is not None:
+            write(conn)
+
+def write_if_leased(conn, job_id, worker_id, write):
+    """Chama `write(conn)` em uma transação só se o job ainda estiver com este worker.
+
+    Para resultados parciais publicados antes do fim (ex.: a prévia do vídeo). Levanta
+    LeaseLostError sem gravar nada se o lease já não for deste worker ou se o job foi
+    cancelado (veja cancel_jobs).
+    """
+    with conn:
+        # O UPDATE (que não muda nada) abre a transação de escrita: o lease não troca de dono
+        # entre a verificação e `write`.
+        cursor = conn.execute("UPDATE jobs SET worker_id = worker_id WHERE id = ? AND worker_id = ? AND state = ?",
+                              (job_id, worker_id, JOB_RUNNING))
+        if cursor.rowcount != 1:
+            raise LeaseLostError(job_id)
+        write(conn)
+
+def fail_job(conn, job_id, worker_id, error):
+    """Devolve o job à fila para nova tentativa ou, esgotadas as tentativas, marca como falho.
+
+    Retorna o novo estado, ou None se o lease já não for deste worker.
+    """
+    now = time.time()
+    with conn:
+        row = conn.execute(""" UPDATE jobs SET
+                                   state = CASE WHEN attempts >= max_attempts THEN ? ELSE ? END,
+                                   finished_at = CASE WHEN attempts >= max_attempts THEN ? END,
+                                   available_at = ? + ? * attempts,
+                                   error = ?, worker_id = NULL, lease_expires_at = NULL
+                               WHERE id = ? AND worker_id = ? AND state = ?
+                               RETURNING state """,
+                           (JOB_FAILED, JOB_QUEUED, now, now, RETRY_DELAY_SEC, error,
+                            job_id, worker_id, JOB_RUNNING)).fetchone()
+    return row['state'] if row is not None else None
+
+def release_job(conn, job_id, worker_id):
+    """Devolve à fila, sem contar a tentativa, um job interrompido pelo desligamento do worker."""
+    with conn:
+        conn.execute(""" UPDATE jobs SET state = ?, attempts = attempts - 1, worker_id = NULL,
+                             lease_expires_at = NULL, available_at = ?
+                         WHERE id = ? AND worker_id = ? AND state = ? """,
+                     (JOB_QUEUED, time.time(), job_id, worker_id, JOB_RUNNING))
+
+def recover_expired_jobs(conn):
+    """Devolve à fila (ou marca como falhos, sem tentativas restantes) os jobs com lease vencido.
+
+    Retorna as linhas recuperadas, com o novo estado e o payload, para a limpeza dos arquivos.
+    """
+    now = time.time()
+    with conn:
+        return conn.execute(""" UPDATE jobs SET
+                                     state = CASE WHEN attempts >= max_attempts THEN ? ELSE ? END,
+                                     finished_at = CASE WHEN attempts >= max_attempts THEN ? END,
+                                     available_at = ?,
+                                     error = 'Lease expirado (worker ' || worker_id || ' parou de responder)',
+                                     worker_id = NULL, lease_expires_at = NULL
+                                 WHERE state = ? AND lease_expires_at < ?
+                                 RETURNING id, state, attempts, payload """,
+                             (JOB_FAILED, JOB_QUEUED, now, now, JOB_RUNNING, now)).fetchall()
@@ -0,0 +1,187 @@
+# metrics.py
+import json
+import math
+import time
+import uuid
+import logging
+import threading
+
+# Limites (em segundos) dos histogramas de duração de estágios e de consultas ao banco.
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+FPS_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+# Uma linha JSON por requisição ou job rastreado, no stderr, independente da configuração do logging.
+trace_logger = logging.getLogger("sdt3.trace")
+if not trace_logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    trace_logger.addHandler(_handler)
+    trace_logger.setLevel(logging.INFO)
+    trace_logger.propagate = False
+
+
+class _NullTimer:
+    """Timer usado quando não há nada a medir: entrar e sair não custa nada."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    def __init__(self, metrics, name, labels, trace, trace_key):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+        self.trace = trace
+        self.trace_key = trace_key
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        if self.metrics.enabled:
+            self.metrics.observe(self.name, seconds, **self.labels)
+        if self.trace is not None:
+            self.trace.add(self.trace_key, seconds)
+        return False
+
+
+class Metrics:
+    """Contadores, histogramas e gauges exportados no formato texto do Prometheus.
+
+    As métricas são declaradas uma vez (counter/histogram/gauge) e atualizadas com inc,
+    observe e timer, de qualquer thread. Com `enabled` falso, inc/observe retornam de
+    imediato e timer devolve um objeto vazio, então a instrumentação pode ficar no código.
+    """
+
+    def __init__(self, enabled=True, prefix="sdt3_"):
+        self.enabled = enabled
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._meta = {}
+        self._values = {}
+
+    # --- Declaração ---
+
+    def counter(self, name, help_text):
+        self._meta[name] = {"type": "counter", "help": help_text}
+
+    def histogram(self, name, help_text, buckets):
+        self._meta[name] = {"type": "histogram", "help": help_text, "buckets": tuple(buckets)}
+
+    def gauge(self, name, help_text, collect):
+        """`collect()` é chamada a cada leitura do /metrics e retorna um número ou
+        uma lista de (labels, valor)."""
+        self._meta[name] = {"type": "gauge", "help": help_text, "collect": collect}
+
+    # --- Atualização ---
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        buckets = self._meta[name]['buckets']
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = {"counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    series['counts'][i] += 1
+                    break
+            series['sum'] += value
+            series['count'] += 1
+
+    def timer(self, name, trace=None, trace_key=None, **labels):
+        """Mede o bloco `with` no histograma `name` e, se houver `trace`, em trace[trace_key]."""
+        if not self.enabled and trace is None:
+            return _NULL_TIMER
+        return _Timer(self, name, labels, trace, trace_key)
+
+    # --- Exportação ---
+
+    def render(self):
+        with self._lock:
+            values = {key: (dict(value, counts=list(value['counts'])) if isinstance(value, dict) else value)
+                      for key, value in self._values.items()}
+        series = {}
+        for (name, labels), value in values.items():
+            series.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for name, meta in sorted(self._meta.items()):
+            full_name = self.prefix + name + ('_total' if meta['type'] == 'counter' else '')
+            lines.append(f"# HELP {full_name} {meta['help']}")
+            lines.append(f"# TYPE {full_name} {meta['type']}")
+            if meta['type'] == 'gauge':
+                collected = meta['collect']()
+                if not isinstance(collected, list):
+                    collected = [({}, collected)]
+                for labels, value in collected:
+                    lines.append(f"{full_name}{_format_labels(sorted(labels.items()))} {_format_value(value)}")
+            elif meta['type'] == 'counter':
+                for labels, value in sorted(series.get(name, [])):
+                    lines.append(f"{full_name}{_format_labels(labels)} {_format_value(value)}")
+            else:
+                for labels, value in sorted(series.get(name, []), key=lambda item: item[0]):
+                    cumulative = 0
+                    for bound, count in zip(meta['buckets'], value['counts']):
+                        cumulative += count
+                        lines.append(f"{full_name}_bucket{_format_labels(labels + (('le', _format_value(bound)),))} "
+                                     f"{cumulative}")
+                    lines.append(f"{full_name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {value['count']}")
+                    lines.append(f"{full_name}_sum{_format_labels(labels)} {_format_value(value['sum'])}")
+                    lines.append(f"{full_name}_count{_format_labels(labels)} {value['count']}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(value)
+
+
+class Trace:
+    """Durações por estágio de uma requisição ou de um job, emitidas como uma linha JSON."""
+
+    def __init__(self, trace_id=None):
+        self.id = trace_id or uuid.uuid4().hex[:16]
+        self.start = time.perf_counter()
+        self.stages = {}
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def emit(self, event, **fields):
+        record = {"event": event, "trace_id": self.id, **fields,
+                  "duration_ms": round((time.perf_counter() - self.start) * 1000, 2),
+                  "stages_ms": {stage: round(seconds * 1000, 2) for stage, seconds in self.stages.items()}}
+        trace_logger.info(json.dumps(record))
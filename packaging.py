@@ -0,0 +1,80 @@
+# packaging.py
+import os
+import math
+import shutil
+import subprocess
+
+# Escada de resoluções do HLS: (altura, bitrate de vídeo). Só entram as que não
+# ultrapassam a altura do vídeo de origem.
+HLS_RENDITIONS = [
+    (1080, '5000k'),
+    (720, '2800k'),
+    (360, '800k'),
+]
+# Duração alvo de cada segmento, em segundos.
+HLS_SEGMENT_SEC = 4
+HLS_MASTER_NAME = "master.m3u8"
+
+
+def ffmpeg_available():
+    return shutil.which('ffmpeg') is not None
+
+
+def select_renditions(source_height, renditions=HLS_RENDITIONS):
+    """Resoluções da escada que cabem no vídeo de origem (no mínimo a menor delas)."""
+    selected = [(height, bitrate) for height, bitrate in renditions if height <= source_height]
+    if not selected:
+        height, bitrate = min(renditions)
+        selected = [(min(height, source_height - source_height % 2), bitrate)]
+    return selected
+
+
+def build_hls_command(ffmpeg, input_path, output_dir, fps, renditions, segment_sec=HLS_SEGMENT_SEC):
+    """Monta a linha de comando do ffmpeg que gera todas as resoluções em uma única passada.
+
+    Os keyframes são forçados a cada `segment_sec` segundos em todas as resoluções, para que
+    os segmentos fiquem alinhados e o player possa trocar de qualidade entre eles.
+    """
+    gop = max(1, int(math.ceil(fps * segment_sec)))
+    split = f"[0:v]split={len(renditions)}" + "".join(f"[v{i}]" for i in range(len(renditions)))
+    scales = [f"[v{i}]scale=-2:{height}[v{i}out]" for i, (height, _) in enumerate(renditions)]
+    command = [ffmpeg, '-y', '-loglevel', 'error', '-i', input_path,
+               '-filter_complex', ";".join([split] + scales)]
+    for i, (height, bitrate) in enumerate(renditions):
+        command += ['-map', f"[v{i}out]", f"-c:v:{i}", 'libx264', f"-b:v:{i}", bitrate,
+                    f"-maxrate:v:{i}", bitrate, f"-bufsize:v:{i}", bitrate]
+    command += ['-preset', 'veryfast', '-pix_fmt', 'yuv420p',
+                '-g', str(gop), '-keyint_min', str(gop), '-sc_threshold', '0',
+                '-f', 'hls', '-hls_time', str(segment_sec), '-hls_playlist_type', 'vod',
+                '-hls_segment_filename', os.path.join(output_dir, '%v_%05d.ts'),
+                '-master_pl_name', HLS_MASTER_NAME,
+                '-var_stream_map', " ".join(f"v:{i},name:{height}p" for i, (height, _) in enumerate(renditions)),
+                os.path.join(output_dir, '%v.m3u8')]
+    return command
+
+
+def package_hls(input_path, output_dir, fps, source_height):
+    """Gera a escada HLS de `input_path` em `output_dir` e devolve o caminho do master playlist.
+
+    Os arquivos são gerados em um diretório temporário e só aparecem em `output_dir` quando
+    completos, então um master.m3u8 existente nunca aponta para segmentos pela metade.
+    Levanta RuntimeError se o ffmpeg não estiver instalado ou falhar.
+    """
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        raise RuntimeError("ffmpeg não encontrado no PATH")
+
+    temp_dir = output_dir + '.tmp'
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    os.makedirs(temp_dir)
+    renditions = select_renditions(source_height)
+
+    command = build_hls_command(ffmpeg, input_path, temp_dir, fps or 30, renditions)
+    result = subprocess.run(command, capture_output=True)
+    if result.returncode != 0:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise RuntimeError(f"ffmpeg falhou ao gerar o HLS: {result.stderr.decode(errors='replace')}")
+
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.replace(temp_dir, output_dir)
+    return os.path.join(output_dir, HLS_MASTER_NAME)
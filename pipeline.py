@@ -0,0 +1,225 @@
+# pipeline.py
+import time
+import queue
+import threading
+from collections import deque
+import cv2
+import numpy as np
+from filters import FrameBuffers, filter_to_bgr
+
+# Estágios medidos pelo pipeline; cada um acumula tempo ocupado (busy) e ocioso (idle).
+STAGES = ('read', 'filter', 'write')
+
+_END = object()
+
+
+def new_stage_stats():
+    """Cria o dicionário de estatísticas por estágio preenchido por run_pipeline.
+
+    `allocations` conta os arrays de frame criados pelo laço (leitura, saídas e intermediários).
+    """
+    stats = {stage: {"busy_sec": 0.0, "idle_sec": 0.0, "threads": 1} for stage in STAGES}
+    stats['allocations'] = 0
+    return stats
+
+
+def merge_stage_stats(target, other):
+    """Soma as estatísticas de `other` em `target` (ex.: vindas de vários segmentos)."""
+    for stage in STAGES:
+        target[stage]['busy_sec'] += other[stage]['busy_sec']
+        target[stage]['idle_sec'] += other[stage]['idle_sec']
+        target[stage]['threads'] = max(target[stage]['threads'], other[stage]['threads'])
+    target['allocations'] += other['allocations']
+    return target
+
+
+def frame_shape(cap):
+    """Formato (altura, largura, 3) dos frames BGR de `cap`, para alocar os buffers de leitura."""
+    return int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), 3
+
+
+def bottleneck(stats):
+    """Retorna o estágio com maior tempo ocupado por thread."""
+    return max(STAGES, key=lambda stage: stats[stage]['busy_sec'] / stats[stage]['threads'])
+
+
+class FramePool:
+    """Arrays de frame devolvidos depois de gravados e reaproveitados pelos frames seguintes.
+
+    Só aloca quando não há array livre, então cresce até o número de frames realmente em
+    voo, não até o limite. Seguro entre threads; com `reuse` desligado, nunca reaproveita.
+    """
+
+    def __init__(self, reuse=True):
+        self.reuse = reuse
+        self.allocations = 0
+        self._free = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self, shape):
+        try:
+            array = self._free.pop()
+            if array.shape == shape:
+                return array
+        except IndexError:
+            pass
+        with self._lock:
+            self.allocations += 1
+        return np.empty(shape, np.uint8)
+
+    def release(self, arrays):
+        if self.reuse:
+            self._free.extend(arrays)
+
+
+class _Stage:
+    """Acumula o tempo ocupado/ocioso de uma thread; os totais são somados no final."""
+
+    def __init__(self):
+        self.busy = 0.0
+        self.idle = 0.0
+
+
+def run_pipeline(cap, outs, filter_funcs, threads=2, max_in_flight=16, max_frames=None, on_frame=None, stats=None,
+                 on_decode=None, reuse_buffers=True):
+    """Decodifica, filtra e grava frames em estágios paralelos ligados por filas limitadas.
+
+    Uma thread lê os frames de `cap`, `threads` threads aplicam cada `filter_funcs[i]` ao
+    frame e uma thread grava cada resultado em `outs[i]` na ordem original. No máximo
+    `max_in_flight` frames ficam em memória ao mesmo tempo (lidos e ainda não gravados). O
+    OpenCV libera o GIL em read, nos filtros e em write, então os estágios se sobrepõem de
+    verdade. `on_decode(índice, frame)`, se informado, é chamado pela thread de leitura com
+    cada frame decodificado, antes dos filtros. Retorna o número de frames gravados.
+
+    Os frames lidos e os resultados dos filtros saem de um FramePool e voltam a ele depois
+    de gravados; os intermediários de cada filtro ficam em um FrameBuffers por thread. Com
+    `reuse_buffers` desligado, cada frame aloca seus próprios arrays.
+    """
+    threads = max(1, threads)
+    max_in_flight = max(threads + 1, max_in_flight)
+    shape = frame_shape(cap)
+    pool = FramePool(reuse_buffers)
+    scratches = [FrameBuffers(reuse_buffers) for _ in range(threads)]
+    slots = threading.Semaphore(max_in_flight)
+    to_filter = queue.Queue()
+    to_write = queue.Queue()
+    abort = threading.Event()
+    errors = []
+
+    reader = _Stage()
+    filters = [_Stage() for _ in range(threads)]
+    writer = _Stage()
+    written = [0]
+
+    def fail(error):
+        errors.append(error)
+        abort.set()
+
+    def read_loop():
+        index = 0
+        try:
+            while (max_frames is None or index < max_frames) and not abort.is_set():
+                start = time.perf_counter()
+                while not slots.acquire(timeout=0.1):
+                    if abort.is_set():
+                        return
+                reader.idle += time.perf_counter() - start
+
+                start = time.perf_counter()
+                buffer = pool.acquire(shape)
+                ret, frame = cap.read(buffer)
+                reader.busy += time.perf_counter() - start
+                if not ret:
+                    pool.release([buffer])
+                    slots.release()
+                    break
+                if on_decode is not None:
+                    on_decode(index, frame)
+                to_filter.put((index, frame))
+                index += 1
+        except Exception as e:
+            fail(e)
+        finally:
+            for _ in range(threads):
+                to_filter.put(_END)
+
+    def filter_loop(stage, scratch):
+        while True:
+            start = time.perf_counter()
+            item = to_filter.get()
+            stage.idle += time.perf_counter() - start
+            if item is _END:
+                to_write.put(_END)
+                return
+            index, frame = item
+            if abort.is_set():
+                slots.release()
+                continue
+            try:
+                start = time.perf_counter()
+                outputs = [pool.acquire(frame.shape) for _ in filter_funcs]
+                processed_frames = [filter_to_bgr(filter_func, frame, output, scratch)
+                                    for filter_func, output in zip(filter_funcs, outputs)]
+                stage.busy += time.perf_counter() - start
+                # Um filtro pode devolver o próprio frame: o que volta ao pool são os arrays
+                # do frame e das saídas, cada um uma vez.
+                to_write.put((index, processed_frames, [frame] + outputs))
+            except Exception as e:
+                slots.release()
+                fail(e)
+
+    def write_loop():
+        pending = {}
+        next_index = 0
+        finished = 0
+        while finished < threads:
+            start = time.perf_counter()
+            item = to_write.get()
+            writer.idle += time.perf_counter() - start
+            if item is _END:
+                finished += 1
+                continue
+            index, processed_frames, arrays = item
+            pending[index] = processed_frames, arrays
+            while next_index in pending:
+                processed_frames, arrays = pending.pop(next_index)
+                if not abort.is_set():
+                    try:
+                        start = time.perf_counter()
+                        for out, frame in zip(outs, processed_frames):
+                            out.write(frame)
+                        writer.busy += time.perf_counter() - start
+                        written[0] += 1
+                        if on_frame is not None:
+                            on_frame(written[0])
+                    except Exception as e:
+                        fail(e)
+                pool.release(arrays)
+                slots.release()
+                next_index += 1
+        # Após uma falha, frames fora de ordem podem ter ficado para trás.
+        for _ in pending:
+            slots.release()
+
+    workers = [threading.Thread(target=read_loop, name="pipeline-read")]
+    workers += [threading.Thread(target=filter_loop, args=(stage, scratch), name=f"pipeline-filter-{i}")
+                for i, (stage, scratch) in enumerate(zip(filters, scratches))]
+    workers.append(threading.Thread(target=write_loop, name="pipeline-write"))
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    if stats is not None:
+        stats['read']['busy_sec'] += reader.busy
+        stats['read']['idle_sec'] += reader.idle
+        stats['filter']['busy_sec'] += sum(stage.busy for stage in filters)
+        stats['filter']['idle_sec'] += sum(stage.idle for stage in filters)
+        stats['filter']['threads'] = max(stats['filter']['threads'], threads)
+        stats['write']['busy_sec'] += writer.busy
+        stats['write']['idle_sec'] += writer.idle
+        stats['allocations'] += pool.allocations + sum(scratch.allocations for scratch in scratches)
+
+    if errors:
+        raise errors[0]
+    return written[0]
@@ -0,0 +1,498 @@
+# processing.py
+import os
+import time
+import shutil
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait
+import cv2
+from filters import FrameBuffers, build_filter, filter_to_bgr
+from pipeline import run_pipeline, new_stage_stats, merge_stage_stats, frame_shape
+from packaging import package_hls, ffmpeg_available
+from thumbnails import FrameSampler
+from jobs import LeaseLostError
+
+# Intervalo mínimo (em segundos) entre duas notificações de progresso.
+PROGRESS_INTERVAL = 0.5
+# Tamanho mínimo (em frames) de cada segmento no modo paralelo: vídeos curtos não
+# compensam o custo de abrir vários decodificadores e juntar os segmentos depois. Sem o
+# ffmpeg não há divisão em segmentos (veja render_variants).
+SEGMENT_MIN_FRAMES = 240
+# Unidades aceitas em início/fim de um trecho (veja clip_frames).
+CLIP_UNIT_SEC = 'sec'
+CLIP_UNIT_FRAME = 'frame'
+CLIP_UNITS = (CLIP_UNIT_SEC, CLIP_UNIT_FRAME)
+# Altura padrão da prévia rápida (veja render_preview).
+PREVIEW_HEIGHT = 360
+
+# --- Funções de Processamento de Vídeo ---
+
+def probe_video(path):
+    """Lê fps, quantidade de frames e resolução de um vídeo."""
+    cap = cv2.VideoCapture(path)
+    try:
+        return _probe_capture(cap)
+    finally:
+        cap.release()
+
+def _probe_capture(cap):
+    """O mesmo que probe_video, lido de uma captura já aberta (sem decodificar frames)."""
+    return {
+        "fps": cap.get(cv2.CAP_PROP_FPS),
+        "frame_count": int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+        "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+    }
+
+def clip_frames(clip, fps, frame_count):
+    """Converte um trecho {"start", "end", "unit"} em (primeiro frame, frame final exclusivo).
+
+    `end` None (ou sem trecho) vai até o fim do vídeo. Levanta ValueError se o trecho
+    começa depois do último frame.
+    """
+    if not clip:
+        return 0, None
+    scale = 1 if clip['unit'] == CLIP_UNIT_FRAME else fps
+    start = int(round(clip['start'] * scale))
+    end = int(round(clip['end'] * scale)) if clip.get('end') is not None else None
+    if frame_count > 0 and start >= frame_count:
+        raise ValueError(f"O trecho começa no frame {start}, depois do fim do vídeo ({frame_count} frames)")
+    return start, end
+
+def seek_to_frame(cap, frame_index):
+    """Posiciona `cap` para que o próximo read() devolva o frame `frame_index`.
+
+    O backend FFmpeg do OpenCV salta para o keyframe anterior e decodifica só o trecho até
+    o frame pedido, então o custo não depende da posição no arquivo. Em backends sem busca
+    os frames anteriores são descartados com grab(), que decodifica sem converter a imagem.
+    """
+    if frame_index <= 0:
+        return
+    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+    position = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+    if position > frame_index:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        position = 0
+    while position < frame_index and cap.grab():
+        position += 1
+
+def _open_writer(output_path, fps, size, codecs=('avc1', 'mp4v')):
+    """Abre um VideoWriter com o primeiro codec disponível na build do OpenCV."""
+    for codec in codecs:
+        out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*codec), fps, size, isColor=True)
+        if out.isOpened():
+            return out
+        out.release()
+    raise RuntimeError(f"Não foi possível abrir o VideoWriter para {output_path}")
+
+class _ProgressReporter:
+    """Repassa o progresso para o callback no máximo a cada PROGRESS_INTERVAL segundos."""
+
+    def __init__(self, callback, total_frames):
+        self.callback = callback
+        self.total_frames = total_frames
+        self.last_report = time.monotonic()
+
+    def update(self, frames_done):
+        if self.callback is not None and time.monotonic() - self.last_report >= PROGRESS_INTERVAL:
+            self.callback(frames_done, self.total_frames)
+            self.last_report = time.monotonic()
+
+    def finish(self, frames_done):
+        if self.callback is not None:
+            self.callback(frames_done, max(self.total_frames, frames_done))
+
+def _filter_frames(cap, outs, filter_funcs, max_frames=None, on_frame=None, threads=0, max_in_flight=16, stats=None,
+                   on_decode=None, reuse_buffers=True):
+    """Lê até `max_frames` frames (ou até o fim do vídeo) e grava em cada `outs[i]` o
+    resultado de `filter_funcs[i]`, decodificando cada frame uma única vez.
+
+    Com `threads` > 0 os estágios rodam em paralelo (veja pipeline.run_pipeline); caso
+    contrário, o laço é serial. `stats`, se informado, acumula o tempo de cada estágio, e
+    `on_decode(índice, frame)` recebe cada frame decodificado (ex.: para as miniaturas).
+    O frame lido, os resultados e os intermediários dos filtros usam buffers alocados no
+    primeiro frame e reaproveitados nos seguintes (desligável com `reuse_buffers`).
+    """
+    if threads > 0:
+        return run_pipeline(cap, outs, filter_funcs, threads=threads, max_in_flight=max_in_flight,
+                            max_frames=max_frames, on_frame=on_frame, stats=stats, on_decode=on_decode,
+                            reuse_buffers=reuse_buffers)
+
+    clock = time.perf_counter
+    read_sec = filter_sec = write_sec = 0.0
+    frames_done = 0
+    shape = frame_shape(cap)
+    buffers = FrameBuffers(reuse_buffers)
+    while max_frames is None or frames_done < max_frames:
+        t0 = clock()
+        ret, frame = cap.read(buffers.get('frame', shape))
+        t1 = clock()
+        if not ret:
+            break
+        read_sec += t1 - t0
+        if on_decode is not None:
+            on_decode(frames_done, frame)
+
+        for i, (out, filter_func) in enumerate(zip(outs, filter_funcs)):
+            t1 = clock()
+            processed_frame = filter_to_bgr(filter_func, frame, buffers.get(i, frame.shape), buffers)
+            t2 = clock()
+            out.write(processed_frame)
+            t3 = clock()
+            filter_sec += t2 - t1
+            write_sec += t3 - t2
+
+        frames_done += 1
+        if on_frame is not None:
+            on_frame(frames_done)
+
+    if stats is not None:
+        # No laço serial cada estágio fica ocioso enquanto os outros dois trabalham.
+        stats['read']['busy_sec'] += read_sec
+        stats['read']['idle_sec'] += filter_sec + write_sec
+        stats['filter']['busy_sec'] += filter_sec
+        stats['filter']['idle_sec'] += read_sec + write_sec
+        stats['write']['busy_sec'] += write_sec
+        stats['write']['idle_sec'] += read_sec + filter_sec
+        stats['allocations'] += buffers.allocations
+    return frames_done
+
+def apply_filter_to_video(input_path, output_path, filter_func, **kwargs):
+    """Estrutura base para aplicar uma função de filtro em cada frame de um vídeo.
+
+    Atalho para render_variants com uma única saída; aceita os mesmos argumentos nomeados.
+    """
+    return render_variants(input_path, [(output_path, filter_func)], **kwargs)
+
+def render_variants(input_path, variants, progress_callback=None, segments=1, threads=0, max_in_flight=16, stats=None,
+                    sampler=None, media_info=None, clip=None, reuse_buffers=True):
+    """Decodifica o vídeo uma vez e grava uma saída para cada par (output_path, filter_func).
+
+    Com `segments` > 1, um vídeo longo o bastante e o ffmpeg instalado, o vídeo é dividido
+    em intervalos de frames processados em paralelo (veja _render_in_segments). Com `threads` > 0,
+    leitura, filtro e gravação rodam em um pipeline de threads com no máximo
+    `max_in_flight` frames em memória. Se `progress_callback` for informado, ele é chamado
+    com (frames_processados, total_frames) no máximo a cada PROGRESS_INTERVAL segundos e
+    uma última vez ao final. Se `stats` for um dicionário criado por
+    pipeline.new_stage_stats(), ele recebe o tempo ocupado/ocioso de cada estágio.
+    `reuse_buffers` desligado volta a alocar os arrays de cada frame (veja _filter_frames).
+
+    `sampler` (um thumbnails.FrameSampler) observa os frames decodificados, e `media_info`,
+    se for um dicionário, recebe fps, resolução e a contagem real de frames, para que quem
+    chama não precise abrir o vídeo de novo. Retorna o número de frames lidos.
+
+    Com `clip` (veja clip_frames), só o trecho é decodificado e gravado: a leitura começa
+    no keyframe anterior ao início e para no fim, e as saídas, as miniaturas e `media_info`
+    descrevem só o trecho.
+    """
+    output_paths = [output_path for output_path, _ in variants]
+    filter_funcs = [filter_func for _, filter_func in variants]
+    # Os metadados vêm da mesma captura que a leitura usa, sem abrir o vídeo só para isso.
+    cap = cv2.VideoCapture(input_path)
+    outs = []
+    try:
+        info = _probe_capture(cap)
+        # fps exato (ex.: 29.97): arredondar muda a duração das saídas em relação ao original.
+        fps = info['fps']
+        size = (info['width'], info['height'])
+        start_frame, end_frame = clip_frames(clip, fps, info['frame_count'])
+        # CAP_PROP_FRAME_COUNT é só uma estimativa: sem fim explícito, lê até o fim do arquivo.
+        max_frames = end_frame - start_frame if end_frame is not None else None
+        end_estimate = info['frame_count'] if end_frame is None else min(end_frame, info['frame_count'] or end_frame)
+        total_frames = max(end_estimate - start_frame, 0)
+        progress = _ProgressReporter(progress_callback, total_frames)
+        if sampler is not None:
+            sampler.configure(fps, total_frames)
+
+        # Sem saídas (só miniaturas e metadados) não há o que juntar: a leitura é uma só. Sem o
+        # ffmpeg os segmentos teriam de ser recodificados um a um na junção, o que sozinho já
+        # custa mais que a renderização serial inteira.
+        segment_count = 1
+        if output_paths and segments > 1 and ffmpeg_available():
+            segment_count = min(segments, total_frames // SEGMENT_MIN_FRAMES)
+        if segment_count > 1:
+            # Cada segmento abre a sua captura.
+            cap.release()
+            frames_done = _render_in_segments(input_path, output_paths, filter_funcs, start_frame, total_frames,
+                                              end_frame, segment_count, fps, size, progress, threads, max_in_flight,
+                                              stats, sampler, reuse_buffers)
+        else:
+            seek_to_frame(cap, start_frame)
+            for output_path in output_paths:
+                outs.append(_open_writer(output_path, fps, size))
+            frames_done = _filter_frames(cap, outs, filter_funcs, max_frames=max_frames, on_frame=progress.update,
+                                         threads=threads, max_in_flight=max_in_flight, stats=stats,
+                                         on_decode=sampler.observe if sampler is not None else None,
+                                         reuse_buffers=reuse_buffers)
+    finally:
+        cap.release()
+        for out in outs:
+            out.release()
+
+    progress.finish(frames_done)
+    if media_info is not None:
+        media_info.update(info, frame_count=frames_done)
+    return frames_done
+
+# --- Prévia rápida ---
+
+def preview_size(width, height, preview_height=PREVIEW_HEIGHT):
+    """Resolução da prévia: `preview_height` linhas mantendo a proporção, em dimensões pares."""
+    scale = min(preview_height / height, 1.0)
+    return max(int(round(width * scale / 2)) * 2, 2), max(int(round(height * scale / 2)) * 2, 2)
+
+def render_preview(input_path, output_path, filter_func, preview_height=PREVIEW_HEIGHT, frame_step=1, clip=None,
+                   media_info=None, reuse_buffers=True, min_frames=0):
+    """Grava uma prévia de baixa resolução com o mesmo filtro da variante.
+
+    Cada frame é reduzido a `preview_height` linhas antes do filtro, então filtro e encode
+    trabalham sobre uma fração dos pixels. Com `frame_step` > 1 só um a cada `frame_step`
+    frames é convertido e gravado (os outros passam por grab(), que decodifica sem converter
+    a imagem) e a prévia sai com fps / frame_step, mantendo a duração. `clip` e `media_info`
+    funcionam como em render_variants. Vídeos que não compensam uma prévia (veja
+    _preview_worthwhile) não geram arquivo. Retorna o número de frames gravados.
+    """
+    buffers = FrameBuffers(reuse_buffers)
+    frames_read = frames_written = 0
+    cap = cv2.VideoCapture(input_path)
+    out = None
+    try:
+        info = _probe_capture(cap)
+        if not _preview_worthwhile(info, preview_height, min_frames, clip):
+            return 0
+        fps = info['fps']
+        size = preview_size(info['width'], info['height'], preview_height)
+        start_frame, end_frame = clip_frames(clip, fps, info['frame_count'])
+        max_frames = end_frame - start_frame if end_frame is not None else None
+        seek_to_frame(cap, start_frame)
+        out = _open_writer(output_path, fps / frame_step, size)
+        shape = frame_shape(cap)
+        small_shape = (size[1], size[0], 3)
+        while max_frames is None or frames_read < max_frames:
+            if frames_read % frame_step:
+                if not cap.grab():
+                    break
+                frames_read += 1
+                continue
+            ret, frame = cap.read(buffers.get('frame', shape))
+            if not ret:
+                break
+            frames_read += 1
+            small = cv2.resize(frame, size, dst=buffers.get('small', small_shape), interpolation=cv2.INTER_AREA)
+            out.write(filter_to_bgr(filter_func, small, buffers.get('preview', small_shape), buffers))
+            frames_written += 1
+    finally:
+        cap.release()
+        if out is not None:
+            out.release()
+    if media_info is not None:
+        media_info.update(info, frame_count=frames_read)
+    return frames_written
+
+def _preview_worthwhile(info, preview_height, min_frames, clip):
+    """A prévia só compensa em vídeos maiores que ela e com pelo menos `min_frames` frames no
+    trecho; `info` é o resultado de _probe_capture da captura da prévia."""
+    start_frame, end_frame = clip_frames(clip, info['fps'], info['frame_count'])
+    frames = (info['frame_count'] if end_frame is None else min(end_frame, info['frame_count'])) - start_frame
+    return info['height'] > preview_height and frames >= min_frames
+
+# --- Processamento paralelo por segmentos ---
+
+# Contador compartilhado de frames concluídos, injetado em cada processo de segmento.
+_segment_counter = None
+
+def _init_segment_worker(counter):
+    global _segment_counter
+    _segment_counter = counter
+
+def _count_segment_frames(frames):
+    with _segment_counter.get_lock():
+        _segment_counter.value += frames
+
+def _render_segment(input_path, output_paths, filter_funcs, start_frame, max_frames, fps, size, codecs,
+                    threads, max_in_flight, sampler=None, clip_start=0, reuse_buffers=True):
+    """Filtra os frames [start_frame, start_frame + max_frames) em um arquivo de segmento
+    por saída.
+
+    Retorna o número de frames lidos, o tempo de cada estágio e a cópia de `sampler` com
+    os frames deste intervalo, numerados a partir de `clip_start`.
+    """
+    cap = cv2.VideoCapture(input_path)
+    seek_to_frame(cap, start_frame)
+
+    def on_frame(frames_done):
+        if frames_done % 10 == 0:
+            _count_segment_frames(10)
+
+    def on_decode(index, frame):
+        sampler.observe(start_frame - clip_start + index, frame)
+
+    stats = new_stage_stats()
+    outs = []
+    try:
+        for output_path in output_paths:
+            outs.append(_open_writer(output_path, fps, size, codecs))
+        frames_done = _filter_frames(cap, outs, filter_funcs, max_frames=max_frames, on_frame=on_frame,
+                                     threads=threads, max_in_flight=max_in_flight, stats=stats,
+                                     on_decode=on_decode if sampler is not None else None,
+                                     reuse_buffers=reuse_buffers)
+    finally:
+        cap.release()
+        for out in outs:
+            out.release()
+    _count_segment_frames(frames_done % 10)
+    return frames_done, stats, sampler
+
+def _render_in_segments(input_path, output_paths, filter_funcs, start_frame, total_frames, end_frame, segment_count,
+                        fps, size, progress, threads=0, max_in_flight=16, stats=None, sampler=None,
+                        reuse_buffers=True):
+    """Divide os `total_frames` frames a partir de `start_frame` em `segment_count`
+    intervalos, processa cada um em seu próprio processo e junta os segmentos de cada
+    saída, na ordem, em `output_paths`. `end_frame` None lê o último até o fim do arquivo.
+
+    Os segmentos já saem no codec final e são concatenados pelo ffmpeg sem recodificação.
+    """
+    ffmpeg = shutil.which('ffmpeg')
+    codecs = ('avc1', 'mp4v')
+    segments_dirs = [output_path + '.segments' for output_path in output_paths]
+    segment_paths = []
+    for output_path, segments_dir in zip(output_paths, segments_dirs):
+        segment_ext = os.path.splitext(output_path)[1]
+        os.makedirs(segments_dir, exist_ok=True)
+        segment_paths.append([os.path.join(segments_dir, f"segment_{i:03d}{segment_ext}")
+                              for i in range(segment_count)])
+    bounds = [start_frame + total_frames * i // segment_count for i in range(segment_count + 1)]
+
+    context = multiprocessing.get_context('spawn')
+    counter = context.Value('q', 0)
+    try:
+        with ProcessPoolExecutor(max_workers=segment_count, mp_context=context,
+                                 initializer=_init_segment_worker, initargs=(counter,)) as pool:
+            futures = []
+            for i in range(segment_count):
+                # O último segmento lê até o fim do trecho ou do arquivo, pois
+                # CAP_PROP_FRAME_COUNT é só uma estimativa.
+                if i < segment_count - 1:
+                    max_frames = bounds[i + 1] - bounds[i]
+                else:
+                    max_frames = end_frame - bounds[i] if end_frame is not None else None
+                futures.append(pool.submit(_render_segment, input_path, [paths[i] for paths in segment_paths],
+                                           filter_funcs, bounds[i], max_frames, fps, size, codecs,
+                                           threads, max_in_flight, sampler, start_frame, reuse_buffers))
+            pending = futures
+            while pending:
+                _, pending = wait(pending, timeout=PROGRESS_INTERVAL)
+                progress.update(counter.value)
+            frames_done = 0
+            for future in futures:
+                segment_frames, segment_stats, segment_sampler = future.result()
+                frames_done += segment_frames
+                if stats is not None:
+                    merge_stage_stats(stats, segment_stats)
+                if sampler is not None:
+                    sampler.merge(segment_sampler)
+
+        for output_path, paths in zip(output_paths, segment_paths):
+            _join_segments(paths, output_path, ffmpeg)
+    finally:
+        for segments_dir in segments_dirs:
+            shutil.rmtree(segments_dir, ignore_errors=True)
+    return frames_done
+
+def _join_segments(segment_paths, output_path, ffmpeg):
+    """Concatena os segmentos em `output_path` com o ffmpeg, sem recodificar, preservando a ordem dos frames."""
+    list_path = os.path.join(os.path.dirname(segment_paths[0]), "segments.txt")
+    with open(list_path, 'w') as f:
+        for path in segment_paths:
+            f.write(f"file '{os.path.abspath(path)}'\n")
+    result = subprocess.run([ffmpeg, '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0',
+                             '-i', list_path, '-c', 'copy', output_path], capture_output=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg falhou ao juntar os segmentos: {result.stderr.decode(errors='replace')}")
+
+# --- Tarefa executada pelo pool de processos ---
+
+def _media_summary(input_path, media_info):
+    fps = media_info['fps']
+    duration = media_info['frame_count'] / fps if fps > 0 else 0
+    return {"size_bytes": os.path.getsize(input_path), "duration_sec": round(duration, 2), "fps": fps,
+            "width": media_info['width'], "height": media_info['height']}
+
+def _render_preview_step(payload, preview, filter_func, preview_callback):
+    """Grava e publica a prévia e retorna se ela foi gravada; um erro (exceto LeaseLostError)
+    apaga a prévia e segue sem ela."""
+    try:
+        preview_info = {}
+        written = render_preview(payload['original_path'], preview['path'], filter_func, preview['height'],
+                                 preview.get('frame_step', 1), clip=payload.get('clip'), media_info=preview_info,
+                                 min_frames=preview.get('min_frames', 0))
+        if written and preview_callback is not None:
+            preview_callback(_media_summary(payload['original_path'], preview_info))
+        return written > 0
+    except LeaseLostError:
+        raise
+    except Exception as e:
+        print(f"Prévia de {payload.get('video_id')} não gerada: {e}")
+        if os.path.exists(preview['path']):
+            os.remove(preview['path'])
+        return False
+
+def process_video(payload, progress_callback=None, preview_callback=None):
+    """Renderiza todas as variantes pedidas, gera as miniaturas e devolve os metadados do
+    vídeo original.
+
+    Metadados e miniaturas saem da mesma decodificação usada pelos filtros; com `clip` no
+    payload, tudo se refere só ao trecho (veja render_variants). Executada por um
+    worker (veja worker.py), que passa os caminhos do job já absolutos. `stage_seconds` traz
+    o tempo ocupado de cada estágio (decodificação, filtros, encode, miniaturas, HLS) para
+    as métricas do servidor.
+
+    Com `preview` no payload ({"path", "height", "frame_step", "min_frames"}), uma prévia da
+    variante principal (veja render_preview) é gravada antes da renderização completa e
+    `preview_callback` recebe os metadados do vídeo assim que ela fica pronta, para
+    publicá-la enquanto a completa continua. A prévia é opcional: um erro nela (exceto
+    LeaseLostError) só é registrado no log e a renderização completa segue sem ela.
+    """
+    params = payload.get('params')
+    variants = [(variant['processed_path'], build_filter(variant['filter'], params)) for variant in payload['variants']]
+    stage_seconds = {}
+    preview = payload.get('preview')
+    if preview and variants:
+        # Antes da completa, sem disputar núcleos com ela: a prévia é uma fração dos pixels e
+        # a decodificação do original, que as duas pagariam, é o piso do seu tempo.
+        start = time.perf_counter()
+        if _render_preview_step(payload, preview, variants[0][1], preview_callback):
+            stage_seconds['preview'] = time.perf_counter() - start
+
+    sampler = FrameSampler()
+    media_info = {}
+    stats = new_stage_stats()
+    render_variants(payload['original_path'], variants,
+                    progress_callback=progress_callback, segments=payload.get('segments', 1),
+                    threads=payload.get('threads', 0), max_in_flight=payload.get('max_in_flight', 16),
+                    stats=stats, sampler=sampler, media_info=media_info, clip=payload.get('clip'))
+
+    start = time.perf_counter()
+    thumbnails = sampler.write(payload['thumbs_dir'], media_info['frame_count'])
+    stage_seconds.update({"decode": stats['read']['busy_sec'], "filter": stats['filter']['busy_sec'],
+                          "encode": stats['write']['busy_sec'], "thumbnails": time.perf_counter() - start})
+
+    # Empacotamento HLS opcional da variante principal; uma falha aqui não perde o vídeo
+    # processado, que continua disponível como MP4. O ffmpeg é procurado aqui, no worker
+    # que roda o job, não no servidor que o enfileirou.
+    hls_packaged = False
+    if payload.get('hls') and not ffmpeg_available():
+        print(f"HLS de {payload['video_id']} não gerado: ffmpeg não encontrado neste worker.")
+    elif payload.get('hls'):
+        start = time.perf_counter()
+        try:
+            package_hls(payload['hls']['input_path'], payload['hls']['output_dir'], media_info['fps'],
+                        media_info['height'])
+            hls_packaged = True
+        except RuntimeError as e:
+            print(f"Erro ao gerar HLS de {payload['video_id']}: {e}")
+        stage_seconds['hls'] = time.perf_counter() - start
+
+    return dict(_media_summary(payload['original_path'], media_info),
+                hls_packaged=hls_packaged, thumbnail_files=thumbnails,
+                frames=media_info['frame_count'], stage_seconds=stage_seconds)
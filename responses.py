@@ -0,0 +1,98 @@
+# responses.py
+# Respostas do /videos e da página web guardadas já serializadas e comprimidas. A chave
+# inclui a geração do banco (o último seq de video_changes, que os gatilhos avançam a cada
+# vídeo inserido, alterado ou apagado, por qualquer processo): enquanto nada muda, uma
+# requisição custa uma consulta ao índice e a cópia dos bytes, e quem já tem o ETag atual
+# recebe 304 sem corpo.
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from flask import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Respostas guardadas (combinações de rota e parâmetros) da geração atual.
+RESPONSE_CACHE_ENTRIES = 128
+# Corpos menores que isso vão sem compressão; o cabeçalho custaria mais que a economia.
+COMPRESS_MIN_BYTES = 512
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+class CachedResponse:
+    """Corpo de uma resposta e suas versões comprimidas, cada uma com o seu ETag forte."""
+
+    def __init__(self, body, mimetype, headers=None, compress_min=COMPRESS_MIN_BYTES):
+        self.mimetype = mimetype
+        self.headers = headers or {}
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        # Em ordem de preferência; a comprimida é feita uma vez por geração, não por requisição.
+        self.encodings = {}
+        if len(body) >= compress_min:
+            if brotli is not None:
+                self.encodings['br'] = (brotli.compress(body, quality=BROTLI_QUALITY), f"{digest}-br")
+            self.encodings['gzip'] = (gzip.compress(body, GZIP_LEVEL, mtime=0), f"{digest}-gz")
+        self.encodings['identity'] = (body, digest)
+
+    def encoding_for(self, accept_encodings):
+        for encoding in self.encodings:
+            if encoding == 'identity' or accept_encodings[encoding] > 0:
+                return encoding
+        return 'identity'
+
+    def respond(self, request):
+        """304 se o cliente já tem esta versão (If-None-Match), senão o corpo na melhor
+        codificação aceita. Cache-Control no-cache: o navegador guarda, mas revalida sempre."""
+        encoding = self.encoding_for(request.accept_encodings)
+        body, etag = self.encodings[encoding]
+        if any(request.if_none_match.contains(tag) for _, tag in self.encodings.values()):
+            response = Response(status=304)
+        else:
+            response = Response(body, mimetype=self.mimetype, headers=self.headers)
+            if encoding != 'identity':
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(etag)
+        response.vary.add('Accept-Encoding')
+        response.cache_control.no_cache = True
+        return response
+
+
+class ResponseCache:
+    """LRU das respostas da geração mais nova já vista; uma geração nova descarta as anteriores."""
+
+    def __init__(self, max_entries=RESPONSE_CACHE_ENTRIES):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.generation = -1
+        self.max_entries = max_entries
+
+    def clear(self):
+        """Esquece todas as respostas guardadas (ex.: para medir a listagem sem cache)."""
+        with self._lock:
+            self._entries.clear()
+
+    def get_or_build(self, generation, key, build):
+        """Retorna (CachedResponse de `key` na geração `generation`, acerto?).
+
+        Na falta, chama `build()` fora do lock. Quem leu uma geração já superada recebe uma
+        resposta nova que não é guardada.
+        """
+        with self._lock:
+            if generation > self.generation:
+                self._entries.clear()
+                self.generation = generation
+            entry = self._entries.get(key) if generation == self.generation else None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry, True
+        entry = build()
+        with self._lock:
+            if generation == self.generation:
+                self._entries[key] = entry
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return entry, False
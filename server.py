@@ -1,95 +1,366 @@
 # server.py
 import os
+import time
 import uuid
-import sqlite3
-import cv2
 import shutil
-import numpy as np
+import mimetypes
+import json
+import base64
+import math
+import posixpath
+import atexit
+import threading
 from datetime import datetime
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Flask, Response, request, jsonify, render_template, send_from_directory, g, has_request_context
 from werkzeug.utils import secure_filename
+from processing import CLIP_UNIT_SEC, CLIP_UNIT_FRAME, CLIP_UNITS
+from filters import normalize_filter_spec, parse_filter_params, params_key
+from cache import CacheStats, save_and_hash, hash_file, link_file
+from thumbnails import SPRITE_NAME, thumbnail_fields
+from uploads import UploadSessionStore, UploadError, DEFAULT_CHUNK_SIZE, MAX_CHUNK_SIZE
+from jobs import enqueue_job, cancel_jobs, get_job, list_jobs, count_jobs, QueueFullError, JOB_QUEUED, JOB_RUNNING
+from database import init_db, get_pool, insert_video, last_change_seq, to_url_path, prune_changes
+from events import ChangeNotifier, format_sse
+from metrics import Metrics, Trace, STAGE_BUCKETS, DB_BUCKETS, FPS_BUCKETS
+from worker import start_workers, recover_jobs
+from storage import artifact_for, touch_artifact, record_artifacts, video_artifacts, cleanup_incoming
+from responses import CachedResponse, ResponseCache
 
 # --- Configuração ---
 MEDIA_ROOT = "media"
 INCOMING_PATH = os.path.join(MEDIA_ROOT, "incoming")
 DB_FILE = "videos.db"
+# Workers (veja worker.py) iniciados junto com `python server.py` (padrão: número de núcleos);
+# 0 deixa o processamento só para workers iniciados à parte, nesta ou em outras máquinas.
+# MAX_PENDING_JOBS é quantos jobs podem aguardar na fila além dos que estão em execução.
+PROCESSING_WORKERS = os.cpu_count() or 1
+MAX_PENDING_JOBS = 32
+# Variantes, miniaturas e HLS são um cache (veja storage.py): acima da cota, os menos
+# acessados são apagados e gerados de novo no próximo acesso pelo /media. Com
+# RENDER_ON_UPLOAD desligado, o upload só extrai metadados e miniaturas e cada variante é
+# renderizada no primeiro acesso.
+STORAGE_QUOTA_BYTES = 20 * 1024 ** 3
+RENDER_ON_UPLOAD = True
+# Retry-After sugerido enquanto um arquivo é gerado e intervalo mínimo entre dois registros
+# de acesso do mesmo arquivo (um vídeo tocando gera várias requisições de faixa).
+RENDER_RETRY_AFTER_SEC = 5
+ARTIFACT_TOUCH_SEC = 60
+# Gera uma escada HLS (1080p/720p/360p) da variante principal após o filtro. Exige o
+# ffmpeg no PATH dos workers; cada upload pode sobrescrever com o campo 'hls' (1/0).
+HLS_PACKAGING = True
+# Validade do cache no navegador para os arquivos da pasta de cada vídeo (originais, variantes,
+# miniaturas e HLS): o caminho contém o UUID do vídeo e o conteúdo nunca muda.
+MEDIA_CACHE_MAX_AGE = 365 * 24 * 60 * 60
+# Prévia rápida (veja processing.render_preview): a variante principal é gravada antes em
+# PREVIEW_HEIGHT linhas, só um a cada PREVIEW_FRAME_STEP frames, e o vídeo aparece no
+# /videos e na página web com `path_preview` enquanto a renderização completa continua.
+# Vídeos com menos de PREVIEW_MIN_FRAMES frames ou já pequenos vão direto para a completa.
+PREVIEW_ENABLED = True
+PREVIEW_HEIGHT = 360
+PREVIEW_FRAME_STEP = 2
+PREVIEW_MIN_FRAMES = 240
+# Quantas variantes (filtros ou cadeias) podem ser pedidas em um único upload.
+MAX_VARIANTS_PER_UPLOAD = 8
+# Processos usados para dividir um único vídeo longo em segmentos processados em paralelo
+# (só com o ffmpeg no worker; veja processing.render_variants). Cada worker já ocupa um
+# núcleo, então o padrão divide entre eles só os núcleos que sobram: com PROCESSING_WORKERS
+# igual ao número de núcleos, cada vídeo é um segmento só.
+SEGMENT_WORKERS = max((os.cpu_count() or 1) // max(PROCESSING_WORKERS, 1), 1)
+# Threads de filtro do pipeline leitura -> filtro -> gravação (0 desativa o pipeline)
+# e limite de frames em memória por vídeo.
+PIPELINE_THREADS = 2
+PIPELINE_MAX_FRAMES_IN_FLIGHT = 16
+# Tamanho padrão e máximo de cada página do /videos e da página web.
+VIDEOS_PAGE_SIZE = 50
+VIDEOS_MAX_PAGE_SIZE = 200
+# Máximo de alterações devolvidas por chamada do /videos/changes.
+CHANGES_PAGE_SIZE = 500
+# Intervalo entre comentários keep-alive do /events e entre leituras do progresso dos jobs.
+EVENTS_HEARTBEAT_SEC = 15
+EVENTS_JOB_INTERVAL_SEC = 0.5
+# Métricas no formato Prometheus em /metrics; desligadas, a instrumentação não mede nada.
+METRICS_ENABLED = True
+# Grava uma linha JSON com a duração de cada estágio de toda requisição (e do job que ela
+# criar). Sem isso, só as requisições com o cabeçalho `X-Trace: 1` são rastreadas.
+TRACE_REQUESTS = False
+
+mimetypes.add_type('application/vnd.apple.mpegurl', '.m3u8')
+mimetypes.add_type('video/mp2t', '.ts')
+mimetypes.add_type('text/vtt', '.vtt')
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = INCOMING_PATH
 app.config['MEDIA_ROOT'] = MEDIA_ROOT
 
-# --- Funções de Processamento de Vídeo ---
-
-def apply_filter_to_video(input_path, output_path, filter_func):
-    """Estrutura base para aplicar uma função de filtro em cada frame de um vídeo."""
-    cap = cv2.VideoCapture(input_path)
-    fourcc = cv2.VideoWriter_fourcc(*'avc1')
-    fps = int(cap.get(cv2.CAP_PROP_FPS))
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    out = cv2.VideoWriter(output_path, fourcc, fps, (width, height), isColor=True)
-
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
-        
-        processed_frame = filter_func(frame)
-        
-        if len(processed_frame.shape) == 2:
-            processed_frame = cv2.cvtColor(processed_frame, cv2.COLOR_GRAY2BGR)
-            
-        out.write(processed_frame)
-        
-    cap.release()
-    out.release()
-
-def filter_grayscale(frame):
-    return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-
-def filter_canny_edge(frame):
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    return cv2.Canny(gray, 100, 200)
-
-def filter_sepia(frame):
-    kernel = np.array([[0.272, 0.534, 0.131],
-                       [0.349, 0.686, 0.168],
-                       [0.393, 0.769, 0.189]])
-    sepia_frame = cv2.transform(frame, kernel)
-    sepia_frame[np.where(sepia_frame > 255)] = 255
-    return sepia_frame
-
-def filter_pixelate(frame, pixel_size=12):
-    h, w = frame.shape[:2]
-    temp = cv2.resize(frame, (w // pixel_size, h // pixel_size), interpolation=cv2.INTER_LINEAR)
-    return cv2.resize(temp, (w, h), interpolation=cv2.INTER_NEAREST)
-
-def filter_invert(frame):
-    return cv2.bitwise_not(frame)
-
-FILTERS = {
-    'grayscale': filter_grayscale,
-    'canny': filter_canny_edge,
-    'sepia': filter_sepia,
-    'pixelate': filter_pixelate,
-    'invert': filter_invert
-}
+cache_stats = CacheStats()
+upload_sessions = UploadSessionStore(os.path.join(INCOMING_PATH, "sessions"))
+change_notifier = ChangeNotifier()
+response_cache = ResponseCache()
+
+# --- Métricas ---
+metrics = Metrics(enabled=METRICS_ENABLED)
+metrics.counter('http_requests', "Requisições HTTP por rota e status.")
+metrics.histogram('http_request_duration_seconds', "Duração das requisições HTTP por rota.", STAGE_BUCKETS)
+metrics.histogram('stage_duration_seconds', "Duração de cada estágio do upload e do processamento.", STAGE_BUCKETS)
+metrics.histogram('db_query_duration_seconds', "Duração das consultas ao SQLite por tipo.", DB_BUCKETS)
+metrics.histogram('filter_fps', "Frames por segundo de cada filtro (tempo ocupado do estágio de filtro).", FPS_BUCKETS)
+metrics.counter('frames_processed', "Frames processados por filtro.")
+metrics.counter('bytes_in', "Bytes recebidos em uploads.")
+metrics.counter('bytes_out', "Bytes gravados em variantes processadas.")
+metrics.counter('jobs_finished', "Jobs de processamento terminados por estado.")
+metrics.counter('response_cache', "Acertos e erros do cache de respostas do /videos e da página web.")
+metrics.gauge('jobs', "Jobs na fila ou em processamento.",
+              lambda: [({"state": state}, count) for state, count in _count_jobs().items()])
+
+def current_trace():
+    return g.get('trace') if has_request_context() else None
+
+def stage_timer(stage, trace=None):
+    """Mede um estágio em stage_duration_seconds e no trace da requisição, se houver."""
+    return metrics.timer('stage_duration_seconds', trace or current_trace(), stage, stage=stage)
+
+def db_timer(query, trace=None):
+    return metrics.timer('db_query_duration_seconds', trace or current_trace(), f"db_{query}", query=query)
+
+@app.before_request
+def start_request_trace():
+    if TRACE_REQUESTS or request.headers.get('X-Trace') == '1':
+        g.trace = Trace()
+    if metrics.enabled:
+        g.request_start = time.perf_counter()
+
+@app.after_request
+def finish_request_trace(response):
+    endpoint = request.endpoint or 'not_found'
+    if metrics.enabled:
+        metrics.inc('http_requests', endpoint=endpoint, status=response.status_code)
+        metrics.observe('http_request_duration_seconds', time.perf_counter() - g.get('request_start', time.perf_counter()),
+                        endpoint=endpoint)
+    trace = g.get('trace')
+    if trace is not None:
+        response.headers['X-Trace-Id'] = trace.id
+        trace.emit('request', method=request.method, path=request.path, status=response.status_code)
+    return response
 
 # --- Funções de Banco de Dados ---
 def get_db_connection():
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Conexão do pool reservada para a requisição atual e devolvida no fim dela."""
+    if 'db' not in g:
+        g.db_pool = get_pool(DB_FILE)
+        g.db = g.db_pool.acquire()
+    return g.db
 
-def save_metadata_to_db(video_data):
-    """Salva os metadados no banco, agora incluindo path_thumbnail."""
+@app.teardown_appcontext
+def release_db_connection(exception):
+    conn = g.pop('db', None)
+    if conn is not None:
+        g.pop('db_pool').release(conn)
+
+def save_metadata_to_db(video_data, variants=()):
+    """Salva os metadados do vídeo e de suas variantes processadas na mesma transação.
+
+    Usada quando o upload é todo reaproveitado do cache; vídeos processados são gravados
+    pelo worker ao fim do job (veja worker.py).
+    """
     conn = get_db_connection()
-    sql = ''' INSERT INTO videos(id, original_name, original_ext, mime_type, size_bytes, duration_sec, fps, width, height, filter, created_at, path_original, path_processed, path_thumbnail)
-              VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?) '''
-    cur = conn.cursor()
-    cur.execute(sql, tuple(video_data.values()))
-    conn.commit()
-    conn.close()
+    with db_timer('insert_video'), conn:
+        insert_video(conn, video_data, variants)
+        record_artifacts(conn, video_data['id'], video_artifacts(app.config['MEDIA_ROOT'], video_data, variants))
+    change_notifier.notify()
+
+def find_cached_original(conn, content_hash, clip=None):
+    """Retorna um vídeo já armazenado com o mesmo conteúdo cujo arquivo ainda existe, ou None.
+
+    Prefere um vídeo do mesmo trecho `clip` (chave de clip_key), cujos metadados e
+    miniaturas também podem ser reaproveitados.
+    """
+    rows = conn.execute('SELECT * FROM videos WHERE content_hash = ? ORDER BY clip IS ? DESC, created_at',
+                        (content_hash, clip)).fetchall()
+    for row in rows:
+        if os.path.exists(os.path.join(app.config['MEDIA_ROOT'], row['path_original'])):
+            return row
+    return None
+
+def find_cached_variant(conn, content_hash, filter_spec, filter_params, clip=None):
+    """Retorna o caminho de uma variante já renderizada para (conteúdo, filtro, parâmetros, trecho), ou None."""
+    rows = conn.execute(''' SELECT v.path_processed FROM video_variants v JOIN videos o ON o.id = v.video_id
+                            WHERE o.content_hash = ? AND v.filter = ? AND v.filter_params = ? AND o.clip IS ? ''',
+                        (content_hash, filter_spec, filter_params, clip)).fetchall()
+    for row in rows:
+        if os.path.exists(os.path.join(app.config['MEDIA_ROOT'], row['path_processed'])):
+            return row['path_processed']
+    return None
+
+def load_variants(conn, video_ids):
+    """Retorna {video_id: [variantes]} dos vídeos em `video_ids`."""
+    if not video_ids:
+        return {}
+    placeholders = ','.join('?' * len(video_ids))
+    rows = conn.execute(f'SELECT video_id, filter, path_processed FROM video_variants WHERE video_id IN ({placeholders}) ORDER BY id',
+                        tuple(video_ids)).fetchall()
+    variants = {}
+    for row in rows:
+        variants.setdefault(row['video_id'], []).append(
+            {"filter": row['filter'], "path_processed": row['path_processed']})
+    return variants
+
+# --- Listagem paginada ---
+VIDEO_FIELDS = ('id', 'original_name', 'original_ext', 'mime_type', 'size_bytes', 'duration_sec', 'fps',
+                'width', 'height', 'filter', 'created_at', 'path_original', 'path_processed',
+                'path_thumbnail', 'content_hash', 'path_hls', 'thumbnails', 'path_sprite_vtt', 'clip',
+                'source_video_id', 'path_preview', 'variants')
+
+def encode_cursor(row):
+    raw = json.dumps([row['created_at'], row['id']]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Levanta ValueError se o cursor não veio de encode_cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, video_id = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError("Cursor inválido")
+    if not isinstance(created_at, str) or not isinstance(video_id, str):
+        raise ValueError("Cursor inválido")
+    return created_at, video_id
+
+def parse_listing_args(args):
+    """Valida os parâmetros de /videos e /gui; levanta ValueError com a mensagem para o cliente.
+
+    Aceita `limit`, `cursor` (next_cursor da página anterior), `filter` (filtro de qualquer
+    variante), `since`/`until` (datas ISO, intervalo [since, until)), `name` (prefixo do nome
+    original), `id` (um vídeo específico) e `fields` (colunas separadas por vírgula).
+    """
+    try:
+        limit = int(args.get('limit', VIDEOS_PAGE_SIZE))
+    except ValueError:
+        raise ValueError("limit deve ser um número inteiro")
+    if not 1 <= limit <= VIDEOS_MAX_PAGE_SIZE:
+        raise ValueError(f"limit deve estar entre 1 e {VIDEOS_MAX_PAGE_SIZE}")
+
+    query = {"limit": limit, "cursor": None, "filter": args.get('filter') or None,
+             "since": None, "until": None, "name": args.get('name') or None, "fields": VIDEO_FIELDS,
+             "ids": [args['id']] if args.get('id') else None}
+    if args.get('cursor'):
+        query['cursor'] = decode_cursor(args['cursor'])
+    for key in ('since', 'until'):
+        if args.get(key):
+            try:
+                query[key] = datetime.fromisoformat(args[key]).isoformat()
+            except ValueError:
+                raise ValueError(f"{key} deve ser uma data ISO 8601")
+    if args.get('fields'):
+        query['fields'] = parse_fields(args['fields'])
+    return query
+
+def parse_fields(raw):
+    fields = tuple(field.strip() for field in raw.split(',') if field.strip())
+    unknown = [field for field in fields if field not in VIDEO_FIELDS]
+    if unknown:
+        raise ValueError(f"Campo desconhecido: {', '.join(unknown)}")
+    return fields
+
+def query_videos(conn, query):
+    """Busca uma página de vídeos, do mais novo para o mais antigo; retorna (vídeos, next_cursor).
+
+    A paginação é por chave (created_at, id) em vez de OFFSET, então cada página custa o
+    mesmo independentemente da posição e não pula nem repete vídeos inseridos no meio.
+    """
+    where, params = [], []
+    if query.get('ids') is not None:
+        where.append(f"id IN ({','.join('?' * len(query['ids']))})")
+        params += query['ids']
+    if query['cursor']:
+        where.append('(created_at, id) < (?, ?)')
+        params += query['cursor']
+    if query['filter']:
+        where.append('(filter = ? OR id IN (SELECT video_id FROM video_variants WHERE filter = ?))')
+        params += [query['filter'], query['filter']]
+    if query['since']:
+        where.append('created_at >= ?')
+        params.append(query['since'])
+    if query['until']:
+        where.append('created_at < ?')
+        params.append(query['until'])
+    if query['name']:
+        # Intervalo em vez de LIKE para usar o índice de original_name.
+        where.append('original_name >= ? AND original_name < ?')
+        params += [query['name'], query['name'] + '\U0010ffff']
+
+    # id e created_at entram sempre: são a chave do cursor e das variantes.
+    columns = [field for field in query['fields'] if field != 'variants']
+    if 'path_processed' not in columns and 'variants' in query['fields']:
+        columns.append('path_processed')
+    select = ', '.join(dict.fromkeys(['id', 'created_at', 'filter'] + columns))
+    sql = f'SELECT {select} FROM videos'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY created_at DESC, id DESC LIMIT ?'
+    # Uma linha a mais indica se existe próxima página.
+    with db_timer('list_videos'):
+        rows = conn.execute(sql, params + [query['limit'] + 1]).fetchall()
+
+    next_cursor = encode_cursor(rows[query['limit'] - 1]) if len(rows) > query['limit'] else None
+    rows = rows[:query['limit']]
+    variants = {}
+    if 'variants' in query['fields']:
+        with db_timer('load_variants'):
+            variants = load_variants(conn, [row['id'] for row in rows])
+
+    videos = []
+    for row in rows:
+        video_dict = dict(row)
+        if 'variants' in query['fields']:
+            video_dict['variants'] = variants.get(row['id']) or _legacy_variants(video_dict)
+        if 'thumbnails' in video_dict:
+            video_dict['thumbnails'] = json.loads(video_dict['thumbnails'] or '{}')
+        if video_dict.get('clip'):
+            video_dict['clip'] = json.loads(video_dict['clip'])
+        videos.append({field: video_dict.get(field) for field in query['fields']})
+    return videos, next_cursor
+
+# --- Registro de alterações ---
+def load_changes(conn, since, fields=VIDEO_FIELDS, limit=CHANGES_PAGE_SIZE):
+    """Alterações com seq > `since`, no máximo uma por vídeo (a mais recente).
+
+    Retorna {"changes", "last_seq", "has_more", "reset"}. Inserções e atualizações trazem o
+    vídeo no formato do /videos (só com `fields`); exclusões trazem só o id. `reset` indica
+    que `since` é mais antigo que o registro guardado e a lista deve ser recarregada.
+    """
+    with db_timer('changes'):
+        oldest, newest = conn.execute('SELECT MIN(seq), COALESCE(MAX(seq), 0) FROM video_changes').fetchone()
+    if oldest is not None and since < oldest - 1:
+        return {"changes": [], "last_seq": newest, "has_more": False, "reset": True}
+
+    with db_timer('changes'):
+        rows = conn.execute(""" SELECT seq, video_id, kind FROM video_changes
+                                WHERE seq IN (SELECT MAX(seq) FROM video_changes
+                                              WHERE seq > ? AND seq <= ? GROUP BY video_id)
+                                ORDER BY seq LIMIT ? """, (since, newest, limit + 1)).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    last_seq = rows[-1]['seq'] if has_more else max(newest, since)
+
+    ids = [row['video_id'] for row in rows if row['kind'] != 'delete']
+    videos = {}
+    if ids:
+        query = {"ids": ids, "limit": len(ids), "cursor": None, "filter": None, "since": None,
+                 "until": None, "name": None, "fields": tuple(dict.fromkeys(('id',) + tuple(fields)))}
+        videos = {video['id']: video for video in query_videos(conn, query)[0]}
+
+    changes = []
+    for row in rows:
+        video = videos.get(row['video_id'])
+        # O vídeo pode ter sido apagado depois desta alteração e antes da consulta.
+        kind = row['kind'] if video is not None else 'delete'
+        if video is not None:
+            video = {field: video[field] for field in fields}
+        changes.append({"seq": row['seq'], "kind": kind, "video_id": row['video_id'], "video": video})
+    return {"changes": changes, "last_seq": last_seq, "has_more": has_more, "reset": False}
+
+def _job_event(job):
+    return {key: job.get(key) for key in ('id', 'video_id', 'state', 'percent', 'eta_sec', 'error')}
 
 # --- Funções Auxiliares ---
 def format_bytes(size):
@@ -102,6 +373,113 @@ def format_bytes(size):
         n += 1
     return f"{size:.1f} {power_labels[n]}B"
 
+def _legacy_variants(video_dict):
+    """Vídeos gravados antes da tabela video_variants têm só a variante principal."""
+    if not video_dict.get('path_processed'):
+        return []
+    return [{"filter": video_dict['filter'], "path_processed": video_dict['path_processed']}]
+
+def _cached_thumbnail_files(video):
+    """Inverso de thumbnail_fields para um vídeo já cadastrado."""
+    def name(path):
+        return os.path.basename(path) if path else None
+    thumbnails = json.loads(video['thumbnails'] or '{}')
+    return {"poster": name(video['path_thumbnail']),
+            "thumbnails": {width: name(path) for width, path in thumbnails.items()},
+            "sprite_vtt": name(video['path_sprite_vtt'])}
+
+def _list_thumbnail_files(files):
+    names = [files['poster'], *files['thumbnails'].values()]
+    if files['sprite_vtt']:
+        names += [files['sprite_vtt'], SPRITE_NAME]
+    return [name for name in names if name]
+
+def _job_payload(video_id, video_dir_rel, original_rel, variants, params, hls_input_rel=None, hls_output_rel=None):
+    """Payload de um job de processamento de `variants` (com filter e path_processed).
+
+    Os caminhos são relativos a media/ (formato de URL): cada worker os resolve na sua
+    própria montagem da pasta compartilhada.
+    """
+    payload = {
+        "video_id": video_id, "video_dir": to_url_path(video_dir_rel), "segments": SEGMENT_WORKERS,
+        "threads": PIPELINE_THREADS, "max_in_flight": PIPELINE_MAX_FRAMES_IN_FLIGHT,
+        "original_path": to_url_path(original_rel),
+        "variants": [{"filter": variant['filter'], "processed_path": to_url_path(variant['path_processed'])}
+                     for variant in variants],
+        "params": params,
+        "thumbs_dir": f"{to_url_path(video_dir_rel)}/thumbs",
+    }
+    # Se há ffmpeg para empacotar é decidido pelo worker (veja process_video).
+    if hls_input_rel:
+        payload['hls'] = {"input_path": to_url_path(hls_input_rel), "output_dir": to_url_path(hls_output_rel)}
+    # O job termina depois da resposta: se a requisição foi rastreada, o worker gera a
+    # linha de trace do job com o mesmo id.
+    request_trace = current_trace()
+    if request_trace is not None:
+        payload['trace_id'] = request_trace.id
+    return payload
+
+def enqueue_render(conn, video, filters=None):
+    """Enfileira a geração do que falta em disco de um vídeo já cadastrado e devolve o id do job.
+
+    Refaz as variantes em `filters` (todas, se None) cujo arquivo não existe, as
+    miniaturas e, se o vídeo tinha HLS, o HLS. Reaproveita um job pendente do mesmo vídeo;
+    devolve None se nada falta. Levanta QueueFullError.
+    """
+    pending = conn.execute("SELECT id FROM jobs WHERE video_id = ? AND state IN (?, ?)",
+                           (video['id'], JOB_QUEUED, JOB_RUNNING)).fetchone()
+    if pending is not None:
+        return pending['id']
+
+    media_root = app.config['MEDIA_ROOT']
+    variants = [dict(row) for row in conn.execute(
+        'SELECT filter, path_processed, filter_params FROM video_variants WHERE video_id = ?', (video['id'],))]
+    params = {}
+    for variant in variants:
+        params.update(json.loads(variant['filter_params']))
+    missing = [variant for variant in variants
+               if (filters is None or variant['filter'] in filters)
+               and not os.path.exists(os.path.join(media_root, variant['path_processed']))]
+    thumbs_missing = bool(video['path_thumbnail']) and not os.path.exists(os.path.join(media_root, video['path_thumbnail']))
+    hls_missing = bool(video['path_hls']) and not os.path.exists(os.path.join(media_root, video['path_hls']))
+    if hls_missing and not os.path.exists(os.path.join(media_root, video['path_processed'])):
+        # O HLS sai da variante principal, que também precisa ser refeita.
+        missing += [variant for variant in variants
+                    if variant['path_processed'] == video['path_processed'] and variant not in missing]
+    if not (missing or thumbs_missing or hls_missing):
+        return None
+
+    video_dir_rel = posixpath.dirname(posixpath.dirname(video['path_original']))
+    payload = _job_payload(video['id'], video_dir_rel, video['path_original'], missing, params,
+                           video['path_processed'] if hls_missing else None,
+                           posixpath.dirname(video['path_hls']) if hls_missing else None)
+    payload['mode'] = 'render'
+    if video['clip']:
+        payload['clip'] = json.loads(video['clip'])
+    with conn:
+        job_id = enqueue_job(conn, payload, MAX_PENDING_JOBS)
+    change_notifier.notify()
+    return job_id
+
+def _rendering_response(job_id):
+    response = jsonify({"rendering": True, "job_id": job_id, "status_url": f"/jobs/{job_id}",
+                        "message": "Arquivo sendo gerado, tente novamente em instantes."})
+    response.headers['Location'] = f"/jobs/{job_id}"
+    response.headers['Retry-After'] = str(RENDER_RETRY_AFTER_SEC)
+    return response, 202
+
+# Último registro de acesso de cada artefato neste processo (veja ARTIFACT_TOUCH_SEC).
+_artifact_touches = {}
+
+def touch_artifact_throttled(path):
+    now = time.monotonic()
+    if now - _artifact_touches.get(path, -ARTIFACT_TOUCH_SEC) < ARTIFACT_TOUCH_SEC:
+        return
+    if len(_artifact_touches) > 10000:
+        _artifact_touches.clear()
+    _artifact_touches[path] = now
+    touch_artifact(get_db_connection(), path)
+
 # --- Rotas da API (Endpoints) ---
 
 @app.route('/upload', methods=['POST'])
@@ -110,91 +488,520 @@ def upload_video():
         return jsonify({"error": "Nenhum arquivo de vídeo enviado"}), 400
     
     file = request.files['video']
-    filter_type = request.form.get('filter', 'grayscale')
 
     if file.filename == '':
         return jsonify({"error": "Nome de arquivo vazio"}), 400
-    if filter_type not in FILTERS:
-        return jsonify({"error": "Filtro inválido"}), 400
+    try:
+        filter_specs, filter_params = parse_filter_request(request.form.getlist('filter'), request.form.get('params'))
+        clip = parse_clip_range(request.form.get('start'), request.form.get('end'), request.form.get('unit'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     if file:
         original_filename = secure_filename(file.filename)
-        name, ext = os.path.splitext(original_filename)
-        
-        temp_path = os.path.join(app.config['UPLOAD_FOLDER'], original_filename)
-        file.save(temp_path)
-        
-        video_uuid = str(uuid.uuid4())
-        now = datetime.now()
-        date_path = os.path.join(str(now.year), f"{now.month:02d}", f"{now.day:02d}")
-        video_dir_rel = os.path.join(date_path, video_uuid)
-        video_dir_abs = os.path.join(app.config['MEDIA_ROOT'], video_dir_rel)
-
-        original_dir = os.path.join(video_dir_abs, "original")
-        processed_dir = os.path.join(video_dir_abs, "processed", filter_type)
-        thumbs_dir = os.path.join(video_dir_abs, "thumbs")
-        os.makedirs(original_dir, exist_ok=True)
-        os.makedirs(processed_dir, exist_ok=True)
-        os.makedirs(thumbs_dir, exist_ok=True)
-
-        final_original_path_rel = os.path.join(video_dir_rel, "original", f"video{ext}")
-        final_original_path_abs = os.path.join(app.config['MEDIA_ROOT'], final_original_path_rel)
+        # Nome temporário único: uploads simultâneos do mesmo arquivo não colidem.
+        temp_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{uuid.uuid4().hex}_{original_filename}")
+        # Calcula o hash enquanto grava, sem precisar ler o arquivo de novo.
+        with stage_timer('save'):
+            content_hash, size = save_and_hash(file.stream, temp_path)
+        metrics.inc('bytes_in', size)
+        return ingest_video(temp_path, original_filename, file.mimetype, filter_specs, filter_params, content_hash,
+                            hls=parse_hls_flag(request.form.get('hls')), clip=clip)
+
+    return jsonify({"error": "Falha no upload"}), 500
+
+def parse_hls_flag(value):
+    """Campo 'hls' opcional do upload; sem ele vale a configuração HLS_PACKAGING."""
+    if value is None or value == '':
+        return HLS_PACKAGING
+    return str(value).lower() in ('1', 'true', 'yes', 'on')
+
+def parse_clip_range(start, end, unit=None):
+    """Campos opcionais 'start'/'end' do upload: o trecho a processar, em segundos ou, com
+    unit='frame', em frames (fim exclusivo; sem 'end', até o fim do vídeo).
+
+    Retorna None para o vídeo inteiro ou {"start", "end", "unit"}. Levanta ValueError com a
+    mensagem para o cliente.
+    """
+    if start in (None, '') and end in (None, ''):
+        return None
+    unit = unit or CLIP_UNIT_SEC
+    if unit not in CLIP_UNITS:
+        raise ValueError(f"Unidade do trecho inválida: {unit} (use {' ou '.join(CLIP_UNITS)})")
+    cast = int if unit == CLIP_UNIT_FRAME else float
+    try:
+        start = cast(start) if start not in (None, '') else 0
+        end = cast(end) if end not in (None, '') else None
+    except (TypeError, ValueError):
+        raise ValueError("Início e fim do trecho devem ser números")
+    if not math.isfinite(start) or (end is not None and not math.isfinite(end)):
+        raise ValueError("Início e fim do trecho devem ser números")
+    if start < 0 or (end is not None and end <= start):
+        raise ValueError("Trecho inválido: o início deve ser maior ou igual a zero e menor que o fim")
+    if start == 0 and end is None:
+        return None
+    return {"start": start, "end": end, "unit": unit}
+
+def clip_key(clip):
+    """JSON canônico do trecho, gravado em videos.clip e usado como chave do cache; None = vídeo inteiro."""
+    return json.dumps(clip, sort_keys=True, separators=(',', ':')) if clip else None
+
+def parse_filter_request(specs, raw_params):
+    """Valida os filtros pedidos em um upload e devolve (filtros normalizados, parâmetros).
+
+    `specs` pode ter vários valores para gerar várias variantes com uma única decodificação;
+    cada valor é um filtro ou uma cadeia aplicada em uma única passada, ex.: "sepia,pixelate,invert".
+    `raw_params` são parâmetros opcionais em JSON, ex.: {"pixelate": {"pixel_size": 8}}.
+    Levanta ValueError com a mensagem para o cliente.
+    """
+    try:
+        filter_specs = list(dict.fromkeys(normalize_filter_spec(spec) for spec in (specs or ['grayscale'])))
+        filter_params = parse_filter_params(raw_params)
+    except ValueError as e:
+        raise ValueError(f"Filtro inválido: {e}")
+    if len(filter_specs) > MAX_VARIANTS_PER_UPLOAD:
+        raise ValueError(f"No máximo {MAX_VARIANTS_PER_UPLOAD} filtros por upload")
+    return filter_specs, filter_params
+
+def ingest_video(temp_path, original_filename, mime_type, filter_specs, filter_params, content_hash, hls=False,
+                 clip=None, source_video_id=None):
+    """Move um upload completo para media/ e enfileira o processamento das variantes.
+
+    Conteúdo já conhecido (mesmo hash) reaproveita o original por hardlink, e variantes já
+    renderizadas com o mesmo (hash, filtro, parâmetros, trecho) não são processadas de novo.
+    Se todas as variantes estiverem em cache, o vídeo é registrado na hora (201) sem job.
+    Com `clip` (veja parse_clip_range), o original fica inteiro e as variantes, miniaturas
+    e metadados são só do trecho.
+    """
+    name, ext = os.path.splitext(original_filename)
+    video_uuid = str(uuid.uuid4())
+    now = datetime.now()
+    date_path = os.path.join(str(now.year), f"{now.month:02d}", f"{now.day:02d}")
+    video_dir_rel = os.path.join(date_path, video_uuid)
+    video_dir_abs = os.path.join(app.config['MEDIA_ROOT'], video_dir_rel)
+
+    original_dir = os.path.join(video_dir_abs, "original")
+    thumbs_dir = os.path.join(video_dir_abs, "thumbs")
+    os.makedirs(original_dir, exist_ok=True)
+    os.makedirs(thumbs_dir, exist_ok=True)
+    for spec in filter_specs:
+        os.makedirs(os.path.join(video_dir_abs, "processed", spec), exist_ok=True)
+
+    final_original_path_rel = os.path.join(video_dir_rel, "original", f"video{ext}")
+    final_original_path_abs = os.path.join(app.config['MEDIA_ROOT'], final_original_path_rel)
+
+    variants = [{"filter": spec, "path_processed": os.path.join(video_dir_rel, "processed", spec, f"video{ext}"),
+                 "filter_params": params_key(spec, filter_params)}
+                for spec in filter_specs]
+    final_processed_path_rel = variants[0]['path_processed']
+
+    # Miniaturas, sprite sheet e índice WebVTT ficam todos em thumbs/
+    thumbs_dir_rel = os.path.join(video_dir_rel, "thumbs")
+
+    # --- Cache por conteúdo ---
+    clip_json = clip_key(clip)
+    conn = get_db_connection()
+    with db_timer('find_cached'):
+        cached_original = find_cached_original(conn, content_hash, clip_json)
+        cached_variants = {variant['filter']: find_cached_variant(conn, content_hash, variant['filter'],
+                                                                  variant['filter_params'], clip_json)
+                           for variant in variants}
+
+    if cached_original is not None:
+        cache_stats.add('original_hits')
+        link_file(os.path.join(app.config['MEDIA_ROOT'], cached_original['path_original']), final_original_path_abs)
+        os.remove(temp_path)
+    else:
+        cache_stats.add('original_misses')
         os.rename(temp_path, final_original_path_abs)
 
-        final_processed_path_rel = os.path.join(video_dir_rel, "processed", filter_type, f"video{ext}")
-        final_processed_path_abs = os.path.join(app.config['MEDIA_ROOT'], final_processed_path_rel)
-        apply_filter_to_video(final_original_path_abs, final_processed_path_abs, FILTERS[filter_type])
+    missing = []
+    for variant in variants:
+        cached_path = cached_variants[variant['filter']]
+        if cached_path is not None:
+            cache_stats.add('render_hits')
+            link_file(os.path.join(app.config['MEDIA_ROOT'], cached_path),
+                      os.path.join(app.config['MEDIA_ROOT'], variant['path_processed']))
+        else:
+            cache_stats.add('render_misses')
+            missing.append(variant)
 
-        cap = cv2.VideoCapture(final_original_path_abs)
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        duration = frame_count / fps if fps > 0 else 0
-        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        
-        # Gera o caminho relativo e absoluto da thumbnail
-        thumb_path_rel = os.path.join(video_dir_rel, "thumbs", "frame_0001.jpg")
-        thumb_path_abs = os.path.join(app.config['MEDIA_ROOT'], thumb_path_rel)
-
-        ret, frame = cap.read()
-        if ret:
-            cv2.imwrite(thumb_path_abs, frame)
-        cap.release()
-        
-        video_data = {
-            "id": video_uuid, "original_name": name, "original_ext": ext, "mime_type": file.mimetype,
-            "size_bytes": os.path.getsize(final_original_path_abs), "duration_sec": round(duration, 2),
-            "fps": round(fps, 2), "width": width, "height": height, "filter": filter_type,
-            "created_at": now.isoformat(), "path_original": final_original_path_rel,
-            "path_processed": final_processed_path_rel,
-            "path_thumbnail": thumb_path_rel  # <-- CORREÇÃO: Adicionado ao dicionário
-        }
-        save_metadata_to_db(video_data)
-        
-        return jsonify({"success": True, "video_id": video_uuid, "message": "Vídeo processado com sucesso!"}), 201
+    video_data = {
+        "id": video_uuid, "original_name": name, "original_ext": ext, "mime_type": mime_type,
+        "size_bytes": None, "duration_sec": None, "fps": None, "width": None, "height": None,
+        "filter": filter_specs[0], "created_at": now.isoformat(), "path_original": final_original_path_rel,
+        "path_processed": final_processed_path_rel,
+        "path_thumbnail": None,
+        "content_hash": content_hash,
+        "path_hls": None,
+        "thumbnails": "{}",
+        "path_sprite_vtt": None,
+        "clip": clip_json,
+        "source_video_id": source_video_id,
+        "path_preview": None,
+    }
 
-    return jsonify({"error": "Falha no upload"}), 500
+    # Metadados e miniaturas só servem se forem do mesmo trecho. As miniaturas do vídeo em
+    # cache podem ter sido apagadas pela cota; nesse caso o job as refaz.
+    cached_thumbnails = None
+    if cached_original is not None and cached_original['path_thumbnail'] and cached_original['clip'] == clip_json:
+        cached_thumbnails = _cached_thumbnail_files(cached_original)
+        thumbs_source = os.path.join(app.config['MEDIA_ROOT'], os.path.dirname(cached_original['path_thumbnail']))
+        if not all(os.path.exists(os.path.join(thumbs_source, name)) for name in _list_thumbnail_files(cached_thumbnails)):
+            cached_thumbnails = None
+
+    if not missing and cached_thumbnails is not None:
+        for key in ("size_bytes", "duration_sec", "fps", "width", "height"):
+            video_data[key] = cached_original[key]
+        for name in _list_thumbnail_files(cached_thumbnails):
+            link_file(os.path.join(thumbs_source, name), os.path.join(thumbs_dir, name))
+        video_data.update(thumbnail_fields(to_url_path(thumbs_dir_rel), cached_thumbnails))
+        save_metadata_to_db(video_data, variants)
+        return jsonify({"success": True, "video_id": video_uuid, "cached": True,
+                        "message": "Vídeo já processado anteriormente, resultado reaproveitado."}), 201
+
+    # Sem RENDER_ON_UPLOAD o job só extrai metadados e miniaturas; as variantes e o HLS são
+    # gerados no primeiro acesso.
+    render_now = missing if RENDER_ON_UPLOAD else []
+    hls_now = hls and RENDER_ON_UPLOAD
+    payload = _job_payload(video_uuid, video_dir_rel, final_original_path_rel, render_now, filter_params,
+                           final_processed_path_rel if hls_now else None,
+                           os.path.join(video_dir_rel, "hls", filter_specs[0]) if hls_now else None)
+    # Gravados pelo worker no fim do job (ou, com prévia, assim que ela fica pronta).
+    payload['video'] = video_data
+    payload['video_variants'] = [dict(variant, path_processed=to_url_path(variant['path_processed']))
+                                 for variant in variants]
+    if clip:
+        payload['clip'] = clip
+    if PREVIEW_ENABLED and render_now:
+        payload['preview'] = {"path": to_url_path(os.path.join(video_dir_rel, "preview", f"video{ext}")),
+                              "height": PREVIEW_HEIGHT, "frame_step": PREVIEW_FRAME_STEP,
+                              "min_frames": PREVIEW_MIN_FRAMES}
+
+    try:
+        with conn:
+            job_id = enqueue_job(conn, payload, MAX_PENDING_JOBS)
+        change_notifier.notify()
+    except QueueFullError:
+        shutil.rmtree(video_dir_abs, ignore_errors=True)
+        return jsonify({"error": "Fila de processamento cheia, tente novamente mais tarde"}), 503
+
+    response = jsonify({"success": True, "video_id": video_uuid, "job_id": job_id,
+                        "status_url": f"/jobs/{job_id}", "message": "Vídeo recebido, processamento na fila."})
+    response.headers['Location'] = f"/jobs/{job_id}"
+    return response, 202
+
+# --- Métricas dos jobs ---
+# Os jobs terminam em processos worker, possivelmente em outras máquinas: as métricas deles
+# são lidas da tabela jobs a cada leitura do /metrics, a partir do último job já contado.
+_jobs_collected = {"after": (time.time(), ''), "lock": threading.Lock()}
+
+def _count_jobs():
+    with get_pool(DB_FILE).connection() as conn:
+        return count_jobs(conn)
+
+def collect_job_metrics():
+    """Registra estágios, frames, fps de cada filtro e bytes gravados dos jobs terminados desde a última leitura."""
+    with _jobs_collected['lock'], get_pool(DB_FILE).connection() as conn:
+        rows = conn.execute(""" SELECT id, state, created_at, started_at, finished_at, result FROM jobs
+                                WHERE (finished_at, id) > (?, ?) ORDER BY finished_at, id """,
+                            _jobs_collected['after']).fetchall()
+        if rows:
+            _jobs_collected['after'] = (rows[-1]['finished_at'], rows[-1]['id'])
+    for row in rows:
+        metrics.inc('jobs_finished', state=row['state'])
+        if row['started_at'] is not None:
+            metrics.observe('stage_duration_seconds', max(row['started_at'] - row['created_at'], 0), stage='queue_wait')
+        if not row['result']:
+            continue
+        result = json.loads(row['result'])
+        for stage, seconds in result['stage_seconds'].items():
+            metrics.observe('stage_duration_seconds', seconds, stage=stage)
+        # O estágio de filtro aplica todas as variantes a cada frame: o tempo é dividido entre elas.
+        filter_seconds = result['stage_seconds']['filter'] / max(len(result['filters']), 1)
+        for name in result['filters']:
+            metrics.inc('frames_processed', result['frames'], filter=name)
+            if filter_seconds > 0:
+                metrics.observe('filter_fps', result['frames'] / filter_seconds, filter=name)
+        metrics.inc('bytes_out', result['bytes_out'])
+
+# --- Upload retomável em blocos ---
+
+@app.route('/uploads', methods=['POST'])
+def create_upload_session():
+    """Abre uma sessão de upload em blocos: {filename, size, filter, params, start, end} -> upload_id."""
+    data = request.get_json(silent=True) or {}
+    original_filename = secure_filename(data.get('filename') or '')
+    if not original_filename:
+        return jsonify({"error": "Nome de arquivo vazio"}), 400
+    specs = data.get('filter')
+    try:
+        filter_specs, filter_params = parse_filter_request([specs] if isinstance(specs, str) else specs,
+                                                           data.get('params'))
+        clip = parse_clip_range(data.get('start'), data.get('end'), data.get('unit'))
+        session = upload_sessions.create(original_filename, data.get('size'), data.get('mime_type'),
+                                         filter_specs, filter_params, hls=parse_hls_flag(data.get('hls')), clip=clip)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status
+
+    response = jsonify({"upload_id": session['id'], "chunk_size": DEFAULT_CHUNK_SIZE,
+                        "max_chunk_size": MAX_CHUNK_SIZE, "upload_url": f"/uploads/{session['id']}"})
+    response.headers['Location'] = f"/uploads/{session['id']}"
+    return response, 201
+
+@app.route('/uploads/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """Grava o corpo da requisição a partir de ?offset=N (blocos podem chegar em qualquer ordem)."""
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify({"error": "Parâmetro 'offset' obrigatório"}), 400
+    try:
+        with stage_timer('save'):
+            status = upload_sessions.write_chunk(upload_id, offset, request.stream, request.content_length)
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status
+    metrics.inc('bytes_in', request.content_length)
+    return jsonify(status)
+
+@app.route('/uploads/<upload_id>', methods=['GET'])
+def get_upload_session(upload_id):
+    """Informa os intervalos já recebidos e o offset a partir do qual retomar."""
+    try:
+        return jsonify(upload_sessions.status(upload_id))
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status
+
+@app.route('/uploads/<upload_id>', methods=['DELETE'])
+def cancel_upload_session(upload_id):
+    try:
+        upload_sessions.discard(upload_id)
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status
+    return jsonify({"success": True})
+
+@app.route('/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload_session(upload_id):
+    """Finaliza a sessão e segue o mesmo caminho do /upload (cache e fila de processamento)."""
+    try:
+        session, data_path = upload_sessions.finish(upload_id)
+    except UploadError as e:
+        if e.status == 409:
+            return jsonify({"error": str(e), **upload_sessions.status(upload_id)}), 409
+        return jsonify({"error": str(e)}), e.status
+
+    try:
+        with stage_timer('hash'):
+            content_hash = hash_file(data_path)
+        return ingest_video(data_path, session['filename'], session['mime_type'], session['filters'],
+                            session['params'], content_hash, hls=session.get('hls', HLS_PACKAGING),
+                            clip=session.get('clip'))
+    except Exception:
+        # A sessão já foi encerrada: sem isso o .part ficaria para trás (o ingest o move ou apaga).
+        if os.path.exists(data_path):
+            os.remove(data_path)
+        raise
+
+@app.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Acertos e erros do cache de uploads por conteúdo."""
+    return jsonify(cache_stats.snapshot())
+
+@app.route('/metrics')
+def get_metrics():
+    """Métricas no formato texto do Prometheus (404 com METRICS_ENABLED desligado)."""
+    if not metrics.enabled:
+        return jsonify({"error": "Métricas desativadas"}), 404
+    collect_job_metrics()
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/jobs', methods=['GET'])
+def get_jobs():
+    """Lista os jobs da fila: pendentes, em execução e os últimos terminados."""
+    return jsonify(list_jobs(get_db_connection()))
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """Retorna o estado (queued/running/done/failed), o percentual de frames e o ETA de um job.
+
+    `attempts` conta as tentativas; um job que falhou e ainda pode ser tentado de novo volta
+    a `queued` com o último erro em `error`.
+    """
+    job = get_job(get_db_connection(), job_id)
+    if job is None:
+        return jsonify({"error": "Job não encontrado"}), 404
+    return jsonify(job)
+
+def cached_response(build):
+    """Resposta de `build(geração)` (um CachedResponse) para esta rota e estes parâmetros,
+    montada só uma vez por geração do banco (veja responses.py), com ETag e compressão."""
+    generation = last_change_seq(get_db_connection())
+    key = (request.endpoint, tuple(sorted(request.args.items(multi=True))))
+    entry, hit = response_cache.get_or_build(generation, key, lambda: build(generation))
+    metrics.inc('response_cache', endpoint=request.endpoint, result='hit' if hit else 'miss')
+    return entry.respond(request)
 
 @app.route('/videos', methods=['GET'])
 def get_videos():
-    """Retorna a lista de todos os vídeos processados, com caminhos formatados para URL."""
+    """Retorna uma página de vídeos: {"items": [...], "next_cursor": ..., "last_seq": ...}.
+
+    Veja parse_listing_args para os parâmetros; passe next_cursor em `cursor` para a
+    página seguinte (null quando não há mais vídeos) e last_seq ao /videos/changes ou ao
+    /events para receber só o que mudou depois. Enquanto nenhum vídeo muda, a resposta sai
+    do cache (304 com If-None-Match).
+    """
+    try:
+        query = parse_listing_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def build(last_seq):
+        # last_seq é lido antes da página: aplicar as alterações a partir dele nunca perde nenhuma.
+        videos, next_cursor = query_videos(get_db_connection(), query)
+        body = app.json.dumps({"items": videos, "next_cursor": next_cursor, "last_seq": last_seq})
+        return CachedResponse(body.encode(), app.json.mimetype)
+    return cached_response(build)
+
+@app.route('/videos/changes', methods=['GET'])
+def get_video_changes():
+    """Retorna as alterações desde `since` (o last_seq do /videos ou da chamada anterior).
+
+    Resposta: {"changes": [{"seq", "kind", "video_id", "video"}], "last_seq", "has_more",
+    "reset"}; veja load_changes. O custo depende do número de alterações, não do tamanho do
+    acervo. Com has_more, chame de novo com o last_seq devolvido.
+    """
+    try:
+        since = int(request.args.get('since', ''))
+        limit = int(request.args.get('limit', CHANGES_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"error": "since e limit devem ser números inteiros"}), 400
+    if since < 0 or not 1 <= limit <= CHANGES_PAGE_SIZE:
+        return jsonify({"error": f"since deve ser >= 0 e limit deve estar entre 1 e {CHANGES_PAGE_SIZE}"}), 400
+    try:
+        fields = parse_fields(request.args['fields']) if request.args.get('fields') else VIDEO_FIELDS
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(load_changes(get_db_connection(), since, fields, limit))
+
+@app.route('/events')
+def stream_events():
+    """Stream Server-Sent Events com as alterações de vídeos e o progresso dos jobs.
+
+    Eventos: `change` (um item do /videos/changes, com id = seq), `reset` (o cliente está
+    atrasado demais e deve recarregar a lista) e `job` (estado, percentual e ETA dos jobs).
+    Retoma de `since` ou do cabeçalho Last-Event-ID que o EventSource envia ao reconectar;
+    sem nenhum dos dois, envia só o que acontecer a partir da conexão.
+    """
+    try:
+        since = request.headers.get('Last-Event-ID') or request.args.get('since')
+        since = int(since) if since else None
+        fields = parse_fields(request.args['fields']) if request.args.get('fields') else VIDEO_FIELDS
+    except ValueError as e:
+        return jsonify({"error": str(e) if request.args.get('fields') else "since inválido"}), 400
+    # O gerador roda depois do fim da requisição, então usa o pool diretamente em vez de g.
+    pool = get_pool(DB_FILE)
+
+    def generate():
+        last_seq = since
+        # Jobs que já tinham terminado antes da conexão não geram eventos.
+        with pool.connection() as conn:
+            jobs_seen = {job['id']: _job_event(job) for job in list_jobs(conn) if job['finished_at'] is not None}
+        version = change_notifier.version
+        last_sent = time.monotonic()
+        yield "retry: 3000\n\n"
+        while True:
+            messages = []
+            with pool.connection() as conn:
+                if last_seq is None:
+                    last_seq = last_change_seq(conn)
+                has_more = True
+                while has_more:
+                    delta = load_changes(conn, last_seq, fields)
+                    if delta['reset']:
+                        messages.append(format_sse('reset', {"last_seq": delta['last_seq']}, delta['last_seq']))
+                    messages += [format_sse('change', change, change['seq']) for change in delta['changes']]
+                    last_seq, has_more = delta['last_seq'], delta['has_more']
+                jobs = list_jobs(conn)
+
+            # Jobs terminam em outros processos, sem avisar o change_notifier: enquanto houver
+            # jobs ativos, o registro de alterações é relido a cada EVENTS_JOB_INTERVAL_SEC.
+            active = False
+            for job in jobs:
+                active = active or job['finished_at'] is None
+                event = _job_event(job)
+                if jobs_seen.get(job['id']) != event:
+                    jobs_seen[job['id']] = event
+                    messages.append(format_sse('job', event))
+
+            if messages:
+                yield "".join(messages)
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent >= EVENTS_HEARTBEAT_SEC:
+                # Comentário SSE: mantém a conexão aberta em proxies e detecta clientes que saíram.
+                yield ": ping\n\n"
+                last_sent = time.monotonic()
+            version = change_notifier.wait(version, EVENTS_JOB_INTERVAL_SEC if active else EVENTS_HEARTBEAT_SEC)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/videos/<video_id>/render', methods=['POST'])
+def prefetch_video(video_id):
+    """Gera de antemão os arquivos que faltam de um vídeo (variantes `filter`, ou todas).
+
+    Responde 200 se já está tudo em disco (e conta como acesso) ou 202 com o job.
+    """
     conn = get_db_connection()
-    videos_from_db = conn.execute('SELECT * FROM videos ORDER BY created_at DESC').fetchall()
-    conn.close()
-    
-    # CORREÇÃO: Formata os caminhos antes de enviar o JSON
-    videos_list = []
-    for video in videos_from_db:
-        video_dict = dict(video)
-        if video_dict.get('path_original'):
-            video_dict['path_original'] = video_dict['path_original'].replace('\\', '/')
-        if video_dict.get('path_processed'):
-            video_dict['path_processed'] = video_dict['path_processed'].replace('\\', '/')
-        if video_dict.get('path_thumbnail'):
-            video_dict['path_thumbnail'] = video_dict['path_thumbnail'].replace('\\', '/')
-        videos_list.append(video_dict)
-        
-    return jsonify(videos_list)
+    video = conn.execute('SELECT * FROM videos WHERE id = ?', (video_id,)).fetchone()
+    if video is None:
+        return jsonify({"error": "Vídeo não encontrado"}), 404
+    try:
+        filters = [normalize_filter_spec(spec) for spec in request.values.getlist('filter')] or None
+        job_id = enqueue_render(conn, video, filters)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except QueueFullError:
+        return jsonify({"error": "Fila de processamento cheia, tente novamente mais tarde"}), 503
+    if job_id is not None:
+        return _rendering_response(job_id)
+    artifacts = conn.execute('SELECT path FROM artifacts WHERE video_id = ?', (video_id,)).fetchall()
+    for artifact in artifacts:
+        touch_artifact_throttled(artifact['path'])
+    return jsonify({"success": True, "rendering": False, "message": "Arquivos já disponíveis."}), 200
+
+@app.route('/videos/<video_id>/clips', methods=['POST'])
+def create_clip(video_id):
+    """Cria um vídeo novo com um trecho do original de `video_id`, sem novo upload.
+
+    Aceita os campos do /upload (filter, params, hls, start, end, unit), com o trecho
+    relativo ao original inteiro, e responde como ele (202 com o job, ou 201 do cache).
+    """
+    conn = get_db_connection()
+    video = conn.execute('SELECT * FROM videos WHERE id = ?', (video_id,)).fetchone()
+    if video is None:
+        return jsonify({"error": "Vídeo não encontrado"}), 404
+    try:
+        filter_specs, filter_params = parse_filter_request(request.values.getlist('filter'), request.values.get('params'))
+        clip = parse_clip_range(request.values.get('start'), request.values.get('end'), request.values.get('unit'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    # A duração gravada é a do original só se o vídeo não for ele mesmo um trecho.
+    if clip is not None and not video['clip'] and video['duration_sec']:
+        length = video['duration_sec'] * (video['fps'] if clip['unit'] == CLIP_UNIT_FRAME else 1)
+        if clip['start'] >= length:
+            return jsonify({"error": "O trecho começa depois do fim do vídeo"}), 400
+
+    source_path = os.path.join(app.config['MEDIA_ROOT'], video['path_original'])
+    if not os.path.exists(source_path):
+        return jsonify({"error": "Original do vídeo não encontrado"}), 404
+    # O ingest consome o arquivo temporário; um hardlink do original faz esse papel sem cópia.
+    original_filename = f"{video['original_name']}{video['original_ext']}"
+    temp_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{uuid.uuid4().hex}_{original_filename}")
+    link_file(source_path, temp_path)
+    content_hash = video['content_hash'] or hash_file(temp_path)
+    return ingest_video(temp_path, original_filename, video['mime_type'], filter_specs, filter_params, content_hash,
+                        hls=parse_hls_flag(request.values.get('hls')), clip=clip, source_video_id=video_id)
 
 @app.route('/video/<video_id>', methods=['DELETE'])
 def delete_video(video_id):
@@ -204,55 +1011,134 @@ def delete_video(video_id):
         video = conn.execute('SELECT * FROM videos WHERE id = ?', (video_id,)).fetchone()
         
         if video is None:
-            conn.close()
             return jsonify({"error": "Vídeo não encontrado"}), 404
 
         base_path_rel = os.path.dirname(os.path.dirname(video['path_original']))
         video_dir_abs = os.path.join(app.config['MEDIA_ROOT'], base_path_rel)
-        
+
+        # Com a prévia (ou uma renderização sob demanda) o vídeo pode ser apagado com o job
+        # ainda rodando: o cancelamento entra na mesma transação, e só depois dela a pasta é
+        # apagada, quando o worker já não consegue publicar nada (veja jobs.cancel_jobs).
+        with db_timer('delete_video'):
+            cancel_jobs(conn, video_id)
+            conn.execute('DELETE FROM video_variants WHERE video_id = ?', (video_id,))
+            conn.execute('DELETE FROM videos WHERE id = ?', (video_id,))
+            prune_changes(conn)
+            conn.commit()
+
         if os.path.exists(video_dir_abs):
-            shutil.rmtree(video_dir_abs)
-        
-        conn.execute('DELETE FROM videos WHERE id = ?', (video_id,))
-        conn.commit()
-        conn.close()
+            shutil.rmtree(video_dir_abs, ignore_errors=True)
+        change_notifier.notify()
         
         return jsonify({"success": True, "message": "Vídeo deletado com sucesso"}), 200
     except Exception as e:
         print(f"Erro ao deletar vídeo {video_id}: {e}")
         return jsonify({"error": "Erro interno no servidor ao tentar deletar o vídeo."}), 500
 
-@app.route('/gui')
-def server_gui():
-    """Renderiza a página web com o histórico de vídeos."""
+def _gui_page(args):
+    """Página de vídeos já preparada para o template, com o cursor da próxima página."""
+    query = parse_listing_args(args)
+    query['fields'] = VIDEO_FIELDS
     conn = get_db_connection()
-    videos_data = conn.execute('SELECT * FROM videos ORDER BY created_at DESC').fetchall()
-    conn.close()
-    
-    videos_for_template = []
-    for video in videos_data:
-        video_dict = dict(video)
-        
-        # Apenas formata os caminhos que já vêm do banco
-        video_dict['path_original'] = video['path_original'].replace('\\', '/')
-        if video_dict.get('path_processed'):
-            video_dict['path_processed'] = video['path_processed'].replace('\\', '/')
-        if video_dict.get('path_thumbnail'):
-            video_dict['path_thumbnail'] = video['path_thumbnail'].replace('\\', '/')
-        
+    videos, next_cursor = query_videos(conn, query)
+    for video_dict in videos:
         video_dict['formatted_size'] = format_bytes(video_dict.get('size_bytes'))
         video_dict['resolution'] = f"{video_dict.get('width')}x{video_dict.get('height')}"
-        
-        videos_for_template.append(video_dict)
-        
-    return render_template('index.html', videos=videos_for_template)
+    return videos, next_cursor
+
+@app.route('/gui')
+def server_gui():
+    """Renderiza a página web com a primeira página do histórico de vídeos (em cache por geração)."""
+    def build(last_seq):
+        videos, next_cursor = _gui_page(request.args)
+        html = render_template('index.html', videos=videos, next_cursor=next_cursor, last_seq=last_seq)
+        return CachedResponse(html.encode(), 'text/html')
+    try:
+        return cached_response(build)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/gui/videos')
+def server_gui_page():
+    """Cards HTML da página seguinte, usados pelo botão "Carregar mais" da página web.
+
+    O cursor da próxima página vai no cabeçalho X-Next-Cursor (vazio na última).
+    """
+    def build(last_seq):
+        videos, next_cursor = _gui_page(request.args)
+        html = render_template('_video_cards.html', videos=videos)
+        return CachedResponse(html.encode(), 'text/html', headers={'X-Next-Cursor': next_cursor or ''})
+    try:
+        return cached_response(build)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+def is_immutable_media(filename):
+    """Arquivos da pasta de um vídeo (AAAA/MM/DD/<uuid>/...) nunca mudam: um artefato apagado
+    pela cota é gerado de novo igual, no mesmo caminho."""
+    parts = filename.split('/')
+    if len(parts) < 5:
+        return False
+    try:
+        uuid.UUID(parts[3])
+    except ValueError:
+        return False
+    return True
 
 @app.route('/media/<path:filename>')
 def serve_media(filename):
-    """Serve os arquivos de mídia (vídeos, thumbnails) para o navegador."""
+    """Serve os arquivos de mídia (vídeos, thumbnails) para o navegador.
+
+    Em produção, prefira servir media/ direto pelo servidor web (veja o README); os arquivos
+    da pasta de um vídeo saem com Cache-Control longo e immutable para que navegadores,
+    proxies e CDNs os guardem sem revalidar.
+    Variantes, miniaturas e HLS apagados pela cota (ou ainda não gerados) respondem 202 com
+    o job que os gera, e cada acesso conta para a ordem de remoção (veja storage.py).
+    """
+    artifact = artifact_for(filename)
+    if artifact is not None:
+        video_id, kind, artifact_path = artifact
+        if not os.path.isfile(os.path.join(app.config['MEDIA_ROOT'], filename)):
+            return render_missing_media(video_id, kind, filename)
+        touch_artifact_throttled(artifact_path)
+    if is_immutable_media(filename):
+        response = send_from_directory(app.config['MEDIA_ROOT'], filename, max_age=MEDIA_CACHE_MAX_AGE)
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
     return send_from_directory(app.config['MEDIA_ROOT'], filename)
 
+def render_missing_media(video_id, kind, filename):
+    """Enfileira a geração do artefato ausente `filename` e responde 202, ou 404 se ele não existe."""
+    conn = get_db_connection()
+    video = conn.execute('SELECT * FROM videos WHERE id = ?', (video_id,)).fetchone()
+    if video is None:
+        return jsonify({"error": "Arquivo não encontrado"}), 404
+    filters = []
+    if kind == 'variant':
+        variant = conn.execute('SELECT filter FROM video_variants WHERE video_id = ? AND path_processed = ?',
+                               (video_id, filename)).fetchone()
+        if variant is None:
+            return jsonify({"error": "Arquivo não encontrado"}), 404
+        filters = [variant['filter']]
+    try:
+        job_id = enqueue_render(conn, video, filters)
+    except QueueFullError:
+        return jsonify({"error": "Fila de processamento cheia, tente novamente mais tarde"}), 503
+    if job_id is None:
+        return jsonify({"error": "Arquivo não encontrado"}), 404
+    return _rendering_response(job_id)
+
 # --- Bloco de Execução Principal ---
 if __name__ == '__main__':
     os.makedirs(INCOMING_PATH, exist_ok=True)
+    init_db(DB_FILE)
+    # Com debug=True este bloco roda também no processo do reloader, que não atende
+    # requisições: a recuperação e os workers ficam só no processo que atende.
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        cleanup_incoming(INCOMING_PATH)
+        with get_pool(DB_FILE).connection() as conn:
+            recover_jobs(conn, MEDIA_ROOT)
+        workers = start_workers(PROCESSING_WORKERS, DB_FILE, MEDIA_ROOT, quota_bytes=STORAGE_QUOTA_BYTES)
+        atexit.register(lambda: [worker.terminate() for worker in workers])
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
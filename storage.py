@@ -0,0 +1,206 @@
+# storage.py
+# Arquivos derivados (variantes processadas, miniaturas e HLS) tratados como cache: cada um
+# é registrado na tabela `artifacts` com tamanho e último acesso, e os menos acessados são
+# apagados quando o total passa da cota; o /media os renderiza de novo no próximo acesso.
+# Os originais nunca são apagados. Manutenção avulsa:
+#
+#     python storage.py --db videos.db --media media --quota-gb 20 --scan
+import os
+import time
+import shutil
+import argparse
+import posixpath
+from glob import glob, escape as glob_escape
+from database import connect, init_db, to_url_path, DB_FILE
+from jobs import JOB_QUEUED, JOB_RUNNING
+
+MEDIA_ROOT = "media"
+# Cota padrão dos arquivos derivados (None desativa a remoção).
+DEFAULT_QUOTA_BYTES = 20 * 1024 ** 3
+# Artefatos lidos por consulta durante a remoção e o registro dos já existentes (--scan).
+EVICTION_BATCH = 100
+SCAN_BATCH = 1000
+# Pastas de vídeo sem registro no banco nem job pendente, mais antigas que isso, são restos
+# de um upload interrompido; o mesmo vale para arquivos soltos em incoming/.
+ORPHAN_MIN_AGE_SEC = 60 * 60
+
+ARTIFACT_VARIANT = 'variant'
+ARTIFACT_THUMBS = 'thumbs'
+ARTIFACT_HLS = 'hls'
+
+def artifact_for(path):
+    """Retorna (video_id, tipo, caminho do artefato) do arquivo `path` de media/, ou None.
+
+    `path` está no formato de URL (AAAA/MM/DD/<id>/...). Variantes são arquivos; miniaturas
+    (thumbs/) e HLS (hls/<filtro>/) são pastas. Originais e caminhos fora dessa estrutura
+    não são artefatos.
+    """
+    parts = path.split('/')
+    if len(parts) < 6:
+        return None
+    video_id, kind = parts[3], parts[4]
+    if kind == 'processed' and len(parts) == 7:
+        return video_id, ARTIFACT_VARIANT, path
+    if kind == 'thumbs':
+        return video_id, ARTIFACT_THUMBS, '/'.join(parts[:5])
+    if kind == 'hls' and len(parts) >= 7:
+        return video_id, ARTIFACT_HLS, '/'.join(parts[:6])
+    return None
+
+def path_size(path):
+    """Tamanho de um arquivo ou soma dos arquivos de uma pasta; 0 se não existir."""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+def video_artifacts(media_root, video, variants):
+    """Artefatos de um vídeo presentes em disco: [(tipo, caminho, bytes)].
+
+    `video` é uma linha (ou o dicionário) de `videos` e `variants` as linhas de suas variantes.
+    """
+    candidates = [(ARTIFACT_VARIANT, to_url_path(variant['path_processed'])) for variant in variants]
+    if video['path_thumbnail']:
+        candidates.append((ARTIFACT_THUMBS, posixpath.dirname(to_url_path(video['path_thumbnail']))))
+    if video['path_hls']:
+        candidates.append((ARTIFACT_HLS, posixpath.dirname(to_url_path(video['path_hls']))))
+    artifacts = []
+    for kind, path in candidates:
+        full_path = os.path.join(media_root, path)
+        if os.path.exists(full_path):
+            artifacts.append((kind, path, path_size(full_path)))
+    return artifacts
+
+def record_artifacts(conn, video_id, artifacts):
+    """Registra (ou atualiza o tamanho de) artefatos recém-gravados; o commit fica com quem chama."""
+    now = time.time()
+    conn.executemany(""" INSERT INTO artifacts(path, video_id, kind, size_bytes, created_at, last_access_at)
+                         VALUES (?, ?, ?, ?, ?, ?)
+                         ON CONFLICT(path) DO UPDATE SET size_bytes = excluded.size_bytes """,
+                     [(path, video_id, kind, size, now, now) for kind, path, size in artifacts])
+
+def touch_artifact(conn, path):
+    with conn:
+        conn.execute("UPDATE artifacts SET last_access_at = ? WHERE path = ?", (time.time(), path))
+
+def storage_usage(conn):
+    return conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM artifacts").fetchone()[0]
+
+def evict_to_quota(conn, media_root, quota_bytes=DEFAULT_QUOTA_BYTES):
+    """Apaga os artefatos acessados há mais tempo até o total caber em `quota_bytes`.
+
+    Artefatos de vídeos com job pendente ficam de fora, para não apagar a entrada de um HLS
+    em andamento. Variantes reaproveitadas por hardlink contam uma vez por vídeo. Retorna
+    (artefatos apagados, bytes liberados).
+    """
+    if quota_bytes is None:
+        return 0, 0
+    excess = storage_usage(conn) - quota_bytes
+    removed = freed = 0
+    while excess > 0:
+        rows = conn.execute(""" SELECT path, size_bytes FROM artifacts
+                                WHERE video_id NOT IN (SELECT video_id FROM jobs
+                                                       WHERE state IN (?, ?) AND video_id IS NOT NULL)
+                                ORDER BY last_access_at LIMIT ? """,
+                            (JOB_QUEUED, JOB_RUNNING, EVICTION_BATCH)).fetchall()
+        if not rows:
+            break
+        evicted = []
+        for row in rows:
+            if excess <= 0:
+                break
+            # Arquivo antes do registro: uma queda entre os dois deixa só um registro sem
+            # arquivo, que o /media trata como artefato a renderizar.
+            full_path = os.path.join(media_root, row['path'])
+            if os.path.isdir(full_path):
+                shutil.rmtree(full_path, ignore_errors=True)
+            elif os.path.exists(full_path):
+                os.remove(full_path)
+            evicted.append((row['path'],))
+            excess -= row['size_bytes']
+            freed += row['size_bytes']
+        with conn:
+            conn.executemany("DELETE FROM artifacts WHERE path = ?", evicted)
+        removed += len(evicted)
+    return removed, freed
+
+def scan_artifacts(conn, media_root):
+    """Registra os artefatos já existentes em disco e esquece os que não existem mais.
+
+    Para bancos com vídeos processados antes da tabela `artifacts`; percorre o acervo inteiro.
+    """
+    last_id = ''
+    while True:
+        videos = conn.execute(""" SELECT id, path_thumbnail, path_hls FROM videos WHERE id > ?
+                                  ORDER BY id LIMIT ? """, (last_id, SCAN_BATCH)).fetchall()
+        if not videos:
+            break
+        with conn:
+            for video in videos:
+                variants = conn.execute("SELECT path_processed FROM video_variants WHERE video_id = ?",
+                                        (video['id'],)).fetchall()
+                record_artifacts(conn, video['id'], video_artifacts(media_root, video, variants))
+        last_id = videos[-1]['id']
+
+    missing = [(row['path'],) for row in conn.execute("SELECT path FROM artifacts")
+               if not os.path.exists(os.path.join(media_root, row['path']))]
+    with conn:
+        conn.executemany("DELETE FROM artifacts WHERE path = ?", missing)
+
+# --- Restos de uploads e jobs interrompidos ---
+
+def cleanup_orphans(conn, media_root, min_age=ORPHAN_MIN_AGE_SEC):
+    """Apaga pastas de vídeo (media/AAAA/MM/DD/<id>) sem registro em `videos` nem job pendente.
+
+    São restos de uploads interrompidos entre a cópia do original e o registro do job, ou
+    de jobs falhos cuja limpeza não chegou a rodar. Só considera pastas mais antigas que
+    `min_age`, para não apagar um upload que está sendo registrado agora.
+    """
+    cutoff = time.time() - min_age
+    pattern = os.path.join(glob_escape(media_root), '[0-9]' * 4, '[0-9]' * 2, '[0-9]' * 2, '*')
+    for video_dir in glob(pattern):
+        if not os.path.isdir(video_dir) or os.path.getmtime(video_dir) > cutoff:
+            continue
+        video_id = os.path.basename(video_dir)
+        registered = conn.execute("SELECT 1 FROM videos WHERE id = ?", (video_id,)).fetchone()
+        pending = conn.execute("SELECT 1 FROM jobs WHERE video_id = ? AND state IN (?, ?)",
+                               (video_id, JOB_QUEUED, JOB_RUNNING)).fetchone()
+        if not registered and not pending:
+            shutil.rmtree(video_dir, ignore_errors=True)
+            print(f"Pasta órfã removida: {video_dir}")
+
+def cleanup_incoming(path, min_age=ORPHAN_MIN_AGE_SEC):
+    """Apaga uploads diretos interrompidos (arquivos soltos em incoming/); as sessões de
+    upload em blocos têm sua própria expiração."""
+    if not os.path.isdir(path):
+        return
+    cutoff = time.time() - min_age
+    for entry in os.scandir(path):
+        if entry.is_file() and entry.stat().st_mtime < cutoff:
+            os.remove(entry.path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Limpeza e cota dos arquivos derivados em media/.")
+    parser.add_argument('--db', default=DB_FILE)
+    parser.add_argument('--media', default=MEDIA_ROOT)
+    parser.add_argument('--quota-gb', type=float, default=DEFAULT_QUOTA_BYTES / 1024 ** 3)
+    parser.add_argument('--scan', action='store_true',
+                        help="registra os arquivos derivados já existentes (rode uma vez após atualizar)")
+    args = parser.parse_args()
+
+    init_db(args.db)
+    conn = connect(args.db)
+    if args.scan:
+        scan_artifacts(conn, args.media)
+    cleanup_incoming(os.path.join(args.media, "incoming"))
+    cleanup_orphans(conn, args.media)
+    removed, freed = evict_to_quota(conn, args.media, int(args.quota_gb * 1024 ** 3))
+    print(f"{removed} artefatos removidos ({freed / 1024 ** 2:.1f} MiB); "
+          f"em uso: {storage_usage(conn) / 1024 ** 2:.1f} MiB")
+    conn.close()
+
+if __name__ == '__main__':
+    main()
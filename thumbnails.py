@@ -0,0 +1,130 @@
+# thumbnails.py
+import os
+import json
+import cv2
+import numpy as np
+
+# Larguras (px) das miniaturas geradas a partir do primeiro frame, além do frame inteiro.
+THUMBNAIL_WIDTHS = (160, 320, 640)
+POSTER_NAME = "frame_0001.jpg"
+THUMBNAIL_NAME = "thumb_{width}.jpg"
+# Linha do tempo para pré-visualização ao passar o mouse: um quadro a cada
+# SPRITE_INTERVAL_SEC segundos (no máximo SPRITE_MAX_TILES), em uma grade de SPRITE_COLUMNS colunas.
+SPRITE_INTERVAL_SEC = 2
+SPRITE_MAX_TILES = 100
+SPRITE_COLUMNS = 10
+SPRITE_TILE_WIDTH = 160
+SPRITE_NAME = "sprite.jpg"
+SPRITE_VTT_NAME = "sprite.vtt"
+JPEG_QUALITY = 85
+
+
+def _resize_to_width(frame, width):
+    height = max(1, round(frame.shape[0] * width / frame.shape[1]))
+    return cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+
+
+class FrameSampler:
+    """Guarda, durante a decodificação do filtro, os frames usados pelas miniaturas.
+
+    É chamado com cada frame decodificado (observe) e guarda só o primeiro frame e as
+    amostras da linha do tempo já reduzidas, então não precisa de uma segunda leitura do
+    vídeo. É serializável: no modo por segmentos cada processo recebe uma cópia, observa
+    seu intervalo de frames e o resultado é juntado com merge().
+    """
+
+    def __init__(self):
+        self.fps = 30
+        self.interval_frames = 1
+        self.poster = None
+        self.tiles = {}
+
+    def configure(self, fps, frame_count):
+        """Define o espaçamento das amostras; chamado por render_variants antes de decodificar."""
+        self.fps = fps if fps > 0 else 30
+        duration = frame_count / self.fps
+        interval_sec = max(SPRITE_INTERVAL_SEC, duration / SPRITE_MAX_TILES)
+        self.interval_frames = max(1, round(interval_sec * self.fps))
+
+    def observe(self, index, frame):
+        if index == 0:
+            self.poster = frame.copy()
+        if index % self.interval_frames == 0 and len(self.tiles) < SPRITE_MAX_TILES:
+            self.tiles[index] = _resize_to_width(frame, SPRITE_TILE_WIDTH)
+
+    def merge(self, other):
+        if other.poster is not None:
+            self.poster = other.poster
+        for index, tile in other.tiles.items():
+            if len(self.tiles) < SPRITE_MAX_TILES:
+                self.tiles[index] = tile
+        return self
+
+    def write(self, output_dir, frame_count):
+        """Grava o frame inteiro, as miniaturas, a sprite sheet e o índice WebVTT.
+
+        `frame_count` é o total de frames realmente lidos, usado como fim do último quadro.
+        Retorna {"poster": nome, "thumbnails": {largura: nome}, "sprite_vtt": nome ou None}.
+        """
+        result = {"poster": None, "thumbnails": {}, "sprite_vtt": None}
+        if self.poster is None:
+            return result
+        os.makedirs(output_dir, exist_ok=True)
+        params = [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY]
+
+        cv2.imwrite(os.path.join(output_dir, POSTER_NAME), self.poster, params)
+        result['poster'] = POSTER_NAME
+        for width in THUMBNAIL_WIDTHS:
+            if width >= self.poster.shape[1]:
+                continue
+            name = THUMBNAIL_NAME.format(width=width)
+            cv2.imwrite(os.path.join(output_dir, name), _resize_to_width(self.poster, width), params)
+            result['thumbnails'][width] = name
+
+        if self.tiles:
+            self._write_sprite(output_dir, frame_count, params)
+            result['sprite_vtt'] = SPRITE_VTT_NAME
+        return result
+
+    def _write_sprite(self, output_dir, frame_count, params):
+        indices = sorted(self.tiles)
+        tile_height, tile_width = self.tiles[indices[0]].shape[:2]
+        columns = min(SPRITE_COLUMNS, len(indices))
+        rows = -(-len(indices) // columns)
+        sheet = np.zeros((rows * tile_height, columns * tile_width, 3), dtype=np.uint8)
+
+        cues = ["WEBVTT", ""]
+        for position, index in enumerate(indices):
+            x, y = (position % columns) * tile_width, (position // columns) * tile_height
+            sheet[y:y + tile_height, x:x + tile_width] = self.tiles[index]
+            start = index / self.fps
+            end_index = indices[position + 1] if position + 1 < len(indices) else max(frame_count, index + 1)
+            end = end_index / self.fps
+            cues += [f"{_vtt_time(start)} --> {_vtt_time(end)}",
+                     f"{SPRITE_NAME}#xywh={x},{y},{tile_width},{tile_height}", ""]
+
+        cv2.imwrite(os.path.join(output_dir, SPRITE_NAME), sheet, params)
+        with open(os.path.join(output_dir, SPRITE_VTT_NAME), 'w') as f:
+            f.write("\n".join(cues))
+
+
+def thumbnail_fields(thumbs_dir, files):
+    """Colunas de miniaturas da tabela videos a partir dos nomes devolvidos por FrameSampler.write.
+
+    `thumbs_dir` é relativo a media/, no formato de URL (separador '/').
+    """
+    def path(name):
+        return f"{thumbs_dir}/{name}" if name else None
+    return {
+        "path_thumbnail": path(files['poster']),
+        "thumbnails": json.dumps({str(width): path(name) for width, name in files['thumbnails'].items()}),
+        "path_sprite_vtt": path(files['sprite_vtt']),
+    }
+
+
+def _vtt_time(seconds):
+    millis = round(seconds * 1000)
+    hours, millis = divmod(millis, 3_600_000)
+    minutes, millis = divmod(millis, 60_000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}.{millis:03d}"
@@ -0,0 +1,183 @@
+# uploads.py
+import os
+import json
+import time
+import uuid
+import threading
+
+# Tamanho de bloco sugerido aos clientes e maior bloco aceito em um único PUT.
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+# Sessões sem atividade por mais tempo que isso são descartadas.
+SESSION_TTL_SEC = 24 * 60 * 60
+
+_COPY_BUFFER = 1024 * 1024
+
+
+class UploadError(Exception):
+    """Erro de protocolo no upload em blocos; `status` é o código HTTP correspondente."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _merge_range(ranges, start, end):
+    """Insere [start, end) em uma lista ordenada de intervalos, unindo os que se tocam."""
+    merged = []
+    for current_start, current_end in sorted(ranges + [[start, end]]):
+        if merged and current_start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], current_end)
+        else:
+            merged.append([current_start, current_end])
+    return merged
+
+
+def _missing_ranges(ranges, size):
+    missing = []
+    position = 0
+    for start, end in ranges:
+        if start > position:
+            missing.append([position, start])
+        position = max(position, end)
+    if position < size:
+        missing.append([position, size])
+    return missing
+
+
+class UploadSessionStore:
+    """Sessões de upload retomável gravadas em `directory`.
+
+    Cada sessão tem um arquivo de dados `<id>.part`, pré-alocado com o tamanho final, e um
+    `<id>.json` com os metadados e os intervalos de bytes já recebidos. Blocos podem chegar
+    em qualquer ordem e em paralelo; como tudo fica em disco, a sessão sobrevive a uma
+    reinicialização do servidor.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def _meta_path(self, upload_id):
+        return os.path.join(self.directory, f"{upload_id}.json")
+
+    def data_path(self, upload_id):
+        return os.path.join(self.directory, f"{upload_id}.part")
+
+    def _save(self, session):
+        temp_path = self._meta_path(session['id']) + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(session, f)
+        os.replace(temp_path, self._meta_path(session['id']))
+
+    def _load(self, upload_id):
+        try:
+            uuid.UUID(upload_id)
+        except ValueError:
+            raise UploadError("Sessão de upload não encontrada", 404)
+        try:
+            with open(self._meta_path(upload_id)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise UploadError("Sessão de upload não encontrada", 404)
+
+    def create(self, filename, size, mime_type, filter_specs, filter_params, hls=False, clip=None):
+        if not isinstance(size, int) or size <= 0:
+            raise UploadError("Tamanho do arquivo inválido")
+        self.cleanup_expired()
+        os.makedirs(self.directory, exist_ok=True)
+
+        session = {
+            "id": str(uuid.uuid4()), "filename": filename, "size": size, "mime_type": mime_type,
+            "filters": filter_specs, "params": filter_params, "hls": hls, "clip": clip, "ranges": [],
+            "created_at": time.time(), "updated_at": time.time(),
+        }
+        with open(self.data_path(session['id']), 'wb') as f:
+            f.truncate(size)
+        with self._lock:
+            self._save(session)
+        return session
+
+    def write_chunk(self, upload_id, offset, stream, length):
+        """Grava `length` bytes de `stream` a partir de `offset` e registra o intervalo."""
+        session = self._load(upload_id)
+        if length is None or length <= 0:
+            raise UploadError("Bloco vazio ou sem Content-Length")
+        if length > MAX_CHUNK_SIZE:
+            raise UploadError(f"Bloco maior que {MAX_CHUNK_SIZE} bytes", 413)
+        if offset < 0 or offset + length > session['size']:
+            raise UploadError("Bloco fora dos limites do arquivo", 416)
+
+        written = 0
+        with open(self.data_path(upload_id), 'r+b') as f:
+            f.seek(offset)
+            while written < length:
+                data = stream.read(min(_COPY_BUFFER, length - written))
+                if not data:
+                    break
+                f.write(data)
+                written += len(data)
+
+        # Um bloco interrompido no meio só registra o que realmente chegou.
+        with self._lock:
+            session = self._load(upload_id)
+            if written:
+                session['ranges'] = _merge_range(session['ranges'], offset, offset + written)
+            session['updated_at'] = time.time()
+            self._save(session)
+        if written < length:
+            raise UploadError("Conexão encerrada antes do fim do bloco")
+        return self.status(upload_id, session)
+
+    def status(self, upload_id, session=None):
+        session = session or self._load(upload_id)
+        missing = _missing_ranges(session['ranges'], session['size'])
+        received = session['size'] - sum(end - start for start, end in missing)
+        return {
+            "upload_id": session['id'], "filename": session['filename'], "size": session['size'],
+            "received_bytes": received, "ranges": session['ranges'], "missing": missing,
+            # Próximo byte a enviar para quem retoma sequencialmente.
+            "next_offset": missing[0][0] if missing else session['size'],
+            "complete": not missing,
+        }
+
+    def finish(self, upload_id):
+        """Valida que todos os bytes chegaram e devolve (sessão, caminho do arquivo)."""
+        with self._lock:
+            session = self._load(upload_id)
+            status = self.status(upload_id, session)
+            if not status['complete']:
+                raise UploadError("Upload incompleto", 409)
+            os.remove(self._meta_path(upload_id))
+        return session, self.data_path(upload_id)
+
+    def discard(self, upload_id):
+        self._load(upload_id)
+        for path in (self._meta_path(upload_id), self.data_path(upload_id)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def cleanup_expired(self, ttl=SESSION_TTL_SEC):
+        """Descarta sessões inativas há mais de `ttl` e arquivos `.part` antigos sem sessão
+        (de uploads finalizados cujo processamento falhou antes de mover o arquivo)."""
+        if not os.path.isdir(self.directory):
+            return
+        now = time.time()
+        for entry in os.listdir(self.directory):
+            if entry.endswith('.part') and not os.path.exists(self._meta_path(entry[:-len('.part')])):
+                path = os.path.join(self.directory, entry)
+                try:
+                    if now - os.path.getmtime(path) > ttl:
+                        os.remove(path)
+                except FileNotFoundError:
+                    pass
+                continue
+            if not entry.endswith('.json'):
+                continue
+            upload_id = entry[:-len('.json')]
+            try:
+                session = self._load(upload_id)
+            except (UploadError, ValueError):
+                continue
+            if now - session['updated_at'] > ttl:
+                self.discard(upload_id)
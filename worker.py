@@ -0,0 +1,395 @@
+# worker.py
+# Worker de processamento: assume jobs da tabela `jobs` (veja jobs.py), renderiza as
+# variantes com process_video e registra o vídeo no banco. Rode quantos quiser, na mesma
+# máquina ou em várias, apontando para o mesmo banco e a mesma pasta media/:
+#
+#     python worker.py --db videos.db --media media --processes 2
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import socket
+import sqlite3
+import argparse
+import threading
+import multiprocessing
+from glob import glob, escape as glob_escape
+from database import connect, init_db, insert_video, DB_FILE
+from jobs import (claim_job, heartbeat_job, complete_job, write_if_leased, fail_job, release_job, cancel_jobs,
+                  recover_expired_jobs, LeaseLostError, JOB_FAILED, JOB_CANCELLED, HEARTBEAT_SEC, LEASE_SEC)
+from processing import process_video
+from packaging import HLS_MASTER_NAME
+from thumbnails import thumbnail_fields
+from metrics import Trace
+from storage import record_artifacts, video_artifacts, evict_to_quota, cleanup_orphans, DEFAULT_QUOTA_BYTES
+
+MEDIA_ROOT = "media"
+# Intervalo entre consultas à fila vazia e entre buscas por leases vencidos de outros workers.
+POLL_SEC = 1
+RECOVERY_INTERVAL_SEC = 10
+# Cada tentativa grava suas saídas em <pasta do vídeo>/.work-<tentativa> e só as move para
+# o lugar definitivo no fim: uma tentativa interrompida nunca deixa arquivos pela metade
+# onde o vídeo é servido.
+WORK_DIR_PREFIX = ".work-"
+
+
+class Heartbeat(threading.Thread):
+    """Renova o lease do job a cada HEARTBEAT_SEC e publica o último progresso recebido.
+
+    Usa uma conexão própria. `report` é o progress_callback do process_video: levanta
+    LeaseLostError assim que o lease se perde, o que interrompe a renderização.
+    """
+
+    def __init__(self, db_file, job_id, worker_id, lease_sec):
+        super().__init__(daemon=True)
+        self.db_file = db_file
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.lease_sec = lease_sec
+        self.progress = (0, 0)
+        self.lost = False
+        self._done = threading.Event()
+
+    def report(self, frames_done, frames_total):
+        if self.lost:
+            raise LeaseLostError(self.job_id)
+        self.progress = (frames_done, frames_total)
+
+    def run(self):
+        conn = connect(self.db_file)
+        try:
+            while not self._done.wait(HEARTBEAT_SEC):
+                try:
+                    if not heartbeat_job(conn, self.job_id, self.worker_id, *self.progress, lease_sec=self.lease_sec):
+                        self.lost = True
+                        return
+                except sqlite3.OperationalError as e:
+                    # Banco ocupado: tenta de novo no próximo intervalo, bem antes de o lease vencer.
+                    print(f"Heartbeat do job {self.job_id} falhou: {e}")
+        finally:
+            conn.close()
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+class Worker:
+    """Laço de um worker: recupera leases vencidos, assume um job por vez e o executa."""
+
+    def __init__(self, db_file=DB_FILE, media_root=MEDIA_ROOT, worker_id=None, lease_sec=LEASE_SEC, poll_sec=POLL_SEC,
+                 quota_bytes=DEFAULT_QUOTA_BYTES):
+        self.db_file = db_file
+        self.media_root = media_root
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.lease_sec = lease_sec
+        self.poll_sec = poll_sec
+        self.quota_bytes = quota_bytes
+        self.conn = connect(db_file)
+
+    def run(self, once=False):
+        """Processa jobs até ser interrompido ou, com `once`, até não haver job disponível."""
+        recover_jobs(self.conn, self.media_root)
+        last_recovery = time.monotonic()
+        while True:
+            if time.monotonic() - last_recovery >= RECOVERY_INTERVAL_SEC:
+                recover_jobs(self.conn, self.media_root, orphans=False)
+                last_recovery = time.monotonic()
+            job = claim_job(self.conn, self.worker_id, self.lease_sec)
+            if job is None:
+                if once:
+                    return
+                time.sleep(self.poll_sec)
+                continue
+            self.run_job(job)
+
+    def run_job(self, job):
+        payload = json.loads(job['payload'])
+        video_dir = os.path.join(self.media_root, payload['video_dir'])
+        work_dir = os.path.join(video_dir, f"{WORK_DIR_PREFIX}{job['attempts']}")
+        # Restos de tentativas anteriores cujo worker morreu antes da recuperação.
+        _remove_work_dirs(video_dir, job['attempts'])
+        trace = Trace(payload['trace_id']) if payload.get('trace_id') else None
+        if trace is not None:
+            trace.add('queue_wait', max(job['started_at'] - job['created_at'], 0))
+
+        # Um upload com prévia registra o vídeo assim que ela fica pronta; se uma tentativa
+        # anterior já o registrou, esta só renderiza o resto.
+        registered = _is_upload(payload) and self.conn.execute(
+            "SELECT 1 FROM videos WHERE id = ?", (payload['video_id'],)).fetchone() is not None
+
+        def on_preview(media):
+            nonlocal registered
+            self.publish_preview(job, payload, staged['preview']['path'], media)
+            registered = True
+
+        heartbeat = Heartbeat(self.db_file, job['id'], self.worker_id, self.lease_sec)
+        heartbeat.start()
+        try:
+            staged = _staged_payload(payload, self.media_root, work_dir)
+            if registered or not _is_upload(payload):
+                staged.pop('preview', None)
+            result = process_video(staged, progress_callback=heartbeat.report, preview_callback=on_preview)
+            video_data, summary = _finish_video(payload, result, staged, registered)
+            start = time.perf_counter()
+
+            def publish(conn):
+                # Só com o lease confirmado pelo complete_job: um worker que perdeu o job
+                # nunca sobrescreve os arquivos de quem o assumiu.
+                _publish_outputs(work_dir, video_dir)
+                _save_video(conn, payload, video_data, self.media_root, registered)
+            complete_job(self.conn, job['id'], self.worker_id, summary, write=publish)
+            if registered and payload.get('preview'):
+                # A versão completa substitui a prévia, que não é mais listada.
+                shutil.rmtree(os.path.join(self.media_root, os.path.dirname(payload['preview']['path'])),
+                              ignore_errors=True)
+            state, error = 'done', None
+            if trace is not None:
+                for stage, seconds in summary['stage_seconds'].items():
+                    trace.add(stage, seconds)
+                trace.add('db_insert_video', time.perf_counter() - start)
+        except LeaseLostError:
+            if not self.discard_if_cancelled(job, payload, video_dir):
+                print(f"Job {job['id']}: lease perdido; o job fica com o worker que o assumiu.")
+            return
+        except (KeyboardInterrupt, SystemExit):
+            shutil.rmtree(work_dir, ignore_errors=True)
+            release_job(self.conn, job['id'], self.worker_id)
+            raise
+        except Exception as e:
+            error = str(e) or e.__class__.__name__
+            if _video_gone(self.conn, payload, self.media_root, registered):
+                # Sem o original ou sem o registro, nenhuma nova tentativa daria certo.
+                if registered:
+                    _forget_video(self.conn, payload['video_id'])
+                with self.conn:
+                    cancel_jobs(self.conn, payload['video_id'], f"Vídeo ou original apagado: {error}")
+            if self.discard_if_cancelled(job, payload, video_dir):
+                return
+            print(f"Erro no job {job['id']} (tentativa {job['attempts']}/{job['max_attempts']}): {error}")
+            state = fail_job(self.conn, job['id'], self.worker_id, error)
+            if state is None:
+                return
+            shutil.rmtree(video_dir if state == JOB_FAILED and _is_upload(payload) else work_dir, ignore_errors=True)
+            if state == JOB_FAILED and registered:
+                _forget_video(self.conn, payload['video_id'])
+        finally:
+            heartbeat.stop()
+
+        if state == 'done':
+            # As novas saídas podem ter passado da cota: apaga os artefatos menos acessados.
+            removed, freed = evict_to_quota(self.conn, self.media_root, self.quota_bytes)
+            if removed:
+                print(f"{removed} artefatos removidos pela cota ({freed / 1024 ** 2:.1f} MiB).")
+
+        if trace is not None:
+            trace.emit('job', job_id=job['id'], video_id=payload['video_id'], worker_id=self.worker_id,
+                       attempt=job['attempts'], state=state, error=error)
+
+    def discard_if_cancelled(self, job, payload, video_dir):
+        """Se o job foi cancelado (veja jobs.cancel_jobs), apaga o que ele gravou e retorna True.
+
+        Sem o vídeo no banco a pasta inteira vai embora; senão, só a pasta de trabalho.
+        """
+        row = self.conn.execute("SELECT state, error FROM jobs WHERE id = ?", (job['id'],)).fetchone()
+        if row is None or row['state'] != JOB_CANCELLED:
+            return False
+        exists = self.conn.execute("SELECT 1 FROM videos WHERE id = ?", (payload['video_id'],)).fetchone()
+        work_dir = os.path.join(video_dir, f"{WORK_DIR_PREFIX}{job['attempts']}")
+        shutil.rmtree(work_dir if exists else video_dir, ignore_errors=True)
+        print(f"Job {job['id']} cancelado: {row['error']}.")
+        return True
+
+    def publish_preview(self, job, payload, staged_path, media):
+        """Move a prévia para preview/ e registra o vídeo com ela e os metadados `media`,
+        se o job ainda for deste worker; as variantes ficam com o caminho final (o /media
+        responde 202 até que existam)."""
+        path = payload['preview']['path']
+        target = os.path.join(self.media_root, path)
+        video_data = dict(payload['video'], **media, path_preview=path)
+
+        def publish(conn):
+            # Como no fim do job: o arquivo só sai da pasta de trabalho com o lease confirmado.
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(staged_path, target)
+            insert_video(conn, video_data, payload['video_variants'])
+        write_if_leased(self.conn, job['id'], self.worker_id, publish)
+
+
+# --- Arquivos de cada tentativa ---
+
+def _staged_payload(payload, media_root, work_dir):
+    """Payload do process_video com caminhos absolutos e as saídas dentro de `work_dir`."""
+    rendered = {variant['processed_path'] for variant in payload['variants']}
+
+    def source(path):
+        return os.path.abspath(os.path.join(media_root, path))
+
+    def output(path):
+        staged = os.path.abspath(os.path.join(work_dir, os.path.relpath(path, payload['video_dir'])))
+        os.makedirs(os.path.dirname(staged), exist_ok=True)
+        return staged
+
+    staged = dict(payload, original_path=source(payload['original_path']), thumbs_dir=output(payload['thumbs_dir']),
+                  variants=[{"filter": variant['filter'], "processed_path": output(variant['processed_path'])}
+                            for variant in payload['variants']])
+    if payload.get('hls'):
+        input_path = payload['hls']['input_path']
+        staged['hls'] = {"input_path": output(input_path) if input_path in rendered else source(input_path),
+                         "output_dir": output(payload['hls']['output_dir'])}
+    if payload.get('preview'):
+        staged['preview'] = dict(payload['preview'], path=output(payload['preview']['path']))
+    return staged
+
+def _publish_outputs(work_dir, video_dir):
+    """Move os arquivos da pasta de trabalho para os mesmos caminhos dentro da pasta do vídeo."""
+    for root, _, files in os.walk(work_dir):
+        target = os.path.join(video_dir, os.path.relpath(root, work_dir))
+        os.makedirs(target, exist_ok=True)
+        for name in files:
+            os.replace(os.path.join(root, name), os.path.join(target, name))
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+def _remove_work_dirs(video_dir, up_to_attempt):
+    for path in glob(os.path.join(glob_escape(video_dir), WORK_DIR_PREFIX + '*')):
+        attempt = os.path.basename(path)[len(WORK_DIR_PREFIX):]
+        if attempt.isdigit() and int(attempt) < up_to_attempt:
+            shutil.rmtree(path, ignore_errors=True)
+
+def _is_upload(payload):
+    """Jobs de upload criam o vídeo; jobs de renderização (`mode` = 'render') refazem
+    artefatos apagados de um vídeo já cadastrado e nunca apagam sua pasta."""
+    return payload.get('mode') != 'render'
+
+def _finish_video(payload, result, staged, registered=False):
+    """Colunas do vídeo a gravar e o resumo gravado em jobs.result (lido pelas métricas do servidor).
+
+    Em um upload são todas as colunas (só as que mudam, se o vídeo já foi registrado com a
+    prévia); em uma renderização, só as de miniaturas e HLS. Os bytes gravados são medidos
+    nas saídas de `staged` (veja _staged_payload), ainda na pasta de trabalho.
+    """
+    video_data = {}
+    if _is_upload(payload):
+        video_data = {"path_preview": None} if registered else dict(payload['video'])
+        for key in ("size_bytes", "duration_sec", "fps", "width", "height"):
+            video_data[key] = result[key]
+    if result['hls_packaged']:
+        video_data['path_hls'] = f"{payload['hls']['output_dir']}/{HLS_MASTER_NAME}"
+    video_data.update(thumbnail_fields(payload['thumbs_dir'], result['thumbnail_files']))
+
+    bytes_out = 0
+    for variant in staged['variants']:
+        path = variant['processed_path']
+        if os.path.exists(path):
+            bytes_out += os.path.getsize(path)
+    summary = {"frames": result['frames'], "stage_seconds": result['stage_seconds'],
+               "filters": [variant['filter'] for variant in payload['variants']], "bytes_out": bytes_out}
+    return video_data, summary
+
+
+def _save_video(conn, payload, video_data, media_root, registered=False):
+    """Grava o resultado do job e registra os artefatos do vídeo, dentro da transação do fim do job."""
+    if _is_upload(payload) and not registered:
+        insert_video(conn, video_data, payload['video_variants'])
+        video, variants = video_data, payload['video_variants']
+    else:
+        columns = sorted(video_data)
+        conn.execute(f"UPDATE videos SET {', '.join(f'{column} = ?' for column in columns)} WHERE id = ?",
+                     [video_data[column] for column in columns] + [payload['video_id']])
+        video = conn.execute("SELECT * FROM videos WHERE id = ?", (payload['video_id'],)).fetchone()
+        if video is None:
+            # Apagado durante a renderização (ou depois de publicada a prévia).
+            return
+        variants = conn.execute("SELECT path_processed FROM video_variants WHERE video_id = ?",
+                                (payload['video_id'],)).fetchall()
+    record_artifacts(conn, payload['video_id'], video_artifacts(media_root, video, variants))
+
+def _video_gone(conn, payload, media_root, registered=False):
+    """O original sumiu do disco ou o vídeo, já registrado, não está mais no banco."""
+    if not os.path.exists(os.path.join(media_root, payload['original_path'])):
+        return True
+    if registered or not _is_upload(payload):
+        return conn.execute("SELECT 1 FROM videos WHERE id = ?", (payload['video_id'],)).fetchone() is None
+    return False
+
+def _forget_video(conn, video_id):
+    """Apaga o registro feito com a prévia de um upload que falhou de vez."""
+    with conn:
+        conn.execute("DELETE FROM video_variants WHERE video_id = ?", (video_id,))
+        conn.execute("DELETE FROM videos WHERE id = ?", (video_id,))
+
+
+# --- Recuperação ---
+
+def recover_jobs(conn, media_root, orphans=True):
+    """Recupera os jobs com lease vencido e apaga as saídas que ficaram pela metade.
+
+    Jobs devolvidos à fila perdem só a pasta de trabalho da tentativa interrompida; jobs
+    sem tentativas restantes perdem a pasta do vídeo inteira. Com `orphans`, também apaga
+    as pastas de vídeo abandonadas (veja cleanup_orphans).
+    """
+    for job in recover_expired_jobs(conn):
+        payload = json.loads(job['payload'])
+        video_dir = os.path.join(media_root, payload['video_dir'])
+        if job['state'] == JOB_FAILED and _is_upload(payload):
+            shutil.rmtree(video_dir, ignore_errors=True)
+            _forget_video(conn, payload['video_id'])
+        else:
+            _remove_work_dirs(video_dir, job['attempts'] + 1)
+        print(f"Job {job['id']} recuperado de um worker parado: {job['state']}.")
+    if orphans:
+        cleanup_orphans(conn, media_root)
+
+# --- Execução ---
+
+def _exit_on_sigterm(signum, frame):
+    sys.exit(0)
+
+def run_worker(db_file=DB_FILE, media_root=MEDIA_ROOT, worker_id=None, once=False, poll_sec=POLL_SEC,
+               quota_bytes=DEFAULT_QUOTA_BYTES):
+    """Ponto de entrada de um processo worker; SIGTERM e Ctrl+C devolvem o job atual à fila."""
+    signal.signal(signal.SIGTERM, _exit_on_sigterm)
+    try:
+        Worker(db_file, media_root, worker_id, poll_sec=poll_sec, quota_bytes=quota_bytes).run(once=once)
+    except KeyboardInterrupt:
+        pass
+
+def start_workers(count, db_file=DB_FILE, media_root=MEDIA_ROOT, once=False, poll_sec=POLL_SEC,
+                  quota_bytes=DEFAULT_QUOTA_BYTES):
+    """Inicia `count` workers em processos separados e devolve os processos."""
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=run_worker, args=(db_file, media_root, None, once, poll_sec, quota_bytes),
+                                 name=f"worker-{i}")
+                 for i in range(count)]
+    for process in processes:
+        process.start()
+    return processes
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker de processamento de vídeos.")
+    parser.add_argument('--db', default=DB_FILE, help="banco SQLite compartilhado com o servidor")
+    parser.add_argument('--media', default=MEDIA_ROOT, help="pasta media/ compartilhada com o servidor")
+    parser.add_argument('--processes', type=int, default=1, help="workers iniciados por este comando")
+    parser.add_argument('--once', action='store_true', help="sai quando não houver mais jobs disponíveis")
+    parser.add_argument('--quota-gb', type=float, default=DEFAULT_QUOTA_BYTES / 1024 ** 3,
+                        help="cota dos arquivos derivados em media/ (veja storage.py)")
+    args = parser.parse_args()
+
+    init_db(args.db)
+    quota_bytes = int(args.quota_gb * 1024 ** 3)
+    if args.processes == 1:
+        run_worker(args.db, args.media, once=args.once, quota_bytes=quota_bytes)
+        return
+    processes = start_workers(args.processes, args.db, args.media, once=args.once, quota_bytes=quota_bytes)
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # O Ctrl+C também chega aos workers, que devolvem seus jobs à fila antes de sair.
+        for process in processes:
+            process.join()
+
+if __name__ == '__main__':
+    main()